@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Resident agent daemon.
+Keeps pricing, tokenizers, pooled HTTP connections and agent balances in
+memory and serves the scripts' operations as a local JSON API, so each
+operation costs one IPC round trip instead of a fresh Python process.
+
+Every operation is POST /<op> with a JSON body; GET /health for liveness
+and GET /metrics for OpenMetrics call instrumentation (see metrics.py).
+Bodies must be sent as application/json, so a web page can't submit an
+operation as a plain form post. Over TCP every operation also needs the
+per-install token from agents/.agentd-token (created with mode 0600 on
+first start) as "Authorization: Bearer <token>"; a Unix socket is created
+with mode 0600 and needs no token.
+
+    balance  {agent_id}                           -> balance
+    init     {agent_id}                           -> balance (creates the agent)
+    fund     {agent_id, amount}                   -> balance
+    call     {agent_id, prompt, candidates, max_tokens, cache, cache_ttl, messages,
+              deadline, hedge_model, hedge_percentile}
+                                                  -> call result (see openrouter_call.run_call)
+    charge   {agent_id, amount, idempotency_key}  -> {charge, created} (see charges.py)
+    credits  {}                                   -> OpenRouter credits
+
+Point the scripts at it with USDC_OPENROUTER_DAEMON (see daemon_client.py).
+"""
+
+import hmac
+import json
+import os
+import socketserver
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import buy_credits
+import charges
+import check_balance
+import daemon_client
+import fund_testnet_wallet
+import get_credits
+import http_client
+import ledger
+import metrics
+import openrouter_call
+import ratelimit
+import response_cache
+
+class AgentState:
+    """In-memory view of agent balances, refreshed only when the files change."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.balances = {}
+        self.local = threading.local()
+
+    def _signature(self, agent_id: str):
+        agent_dir = ledger.get_agent_dir(agent_id)
+        try:
+            snapshot = os.stat(agent_dir / "balance.json")
+        except FileNotFoundError:
+            return None
+        try:
+            journal_size = os.stat(agent_dir / "usage.jsonl").st_size
+        except FileNotFoundError:
+            journal_size = 0
+        return (snapshot.st_mtime_ns, snapshot.st_size, journal_size)
+
+    def balance(self, agent_id: str) -> dict:
+        signature = self._signature(agent_id)
+        if signature is None:
+            raise ledger.AgentNotFound(agent_id)
+        with self.lock:
+            cached = self.balances.get(agent_id)
+            if cached and cached[0] == signature:
+                return cached[1]
+        balance = ledger.load_balance(agent_id)
+        if balance is None:
+            raise ledger.AgentNotFound(agent_id)
+        with self.lock:
+            self.balances[agent_id] = (signature, balance)
+        return balance
+
+    def cache(self, agent_id: str, ttl: float) -> response_cache.ResponseCache:
+        # SQLite connections can't be shared across handler threads
+        caches = self.local.__dict__.setdefault("caches", {})
+        if agent_id not in caches:
+            caches[agent_id] = response_cache.ResponseCache(agent_id)
+        caches[agent_id].ttl = ttl
+        return caches[agent_id]
+
+STATE = AgentState()
+
+def op_balance(params: dict) -> dict:
+    return STATE.balance(params["agent_id"])
+
+def op_init(params: dict) -> dict:
+    return check_balance.init_balance(params["agent_id"])
+
+def op_fund(params: dict) -> dict:
+    return fund_testnet_wallet.fund_agent(params["agent_id"], float(params["amount"]))
+
+def op_call(params: dict) -> dict:
+    agent_id = params["agent_id"]
+    STATE.balance(agent_id)
+    cache = STATE.cache(agent_id, params.get("cache_ttl", response_cache.DEFAULT_TTL)) if params.get("cache") else None
+    return openrouter_call.run_call(
+        agent_id,
+        params["prompt"],
+        params.get("candidates") or [params.get("model", "openai/gpt-4o-mini")],
+        params.get("max_tokens", openrouter_call.DEFAULT_MAX_TOKENS),
+        cache,
+        messages=params.get("messages"),
+        deadline=params.get("deadline"),
+        hedge_model=params.get("hedge_model"),
+        hedge_percentile=params.get("hedge_percentile", openrouter_call.HEDGE_PERCENTILE),
+    )
+
+def op_charge(params: dict) -> dict:
+    agent_id = params["agent_id"]
+    balance = STATE.balance(agent_id)
+    record, created = buy_credits.buy_credits(agent_id, float(params["amount"]), balance["wallet_address"],
+                                              params.get("idempotency_key"))
+    return {"charge": record, "created": created}
+
+def op_credits(params: dict) -> dict:
+    return get_credits.get_openrouter_credits()
+
+OPERATIONS = {
+    "balance": op_balance,
+    "init": op_init,
+    "fund": op_fund,
+    "call": op_call,
+    "charge": op_charge,
+    "credits": op_credits,
+}
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"status": "ok", "operations": sorted(OPERATIONS)})
+        elif self.path == "/metrics":
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def _reject(self, status: int, error: str):
+        # The body was never read, so it can't be left on a kept-alive connection
+        self.close_connection = True
+        self._send(status, {"error": error})
+
+    def do_POST(self):
+        op = OPERATIONS.get(self.path.strip("/"))
+        if op is None:
+            self._reject(404, f"Unknown operation {self.path}")
+            return
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            self._reject(415, "Content-Type must be application/json")
+            return
+        token = getattr(self.server, "token", None)
+        if token and not hmac.compare_digest(self.headers.get("Authorization") or "", f"Bearer {token}"):
+            self._reject(401, "Missing or wrong agentd token")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+            self._send(200, op(params))
+        except ledger.AgentNotFound as e:
+            self._send(404, {"error": f"Agent '{e}' not found", "type": "AgentNotFound"})
+        except ledger.InsufficientCredits as e:
+            self._send(402, {"error": str(e), "type": "InsufficientCredits",
+                             "required": e.required, "available": e.available})
+        except http_client.DeadlineExceeded as e:
+            self._send(504, {"error": str(e), "type": "DeadlineExceeded"})
+        except ratelimit.RateLimited as e:
+            self._send(429, {"error": str(e), "type": "RateLimited"})
+        except charges.ChargeConflict as e:
+            self._send(409, {"error": str(e), "type": "ChargeConflict", "charge": e.record})
+        except (KeyError, ValueError) as e:
+            self._send(400, {"error": f"Bad request: {type(e).__name__}: {e}"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def address_string(self):
+        # Unix socket peers have no (host, port)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if os.getenv("AGENTD_VERBOSE"):
+            super().log_message(format, *args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Only this user may connect: the socket itself is the credential
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+def ensure_token() -> str:
+    """Read the per-install HTTP token, creating it (mode 0600) on first use."""
+    token = daemon_client.load_token()
+    if token:
+        return token
+    daemon_client.TOKEN_FILE.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(daemon_client.TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return daemon_client.TOKEN_FILE.read_text().strip()
+    token = os.urandom(32).hex()
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+def main():
+    # Parse args
+    args = {"socket": None, "host": "127.0.0.1", "port": 8765}
+    for i in range(1, len(sys.argv)):
+        if sys.argv[i] == "--socket" and i + 1 < len(sys.argv):
+            args["socket"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--host" and i + 1 < len(sys.argv):
+            args["host"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--port" and i + 1 < len(sys.argv):
+            args["port"] = int(sys.argv[i + 1])
+        elif sys.argv[i] in ("-h", "--help"):
+            print("Usage: python3 agentd.py [--socket <path> | --host <host> --port <port>]")
+            sys.exit(0)
+
+    metrics.enable()
+    if args["socket"]:
+        if os.path.exists(args["socket"]):
+            os.unlink(args["socket"])
+        server = UnixHTTPServer(args["socket"], Handler)
+        address = f"unix:{args['socket']}"
+    else:
+        server = ThreadingHTTPServer((args["host"], args["port"]), Handler)
+        server.token = ensure_token()
+        address = f"http://{args['host']}:{args['port']}"
+
+    print(f"\n🛰️  agentd listening on {address}")
+    print(f"   export USDC_OPENROUTER_DAEMON={address}")
+    if not args["socket"]:
+        print(f"   Token: {daemon_client.TOKEN_FILE} (clients here read it automatically)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args["socket"] and os.path.exists(args["socket"]):
+            os.unlink(args["socket"])
+
+if __name__ == "__main__":
+    main()
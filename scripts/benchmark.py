@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the call -> cost -> deduct hot path and the ledger.
+
+Runs in a scratch directory, so real agents are never touched, and writes
+machine-readable JSON for comparing versions:
+
+    python3 scripts/benchmark.py --output bench.json
+    python3 scripts/benchmark.py --mock --calls 500 --concurrency 16 --compare bench.json
+
+Sections:
+    micro        calculate_cost, cost_in_credits, token counting/estimation,
+                 load_balance, save_balance, debit
+    ledger       load_balance and compact cost as the unfolded journal tail grows
+    concurrency  N processes debiting one agent (checks no debit is lost)
+    end_to_end   run_call() calls/sec and p50/p95/p99 latency, in demo mode
+                 or against mock_server.py (--mock) or another endpoint (--base-url)
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+PROMPT = "Summarize the trade-offs of paying for LLM inference with testnet USDC in two sentences."
+MODEL = "openai/gpt-4o-mini"
+
+def percentiles(samples: list) -> dict:
+    """Nearest-rank p50/p95/p99 plus mean and max, in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {"p50_ms": round(rank(50), 3), "p95_ms": round(rank(95), 3), "p99_ms": round(rank(99), 3),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3), "max_ms": round(ordered[-1] * 1000, 3)}
+
+def bench(fn, min_time: float) -> dict:
+    """Call fn repeatedly for at least min_time seconds; report throughput."""
+    fn()  # warm up caches and lazy loads
+    iterations = 0
+    batch = 1
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            fn()
+        iterations += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        batch = min(batch * 2, 10000)
+    return {"iterations": iterations, "ops_per_sec": round(iterations / elapsed, 1),
+            "us_per_op": round(elapsed / iterations * 1e6, 3)}
+
+def _new_agent(agent_id: str, credits: int = 10 ** 15) -> str:
+    import ledger
+    ledger.create_balance(agent_id, {
+        "agent_id": agent_id,
+        "wallet_address": "0x" + "0" * 40,
+        "usdc_balance": 0.0,
+        "credits": credits,
+        "network": "base-sepolia",
+        "demo_mode": True,
+    })
+    return agent_id
+
+def micro_benchmarks(min_time: float) -> dict:
+    import ledger
+    import openrouter_call
+    import tokens
+
+    agent_id = _new_agent("bench-micro")
+    usage = {"prompt_tokens": 1200, "completion_tokens": 350}
+    balance = ledger.load_balance(agent_id)
+    return {
+        "calculate_cost": bench(lambda: openrouter_call.calculate_cost(MODEL, 1200, 350), min_time),
+        "cost_in_credits": bench(lambda: openrouter_call.cost_in_credits(MODEL, usage), min_time),
+        "count_tokens": bench(lambda: tokens.count_tokens(PROMPT, MODEL), min_time),
+        "estimate_max_cost": bench(lambda: openrouter_call.estimate_max_cost(MODEL, PROMPT, 1024), min_time),
+        "load_balance": bench(lambda: ledger.load_balance(agent_id), min_time),
+        "save_balance": bench(lambda: ledger.save_balance(agent_id, balance), min_time),
+        "debit": bench(lambda: ledger.debit(agent_id, 1), min_time),
+    }
+
+def ledger_growth(sizes: list, min_time: float) -> dict:
+    """load_balance and compact cost with N unfolded journal records (auto-compaction disabled)."""
+    import ledger
+
+    results = {}
+    saved = ledger.COMPACT_EVERY
+    ledger.COMPACT_EVERY = 10 ** 12
+    try:
+        for size in sizes:
+            agent_id = _new_agent(f"bench-growth-{size}")
+            record = {"ts": 0.0, "model": MODEL, "prompt_tokens": 10, "completion_tokens": 10, "cost_credits": 1}
+            for start in range(0, size, 1000):
+                ledger.append_records(agent_id, [record] * min(1000, size - start))
+            results[f"load_balance_tail_{size}"] = bench(lambda: ledger.load_balance(agent_id), min_time)
+            results[f"compact_tail_{size}"] = bench(lambda: ledger.compact(agent_id), min_time)
+    finally:
+        ledger.COMPACT_EVERY = saved
+    return results
+
+def _debit_worker(agent_id: str, count: int):
+    import ledger
+    for _ in range(count):
+        ledger.debit(agent_id, 1)
+
+def concurrent_debits(processes: int, per_process: int) -> dict:
+    import ledger
+
+    start_credits = 10 ** 12
+    agent_id = _new_agent("bench-concurrency", start_credits)
+    workers = [multiprocessing.Process(target=_debit_worker, args=(agent_id, per_process))
+               for _ in range(processes)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    total = processes * per_process
+    final = ledger.load_balance(agent_id)["credits"]
+    return {"processes": processes, "debits": total, "seconds": round(elapsed, 3),
+            "debits_per_sec": round(total / elapsed, 1), "lost_debits": final - (start_credits - total)}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_mock(latency: str) -> tuple:
+    """Start mock_server.py on a free port; returns (process, base_url)."""
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, str(SCRIPTS_DIR / "mock_server.py"), "--port", str(port),
+                                "--latency", latency, "--seed", "1"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}/api/v1"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("mock_server.py did not start")
+
+def end_to_end(calls: int, concurrency: int, http: bool) -> dict:
+    import openrouter_call
+
+    agent_id = _new_agent("bench-e2e")
+    latencies = []
+    errors = 0
+
+    def one(i):
+        start = time.perf_counter()
+        openrouter_call.run_call(agent_id, f"{PROMPT} #{i}", [MODEL], 256)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(one, i) for i in range(calls)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - start
+    return {"mode": "http" if http else "demo", "calls": calls, "concurrency": concurrency,
+            "errors": errors, "seconds": round(elapsed, 3),
+            "calls_per_sec": round(len(latencies) / elapsed, 1), **percentiles(latencies)}
+
+def _flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def compare(current: dict, baseline: dict):
+    """Print throughput/latency metrics that moved by more than 10% against a baseline run."""
+    now, before = _flatten(current["results"]), _flatten(baseline["results"])
+    print(f"\n📈 Compared with {baseline.get('version') or 'baseline'}:", file=sys.stderr)
+    changed = 0
+    for key in sorted(now):
+        if key in before and before[key] and key.endswith(("per_sec", "us_per_op", "_ms")):
+            change = (now[key] - before[key]) / before[key] * 100
+            if abs(change) >= 10:
+                worse = change < 0 if key.endswith("per_sec") else change > 0
+                print(f"   {'🔻' if worse else '🔺'} {key}: {before[key]:,} -> {now[key]:,} ({change:+.0f}%)",
+                      file=sys.stderr)
+                changed += 1
+    if not changed:
+        print("   No metric moved by 10% or more", file=sys.stderr)
+
+def _version() -> str:
+    try:
+        return subprocess.run(["git", "-C", str(SCRIPTS_DIR), "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    # Parse args
+    args = {"output": "-", "min_time": 0.5, "calls": 200, "concurrency": 8, "processes": 4, "debits": 500,
+            "mock": False, "base_url": None, "latency": "0", "compare": None, "only": None}
+    for i in range(1, len(sys.argv)):
+        if sys.argv[i] == "--output" and i + 1 < len(sys.argv):
+            args["output"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--min-time" and i + 1 < len(sys.argv):
+            args["min_time"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--calls" and i + 1 < len(sys.argv):
+            args["calls"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--concurrency" and i + 1 < len(sys.argv):
+            args["concurrency"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--processes" and i + 1 < len(sys.argv):
+            args["processes"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--debits" and i + 1 < len(sys.argv):
+            args["debits"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--mock":
+            args["mock"] = True
+        elif sys.argv[i] == "--base-url" and i + 1 < len(sys.argv):
+            args["base_url"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--latency" and i + 1 < len(sys.argv):
+            args["latency"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--compare" and i + 1 < len(sys.argv):
+            args["compare"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--only" and i + 1 < len(sys.argv):
+            args["only"] = set(sys.argv[i + 1].split(","))
+        elif sys.argv[i] in ("-h", "--help"):
+            print("Usage: python3 benchmark.py [--output <file>] [--compare <baseline.json>]")
+            print("       [--only micro,ledger,concurrency,end_to_end] [--min-time <seconds>]")
+            print("       [--calls <n>] [--concurrency <n>] [--mock [--latency <dist>] | --base-url <url>]")
+            print("       [--processes <n>] [--debits <per process>]")
+            sys.exit(0)
+
+    baseline = json.loads(Path(args["compare"]).read_text()) if args["compare"] else None
+    output = None if args["output"] == "-" else Path(args["output"]).resolve()
+    selected = args["only"] or {"micro", "ledger", "concurrency", "end_to_end"}
+
+    # Scratch directory: agents/ and .cache/ are relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="usdc-openrouter-bench-"))
+    os.environ["USDC_OPENROUTER_CACHE_DIR"] = ".cache"
+
+    mock = None
+    base_url = args["base_url"]
+    if args["mock"]:
+        mock, base_url = start_mock(args["latency"])
+    if base_url:
+        import http_client
+        http_client.OPENROUTER_BASE_URL = base_url.rstrip("/")
+        os.environ.setdefault("OPENROUTER_API_KEY", "sk-or-bench")
+    else:
+        # Demo mode: never reach the real API from a benchmark
+        os.environ.pop("OPENROUTER_API_KEY", None)
+
+    results = {}
+    try:
+        if "micro" in selected:
+            print("⏱️  micro...", file=sys.stderr)
+            results["micro"] = micro_benchmarks(args["min_time"])
+        if "ledger" in selected:
+            print("⏱️  ledger...", file=sys.stderr)
+            results["ledger"] = ledger_growth([0, 100, 1000, 10000], args["min_time"])
+        if "concurrency" in selected:
+            print("⏱️  concurrency...", file=sys.stderr)
+            results["concurrency"] = concurrent_debits(args["processes"], args["debits"])
+        if "end_to_end" in selected:
+            print("⏱️  end_to_end...", file=sys.stderr)
+            results["end_to_end"] = end_to_end(args["calls"], args["concurrency"], bool(base_url))
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+
+    report = {
+        "version": _version(),
+        "timestamp": round(time.time(), 3),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        output.write_text(text + "\n")
+        print(f"\n📊 Benchmark results written to {output}", file=sys.stderr)
+    else:
+        print(text)
+    if baseline:
+        compare(report, baseline)
+    if results.get("concurrency", {}).get("lost_debits"):
+        print("❌ Concurrent debits were lost", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,14 @@ Create a Coinbase charge to buy OpenRouter credits with USDC.
 POST /api/v1/credits/coinbase
 """
 
-import json
 import os
 import sys
-from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+import charges
+import daemon_client
+import http_client
+import ledger
 
 def is_demo_mode() -> bool:
     """Check if we're in demo mode (no real API key or private key)."""
@@ -15,19 +19,19 @@ def is_demo_mode() -> bool:
     private_key = os.getenv("AGENT_PRIVATE_KEY")
     return not (api_key and private_key)
 
-def get_agent_dir(agent_id: str) -> Path:
-    return Path(f"agents/{agent_id}")
-
 def load_balance(agent_id: str) -> dict:
-    balance_file = get_agent_dir(agent_id) / "balance.json"
-    if not balance_file.exists():
+    try:
+        balance = daemon_client.call("balance", agent_id=agent_id) if daemon_client.enabled() \
+            else ledger.load_balance(agent_id)
+    except ledger.AgentNotFound:
+        balance = None
+    if balance is None:
         print(f"❌ Agent '{agent_id}' not found. Run check_balance.py first.")
         sys.exit(1)
-    return json.loads(balance_file.read_text())
+    return balance
 
-def save_balance(agent_id: str, balance: dict):
-    balance_file = get_agent_dir(agent_id) / "balance.json"
-    balance_file.write_text(json.dumps(balance, indent=2))
+def _iso(when: datetime) -> str:
+    return when.strftime("%Y-%m-%dT%H:%M:%SZ")
 
 def create_coinbase_charge(agent_id: str, amount_usd: float, wallet_address: str) -> dict:
     """
@@ -43,17 +47,18 @@ def create_coinbase_charge(agent_id: str, amount_usd: float, wallet_address: str
         # Demo mode - simulate charge creation
         import uuid
         charge_id = f"charge_{uuid.uuid4().hex[:20]}"
+        now = datetime.now(timezone.utc)
         
         return {
             "data": {
                 "id": charge_id,
-                "created_at": "2024-06-01T12:00:00Z",
-                "expires_at": "2024-06-01T12:30:00Z",
+                "created_at": _iso(now),
+                "expires_at": _iso(now + timedelta(minutes=30)),
                 "demo_mode": True,
                 "web3_data": {
                     "transfer_intent": {
                         "call_data": {
-                            "deadline": "2024-06-01T12:25:00Z",
+                            "deadline": _iso(now + timedelta(minutes=25)),
                             "fee_amount": "0.0005",
                             "id": f"tx_{uuid.uuid4().hex[:20]}",
                             "operator": "0xOperator1234567890abcdef1234567890abcdef",
@@ -75,33 +80,40 @@ def create_coinbase_charge(agent_id: str, amount_usd: float, wallet_address: str
         }
     
     # Production: Make actual API call
-    import requests
-    url = "https://openrouter.ai/api/v1/credits/coinbase"
     payload = {
         "amount": amount_usd,
         "sender": wallet_address,
         "chain_id": 84532  # Base Sepolia for testnet
     }
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    response = requests.post(url, json=payload, headers=headers)
+    response = http_client.request("POST", "credits/coinbase", api_key=api_key, json=payload)
+    response.raise_for_status()
     data = response.json()
     data["data"]["demo_mode"] = False
     return data
 
+def buy_credits(agent_id: str, amount_usd: float, wallet_address: str, idempotency_key: str = None) -> tuple:
+    """
+    Open a charge through the agent's charge queue; returns (record, created).
+    Retrying with the same idempotency key, or while a charge is still in
+    flight, returns the existing charge instead of creating a new one.
+    """
+    return charges.open_charge(agent_id, amount_usd,
+                               lambda: create_coinbase_charge(agent_id, amount_usd, wallet_address),
+                               idempotency_key)
+
 def main():
     # Parse args
-    args = {"agent_id": None, "amount": 5.0}
+    args = {"agent_id": None, "amount": 5.0, "idempotency_key": None}
     for i in range(1, len(sys.argv)):
         if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
             args["agent_id"] = sys.argv[i + 1]
         elif sys.argv[i] == "--amount" and i + 1 < len(sys.argv):
             args["amount"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--idempotency-key" and i + 1 < len(sys.argv):
+            args["idempotency_key"] = sys.argv[i + 1]
     
     if not args["agent_id"]:
-        print("Usage: python3 buy_credits.py --agent-id <id> [--amount <usd>]")
+        print("Usage: python3 buy_credits.py --agent-id <id> [--amount <usd>] [--idempotency-key <key>]")
         print("   Default amount: 5.0 USD")
         sys.exit(1)
     
@@ -117,12 +129,27 @@ def main():
     print(f"💰 Amount: ${amount:.2f} USDC")
     print(f"📍 Wallet: {wallet}")
     
-    # Create charge
-    charge = create_coinbase_charge(agent_id, amount, wallet)
-    data = charge["data"]
+    # Create charge (or reuse the one already in flight / under this key)
+    try:
+        if daemon_client.enabled():
+            result = daemon_client.call("charge", agent_id=agent_id, amount=amount,
+                                        idempotency_key=args["idempotency_key"])
+            record, created = result["charge"], result["created"]
+        else:
+            record, created = buy_credits(agent_id, amount, wallet, args["idempotency_key"])
+    except charges.ChargeConflict as e:
+        print(f"\n❌ Not creating a ${amount:.2f} charge: {e}")
+        print(f"   ID: {e.record['id']} (expires {e.record['expires_at']})")
+        print(f"   Pay or wait out that charge, or pass a new --idempotency-key")
+        sys.exit(1)
+    data = record["charge"]["data"]
     
-    print(f"\n✅ Charge Created!")
+    if created:
+        print(f"\n✅ Charge Created!")
+    else:
+        print(f"\n♻️  Existing charge reused ({record['state']}); no new charge created")
     print(f"   ID: {data['id']}")
+    print(f"   Amount: ${record['amount']:.2f} USDC")
     print(f"   Expires: {data['expires_at']}")
     
     # Extract payment details
@@ -138,9 +165,7 @@ def main():
     print(f"   Recipient: {call_data['recipient']}")
     print(f"   Deadline: {call_data['deadline']}")
     
-    # Save charge for execution
-    charge_file = get_agent_dir(agent_id) / "pending_charge.json"
-    charge_file.write_text(json.dumps(charge, indent=2))
+    charge_file = charges.charges_file(agent_id)
     
     if data.get("demo_mode"):
         print(f"\n⚠️  Demo Mode: Set env vars to execute real transactions")
@@ -148,11 +173,15 @@ def main():
         print("   export AGENT_PRIVATE_KEY='0x...'")
         print(f"\n📋 Next Steps (Demo):")
         print(f"   Review charge saved to: {charge_file}")
+        print(f"   Simulate payment: python3 scripts/charges.py confirm --agent-id {agent_id} --charge-id {data['id']}")
     else:
         print(f"\n📋 Next Steps:")
         print(f"   1. Review charge saved to: {charge_file}")
-        print(f"   2. Execute payment: python3 scripts/execute_payment.py --agent-id {agent_id}")
-        print(f"   3. Or manually send USDC to: {call_data['recipient']}")
+        print(f"   2. Send {call_data['recipient_amount']} USDC to {call_data['recipient']} before the deadline")
+        print(f"   3. Record it: python3 scripts/charges.py submit --agent-id {agent_id} "
+              f"--charge-id {data['id']} --tx-hash <0x...>")
+        print(f"   4. Once paid: python3 scripts/charges.py confirm --agent-id {agent_id} --charge-id {data['id']}")
+    print(f"   Then credit it: python3 scripts/charges.py sweep --agent-id {agent_id}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Coinbase charge lifecycle tracking for agents/{agent_id}/charges.json.
+
+Every charge an agent opens is kept in a durable per-agent queue and moves
+through created -> submitted -> confirmed, or to expired once its
+expires_at passes unpaid. Changes happen under the agent's .charge.lock and
+land via atomic rename.
+
+- An idempotency key makes retries safe: opening a charge with a key that
+  was already used returns the existing charge instead of creating another.
+- Without a key, a pending charge (created/submitted and not expired, or
+  confirmed but not yet credited) is returned instead of buying twice.
+- Either way, an existing charge is only returned for the same amount; a
+  different amount raises ChargeConflict instead of reusing it.
+- The sweep expires stale charges, credits confirmed ones to the ledger
+  exactly once (as a "charge" journal record) and prunes old finished ones.
+
+Usage:
+    python3 charges.py list --agent-id <id>
+    python3 charges.py submit --agent-id <id> --charge-id <id> [--tx-hash <0x...>]
+    python3 charges.py confirm --agent-id <id> --charge-id <id>
+    python3 charges.py sweep (--agent-id <id> | --all) [--interval <seconds>]
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import ledger
+
+STATES = ("created", "submitted", "confirmed", "expired")
+IN_FLIGHT = ("created", "submitted")
+# Finished charges are dropped from the queue after this long
+RETENTION = float(os.getenv("CHARGE_RETENTION", str(7 * 24 * 3600)))
+
+class ChargeConflict(Exception):
+    """An existing charge (under the same key, or pending) is for a different amount."""
+
+    def __init__(self, record: dict):
+        self.record = record
+        super().__init__(f"charge {record['id']} for {record['amount']} USDC is already "
+                         f"{'pending' if pending(record) else record['state']}")
+
+def charges_file(agent_id: str) -> Path:
+    return ledger.get_agent_dir(agent_id) / "charges.json"
+
+def charge_lock(agent_id: str):
+    return ledger.agent_lock(agent_id, ".charge.lock")
+
+def load_charges(agent_id: str) -> list:
+    try:
+        return json.loads(charges_file(agent_id).read_text())["charges"]
+    except FileNotFoundError:
+        return []
+
+def _save(agent_id: str, charges: list):
+    ledger.atomic_write(charges_file(agent_id), json.dumps({"charges": charges}, indent=2))
+
+def expired(record: dict, now: float = None) -> bool:
+    """True once a charge's expires_at has passed."""
+    expires_at = datetime.fromisoformat(record["expires_at"].replace("Z", "+00:00"))
+    return (now or time.time()) >= expires_at.timestamp()
+
+def pending(record: dict, now: float = None) -> bool:
+    """True while a charge may still bring in credits: open and unexpired, or paid but not yet swept."""
+    return (record["state"] in IN_FLIGHT and not expired(record, now)) \
+        or (record["state"] == "confirmed" and not record["credited"])
+
+def in_flight(agent_id: str) -> dict:
+    """The agent's pending charge, if any."""
+    for record in reversed(load_charges(agent_id)):
+        if pending(record):
+            return record
+    return None
+
+def _find(charges: list, charge_id: str) -> dict:
+    for record in charges:
+        if record["id"] == charge_id:
+            return record
+    raise KeyError(charge_id)
+
+def open_charge(agent_id: str, amount: float, create, idempotency_key: str = None) -> tuple:
+    """
+    Return (record, created). create() makes the actual Coinbase charge and
+    is only called when no charge with this idempotency key exists and, for
+    calls without a key, none is pending. Raises ChargeConflict if the
+    charge that would be returned is for a different amount.
+    """
+    if not ledger.get_agent_dir(agent_id).exists():
+        raise ledger.AgentNotFound(agent_id)
+    with charge_lock(agent_id):
+        charges = load_charges(agent_id)
+        for record in reversed(charges):
+            if (record.get("idempotency_key") == idempotency_key if idempotency_key is not None
+                    else pending(record)):
+                if record["amount"] != amount:
+                    raise ChargeConflict(record)
+                return record, False
+        charge = create()
+        data = charge["data"]
+        record = {
+            "id": data["id"],
+            "idempotency_key": idempotency_key,
+            "state": "created",
+            "amount": amount,
+            "created_at": data["created_at"],
+            "expires_at": data["expires_at"],
+            "updated_at": round(time.time(), 3),
+            "tx_hash": None,
+            "credited": False,
+            "charge": charge,
+        }
+        charges.append(record)
+        _save(agent_id, charges)
+        return record, True
+
+def _transition(agent_id: str, charge_id: str, state: str, **fields) -> dict:
+    with charge_lock(agent_id):
+        charges = load_charges(agent_id)
+        record = _find(charges, charge_id)
+        if record["state"] in ("confirmed", "expired") and record["state"] != state:
+            raise ValueError(f"charge {charge_id} is already {record['state']}")
+        record.update(state=state, updated_at=round(time.time(), 3), **fields)
+        _save(agent_id, charges)
+        return record
+
+def submit(agent_id: str, charge_id: str, tx_hash: str = None) -> dict:
+    """Mark a charge's payment as sent."""
+    return _transition(agent_id, charge_id, "submitted", tx_hash=tx_hash)
+
+def confirm(agent_id: str, charge_id: str) -> dict:
+    """Mark a charge as paid; the next sweep credits it."""
+    return _transition(agent_id, charge_id, "confirmed")
+
+def _already_credited(agent_id: str, charge_id: str) -> bool:
+    return any(r.get("type") == "charge" and r.get("charge") == charge_id
+               for _, r in ledger.read_journal(agent_id))
+
+def sweep(agent_id: str) -> dict:
+    """Expire stale charges, credit confirmed ones and prune old finished ones."""
+    summary = {"expired": 0, "credited": 0, "pruned": 0}
+    now = time.time()
+    with charge_lock(agent_id):
+        charges = load_charges(agent_id)
+        for record in charges:
+            if record["state"] in IN_FLIGHT and expired(record, now):
+                record.update(state="expired", updated_at=round(now, 3))
+                summary["expired"] += 1
+            elif record["state"] == "confirmed" and not record["credited"]:
+                # The journal is the source of truth if a previous sweep died after crediting
+                if not _already_credited(agent_id, record["id"]):
+                    ledger.append_records(agent_id, [{
+                        "ts": round(now, 3), "type": "charge", "charge": record["id"],
+                        "released_credits": int(record["amount"] * 1000000),  # 1 USDC = 1M credits
+                    }], check_credits=False)
+                record.update(credited=True, updated_at=round(now, 3))
+                summary["credited"] += 1
+        kept = [r for r in charges if pending(r, now) or now - r["updated_at"] < RETENTION]
+        summary["pruned"] = len(charges) - len(kept)
+        if any(summary.values()):
+            _save(agent_id, kept)
+    return summary
+
+def main():
+    # Parse args
+    args = {"command": sys.argv[1] if len(sys.argv) > 1 else None, "agent_id": None, "charge_id": None,
+            "tx_hash": None, "all": False, "interval": None}
+    for i in range(2, len(sys.argv)):
+        if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
+            args["agent_id"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--charge-id" and i + 1 < len(sys.argv):
+            args["charge_id"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--tx-hash" and i + 1 < len(sys.argv):
+            args["tx_hash"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--all":
+            args["all"] = True
+        elif sys.argv[i] == "--interval" and i + 1 < len(sys.argv):
+            args["interval"] = float(sys.argv[i + 1])
+
+    command = args["command"]
+    if command not in ("list", "submit", "confirm", "sweep") \
+            or not (args["agent_id"] or (command == "sweep" and args["all"])) \
+            or (command in ("submit", "confirm") and not args["charge_id"]):
+        print("Usage: python3 charges.py list --agent-id <id>")
+        print("       python3 charges.py submit --agent-id <id> --charge-id <id> [--tx-hash <0x...>]")
+        print("       python3 charges.py confirm --agent-id <id> --charge-id <id>")
+        print("       python3 charges.py sweep (--agent-id <id> | --all) [--interval <seconds>]")
+        sys.exit(1)
+
+    agent_id = args["agent_id"]
+    if agent_id and ledger.load_balance(agent_id) is None:
+        print(f"❌ Agent '{agent_id}' not found. Run check_balance.py first.")
+        sys.exit(1)
+
+    if command == "list":
+        charges = load_charges(agent_id)
+        print(f"\n🧾 Charges for {agent_id} ({len(charges)})")
+        for r in charges:
+            flags = " credited" if r["credited"] else ""
+            print(f"   {r['id']:<30} {r['state']:<10} ${r['amount']:.2f}  expires {r['expires_at']}{flags}")
+
+    elif command in ("submit", "confirm"):
+        try:
+            if command == "submit":
+                record = submit(agent_id, args["charge_id"], args["tx_hash"])
+            else:
+                record = confirm(agent_id, args["charge_id"])
+        except KeyError:
+            print(f"❌ Charge '{args['charge_id']}' not found for {agent_id}")
+            sys.exit(1)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"\n✅ Charge {record['id']} {record['state']}")
+        if command == "confirm":
+            print(f"   Credit it with: python3 scripts/charges.py sweep --agent-id {agent_id}")
+
+    elif command == "sweep":
+        while True:
+            agent_ids = [agent_id] if agent_id else sorted(p.parent.name for p in Path("agents").glob("*/charges.json"))
+            for a in agent_ids:
+                summary = sweep(a)
+                if any(summary.values()):
+                    print(f"🧹 {a}: expired={summary['expired']} credited={summary['credited']} "
+                          f"pruned={summary['pruned']}")
+            if args["interval"] is None:
+                break
+            time.sleep(args["interval"])
+
+if __name__ == "__main__":
+    main()
@@ -2,44 +2,37 @@
 """
 Check agent's USDC balance and compute credits.
 Testnet only - Base Sepolia.
+
+--onchain also reads the wallet's USDC from the chain (see onchain.py).
 """
 
-import json
 import os
 import sys
-from pathlib import Path
 
-def get_agent_dir(agent_id: str) -> Path:
-    """Get or create agent directory."""
-    agent_dir = Path(f"agents/{agent_id}")
-    agent_dir.mkdir(parents=True, exist_ok=True)
-    return agent_dir
+import daemon_client
+import ledger
 
 def init_balance(agent_id: str) -> dict:
     """Initialize balance file for new agent."""
-    agent_dir = get_agent_dir(agent_id)
-    balance_file = agent_dir / "balance.json"
+    balance = ledger.load_balance(agent_id)
     
-    if not balance_file.exists():
+    if balance is None:
         # Generate mock wallet address for demo
         wallet_address = f"0x{os.urandom(20).hex()}"
-        balance = {
+        balance = ledger.create_balance(agent_id, {
             "agent_id": agent_id,
             "wallet_address": wallet_address,
             "usdc_balance": 0.0,
             "credits": 0,
             "network": "base-sepolia",
             "demo_mode": True
-        }
-        balance_file.write_text(json.dumps(balance, indent=2))
-    else:
-        balance = json.loads(balance_file.read_text())
+        })
     
     return balance
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python3 check_balance.py --agent-id <agent_id>")
+        print("Usage: python3 check_balance.py --agent-id <agent_id> [--onchain]")
         sys.exit(1)
     
     # Parse args
@@ -47,17 +40,31 @@ def main():
     for i in range(1, len(sys.argv)):
         if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
             args["agent_id"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--onchain":
+            args["onchain"] = True
     
     agent_id = args.get("agent_id", "default-agent")
     
     # Get or init balance
-    balance = init_balance(agent_id)
+    if daemon_client.enabled():
+        balance = daemon_client.call("init", agent_id=agent_id)
+    else:
+        balance = init_balance(agent_id)
     
     # Display
     print(f"\n🤖 Agent: {balance['agent_id']}")
     print(f"💳 Wallet: {balance['wallet_address']}")
     print(f"🌐 Network: {balance['network']}")
     print(f"💰 USDC Balance: {balance['usdc_balance']:.2f} (testnet)")
+    if args.get("onchain"):
+        import onchain
+        if not onchain.is_address(balance["wallet_address"]):
+            print("⛓️  On-chain: wallet address is not a valid 0x address")
+        else:
+            try:
+                print(f"⛓️  On-chain: {onchain.get_balance(balance['wallet_address']):.6f} USDC")
+            except onchain.RPCError as e:
+                print(f"⛓️  On-chain: unavailable ({e})")
     print(f"⚡ Compute Credits: {balance['credits']:,}")
     print(f"🔧 Demo Mode: {balance['demo_mode']}")
     print(f"\n📍 To fund: Send Base Sepolia USDC to {balance['wallet_address']}")
@@ -0,0 +1,99 @@
+"""
+Client for the agentd daemon.
+
+When USDC_OPENROUTER_DAEMON is set, the scripts send their operation to the
+resident daemon instead of doing the work in-process:
+
+    export USDC_OPENROUTER_DAEMON=unix:/tmp/agentd.sock
+    export USDC_OPENROUTER_DAEMON=http://127.0.0.1:8765
+
+Over HTTP the daemon only answers requests carrying its per-install token
+(agents/.agentd-token, written by agentd with mode 0600, or
+USDC_OPENROUTER_DAEMON_TOKEN); Unix sockets are protected by their file
+permissions instead.
+
+Errors raised by the daemon come back as the same exceptions the scripts
+already handle (ledger.AgentNotFound, ledger.InsufficientCredits,
+http_client.DeadlineExceeded, ratelimit.RateLimited,
+charges.ChargeConflict); anything else, and an unreachable daemon, is a
+DaemonError.
+"""
+
+import http.client
+import json
+import os
+import socket
+from pathlib import Path
+
+import charges
+import http_client
+import ledger
+import ratelimit
+
+DAEMON = os.getenv("USDC_OPENROUTER_DAEMON")
+TOKEN_FILE = Path(os.getenv("AGENTD_TOKEN_FILE", "agents/.agentd-token"))
+
+class DaemonError(Exception):
+    pass
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+def enabled() -> bool:
+    return bool(DAEMON)
+
+def load_token() -> str:
+    """The daemon's HTTP token, or None if there isn't one."""
+    token = os.getenv("USDC_OPENROUTER_DAEMON_TOKEN")
+    if token:
+        return token
+    try:
+        return TOKEN_FILE.read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _connect(timeout: float):
+    if DAEMON.startswith("unix:"):
+        return _UnixHTTPConnection(DAEMON[len("unix:"):], timeout=timeout)
+    address = DAEMON.split("://", 1)[-1].rstrip("/")
+    host, _, port = address.partition(":")
+    return http.client.HTTPConnection(host, int(port or 80), timeout=timeout)
+
+def call(op: str, timeout: float = 600, **params) -> dict:
+    """Run one operation on the daemon and return its JSON result."""
+    conn = _connect(timeout)
+    try:
+        body = json.dumps(params)
+        headers = {"Content-Type": "application/json"}
+        token = None if DAEMON.startswith("unix:") else load_token()
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        conn.request("POST", f"/{op}", body=body, headers=headers)
+        response = conn.getresponse()
+        data = json.loads(response.read() or b"{}")
+    except OSError as e:
+        raise DaemonError(f"can't reach agentd at {DAEMON}: {e}") from e
+    finally:
+        conn.close()
+
+    if response.status == 200:
+        return data
+    error = data.get("error", f"HTTP {response.status}")
+    if data.get("type") == "AgentNotFound":
+        raise ledger.AgentNotFound(params.get("agent_id"))
+    if data.get("type") == "InsufficientCredits":
+        raise ledger.InsufficientCredits(data["required"], data["available"])
+    if data.get("type") == "DeadlineExceeded":
+        raise http_client.DeadlineExceeded(error)
+    if data.get("type") == "RateLimited":
+        raise ratelimit.RateLimited(error)
+    if data.get("type") == "ChargeConflict":
+        raise charges.ChargeConflict(data["charge"])
+    raise DaemonError(error)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Fleet-level balance store for running many agents.
+One indexed SQLite database (WAL mode) instead of one directory and JSON
+file per agent: listing and scanning thousands of agents are single
+indexed queries.
+
+Existing agents/{agent_id}/balance.json files are imported with `migrate`.
+Re-running it only adds new agents and refreshes wallet, network and demo
+flag; credits are never overwritten. The agent ledgers stay the source of
+truth for credits: the ledger writes every balance change of an imported
+agent through to its credits here (see apply_ledger_delta), and fleet
+funding and debits are journaled to each agent's ledger, so the two never
+drift apart. Testnet only.
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+import ledger
+
+FLEET_DB = Path(os.getenv("USDC_OPENROUTER_FLEET_DB", "agents/fleet.db"))
+
+AGENT_COLUMNS = ("agent_id", "wallet_address", "usdc_balance", "credits", "network", "demo_mode",
+                 "threshold", "updated_at")
+
+class FleetStore:
+    def __init__(self, path: Path = FLEET_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS agents (
+                agent_id TEXT PRIMARY KEY,
+                wallet_address TEXT NOT NULL,
+                usdc_balance REAL NOT NULL DEFAULT 0,
+                credits INTEGER NOT NULL DEFAULT 0,
+                network TEXT NOT NULL DEFAULT 'base-sepolia',
+                demo_mode INTEGER NOT NULL DEFAULT 1,
+                threshold INTEGER,
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS agents_credits ON agents (credits);
+            CREATE TABLE IF NOT EXISTS burn (
+                agent_id TEXT NOT NULL,
+                hour INTEGER NOT NULL,
+                credits INTEGER NOT NULL,
+                PRIMARY KEY (agent_id, hour)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS burn_offsets (
+                agent_id TEXT PRIMARY KEY,
+                journal_offset INTEGER NOT NULL
+            ) WITHOUT ROWID;
+        """)
+
+    def _transaction(self):
+        store = self
+
+        class _Tx:
+            def __enter__(self):
+                store.db.execute("BEGIN IMMEDIATE")
+                return store.db
+
+            def __exit__(self, exc_type, exc, tb):
+                store.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return _Tx()
+
+    def get(self, agent_id: str) -> dict:
+        row = self.db.execute(f"SELECT {', '.join(AGENT_COLUMNS)} FROM agents WHERE agent_id = ?",
+                              (agent_id,)).fetchone()
+        return dict(zip(AGENT_COLUMNS, row)) if row else None
+
+    def agent_ids(self) -> list:
+        return [row[0] for row in self.db.execute("SELECT agent_id FROM agents ORDER BY agent_id")]
+
+    def list_agents(self, below: int = None, limit: int = None) -> list:
+        """All agents with balances, lowest credits first; optionally only those below a level."""
+        query = f"SELECT {', '.join(AGENT_COLUMNS)} FROM agents"
+        params = []
+        if below is not None:
+            query += " WHERE credits < ?"
+            params.append(below)
+        query += " ORDER BY credits, agent_id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [dict(zip(AGENT_COLUMNS, row)) for row in self.db.execute(query, params)]
+
+    def burn_offsets(self) -> dict:
+        """{agent_id: journal bytes already counted into the hourly burn buckets}."""
+        return dict(self.db.execute("SELECT agent_id, journal_offset FROM burn_offsets"))
+
+    def add_burn(self, spent: dict, offsets: dict, seen: dict, keep_from_hour: int) -> int:
+        """
+        Add {(agent_id, hour): credits} to the burn buckets and move the
+        agents' offsets from seen to offsets, in one transaction. Agents whose
+        offset another scan moved in the meantime are left alone (that scan
+        counted the same records). Buckets before keep_from_hour are dropped.
+        Returns agents updated.
+        """
+        with self._transaction() as db:
+            current = dict(db.execute("SELECT agent_id, journal_offset FROM burn_offsets"))
+            moved = {a for a in offsets if current.get(a) != seen.get(a)}
+            db.executemany("INSERT INTO burn VALUES (?, ?, ?) ON CONFLICT (agent_id, hour) "
+                           "DO UPDATE SET credits = credits + excluded.credits",
+                           [(a, hour, c) for (a, hour), c in spent.items() if a not in moved])
+            db.executemany("INSERT OR REPLACE INTO burn_offsets VALUES (?, ?)",
+                           [(a, o) for a, o in offsets.items() if a not in moved])
+            db.execute("DELETE FROM burn WHERE hour < ?", (keep_from_hour,))
+        return len(offsets) - len(moved)
+
+    def runway(self, default_threshold: int, from_hour: int, window_hours: float) -> list:
+        """
+        (agent_id, credits, threshold, low, burn_per_hour, hours_to_empty) for
+        the whole fleet in one query: burn is the spend in buckets from
+        from_hour on over window_hours, and hours_to_empty is NULL without
+        positive burn. Low-balance agents first, then shortest runway.
+        """
+        return self.db.execute("""
+            SELECT agent_id, credits, threshold, low, burn, CASE WHEN burn > 0 THEN credits / burn END AS runway
+            FROM (SELECT a.agent_id, a.credits, COALESCE(a.threshold, :default) AS threshold,
+                         a.credits < COALESCE(a.threshold, :default) AS low,
+                         COALESCE(b.spent, 0) / :window AS burn
+                  FROM agents a LEFT JOIN (SELECT agent_id, SUM(credits) AS spent FROM burn
+                                           WHERE hour >= :from_hour GROUP BY agent_id) b USING (agent_id))
+            ORDER BY low DESC, runway IS NULL, runway, credits, agent_id
+        """, {"default": default_threshold, "from_hour": from_hour, "window": float(window_hours)}).fetchall()
+
+    def upsert(self, balances: list) -> int:
+        """
+        Insert agents from balance dicts (as stored in balance.json). Agents
+        already in the store only get wallet, network, demo flag and a missing
+        threshold refreshed; their balances are kept. Returns agents inserted.
+        """
+        now = time.time()
+        rows = [(b["agent_id"], b.get("wallet_address") or f"0x{os.urandom(20).hex()}",
+                 b.get("usdc_balance", 0.0), b.get("credits", 0), b.get("network", "base-sepolia"),
+                 int(b.get("demo_mode", True)), b.get("threshold"), now) for b in balances]
+        with self._transaction() as db:
+            before = db.execute("SELECT COUNT(*) FROM agents").fetchone()[0]
+            db.executemany(f"INSERT INTO agents ({', '.join(AGENT_COLUMNS)}) "
+                           f"VALUES ({', '.join('?' * len(AGENT_COLUMNS))}) "
+                           "ON CONFLICT (agent_id) DO UPDATE SET wallet_address = excluded.wallet_address, "
+                           "network = excluded.network, demo_mode = excluded.demo_mode, "
+                           "threshold = COALESCE(agents.threshold, excluded.threshold)", rows)
+            return db.execute("SELECT COUNT(*) FROM agents").fetchone()[0] - before
+
+    def add_credits(self, agent_id: str, delta: int):
+        """Apply a ledger balance change to an imported agent; agents not in the store are ignored."""
+        if delta:
+            self.db.execute("UPDATE agents SET credits = credits + ?, updated_at = ? WHERE agent_id = ?",
+                            (delta, time.time(), agent_id))
+
+    def fund(self, agent_ids: list, amount_usdc: float) -> int:
+        """
+        Add USDC (and 1M credits per USDC) to many agents; returns agents
+        funded. Credits are journaled to each agent's ledger, which writes
+        them through to this store; agents not in the store are skipped.
+        """
+        credits = int(amount_usdc * 1000000)
+        funded = []
+        for agent_id in agent_ids:
+            if self.get(agent_id) is None:
+                continue
+            try:
+                ledger.append_records(agent_id, [{"ts": round(time.time(), 3), "type": "fund",
+                                                  "released_credits": credits, "usdc": amount_usdc}],
+                                      check_credits=False)
+            except ledger.AgentNotFound:
+                continue
+            funded.append(agent_id)
+        with self._transaction() as db:
+            db.executemany("UPDATE agents SET usdc_balance = usdc_balance + ?, updated_at = ? WHERE agent_id = ?",
+                           [(amount_usdc, time.time(), a) for a in funded])
+        return len(funded)
+
+    def set_usdc(self, balances: dict) -> int:
+        """Overwrite usdc_balance from {agent_id: usdc} (e.g. on-chain reads) in one transaction."""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.executemany(
+                "UPDATE agents SET usdc_balance = ?, updated_at = ? WHERE agent_id = ? AND usdc_balance != ?",
+                [(usdc, now, a, usdc) for a, usdc in balances.items()])
+        return cursor.rowcount
+
+    def debit(self, debits: dict, kind: str = "usage") -> int:
+        """
+        Deduct {agent_id: credits} through the agents' ledgers. All-or-nothing:
+        every debit is reserved first, and if any agent is missing or can't
+        cover its debit, the reservations are released and AgentNotFound /
+        InsufficientCredits is raised for the first offender.
+        """
+        for agent_id in debits:
+            if self.get(agent_id) is None:
+                raise ledger.AgentNotFound(agent_id)
+        reservations = {}
+        try:
+            for agent_id, credits in debits.items():
+                reservations[agent_id] = ledger.reserve(agent_id, credits)
+        except (ledger.AgentNotFound, ledger.InsufficientCredits):
+            for agent_id, reservation in reservations.items():
+                ledger.release(agent_id, reservation)
+            raise
+        for agent_id, reservation in reservations.items():
+            ledger.settle(agent_id, reservation, {"ts": round(time.time(), 3), "type": "debit", "kind": kind,
+                                                  "cost_credits": debits[agent_id]})
+        return len(debits)
+
+    def export(self, out, fmt: str = "json"):
+        """Write every agent's state to out as JSON lines or CSV."""
+        rows = self.db.execute(f"SELECT {', '.join(AGENT_COLUMNS)} FROM agents ORDER BY agent_id")
+        if fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(AGENT_COLUMNS)
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                out.write(json.dumps(dict(zip(AGENT_COLUMNS, row))) + "\n")
+
+_local = threading.local()
+
+def apply_ledger_delta(agent_id: str, delta: int):
+    """
+    Write a ledger balance change through to the fleet store, if there is
+    one. Called by the ledger under the agent's lock; a failure here is
+    reported but never undoes the journaled change.
+    """
+    if not delta or not FLEET_DB.exists():
+        return
+    try:
+        store = getattr(_local, "store", None)
+        if store is None:
+            store = _local.store = FleetStore()
+        store.add_credits(agent_id, delta)
+    except sqlite3.Error as e:
+        print(f"⚠️  Fleet store not updated for {agent_id} ({delta:+,} credits): {e}", file=sys.stderr)
+
+def migrate(store: FleetStore, root: Path = Path("agents")) -> int:
+    """
+    Import every agents/*/balance.json (journal folded in) not yet in the
+    store; returns agents imported. Safe to re-run: existing rows keep their
+    credits and USDC.
+    """
+    balances = []
+    for balance_file in sorted(root.glob("*/balance.json")):
+        balance = ledger.load_balance(balance_file.parent.name)
+        if balance is not None:
+            balance.setdefault("agent_id", balance_file.parent.name)
+            balances.append(balance)
+    return store.upsert(balances)
+
+def _agent_ids(args: dict, store: FleetStore) -> list:
+    if args["all"]:
+        return [a["agent_id"] for a in store.list_agents()]
+    if args["agents"] == "-":
+        return [line.strip() for line in sys.stdin if line.strip()]
+    return [a for a in (args["agents"] or "").split(",") if a]
+
+def main():
+    # Parse args
+    args = {"command": sys.argv[1] if len(sys.argv) > 1 else None, "agents": None, "all": False,
+            "amount": None, "credits": None, "below": None, "limit": None, "format": "json", "output": "-"}
+    for i in range(2, len(sys.argv)):
+        if sys.argv[i] == "--agents" and i + 1 < len(sys.argv):
+            args["agents"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--all":
+            args["all"] = True
+        elif sys.argv[i] == "--amount" and i + 1 < len(sys.argv):
+            args["amount"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--credits" and i + 1 < len(sys.argv):
+            args["credits"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--below" and i + 1 < len(sys.argv):
+            args["below"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--limit" and i + 1 < len(sys.argv):
+            args["limit"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--format" and i + 1 < len(sys.argv):
+            args["format"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--output" and i + 1 < len(sys.argv):
+            args["output"] = sys.argv[i + 1]
+
+    command = args["command"]
+    if command not in ("migrate", "list", "fund", "debit", "export") \
+            or (command == "fund" and args["amount"] is None) \
+            or (command == "debit" and args["credits"] is None):
+        print("Usage: python3 fleet.py migrate")
+        print("       python3 fleet.py list [--below <credits>] [--limit <n>]")
+        print("       python3 fleet.py fund --amount <usdc> (--agents <id,id,...|-> | --all)")
+        print("       python3 fleet.py debit --credits <n> (--agents <id,id,...|-> | --all)")
+        print("       python3 fleet.py export [--format json|csv] [--output <file>]")
+        sys.exit(1)
+
+    store = FleetStore()
+
+    if command == "migrate":
+        imported = migrate(store)
+        print(f"\n📥 Imported {imported:,} agents into {FLEET_DB}")
+
+    elif command == "list":
+        agents = store.list_agents(args["below"], args["limit"])
+        print(f"\n🚚 Fleet: {len(agents):,} agents")
+        for a in agents:
+            print(f"   {a['agent_id']:<32} {a['credits']:>14,} credits  {a['usdc_balance']:>10.2f} USDC")
+
+    elif command == "fund":
+        agent_ids = _agent_ids(args, store)
+        funded = store.fund(agent_ids, args["amount"])
+        print(f"\n💧 Funded {funded:,} agents with {args['amount']} USDC each")
+        if funded < len(agent_ids):
+            print(f"   ⚠️  {len(agent_ids) - funded:,} agent IDs not found")
+
+    elif command == "debit":
+        agent_ids = _agent_ids(args, store)
+        try:
+            store.debit({a: args["credits"] for a in agent_ids})
+        except ledger.AgentNotFound as e:
+            print(f"❌ Agent '{e}' not found; nothing debited")
+            sys.exit(1)
+        except ledger.InsufficientCredits as e:
+            print(f"❌ Insufficient credits ({e}); nothing debited")
+            sys.exit(1)
+        print(f"\n⚡ Debited {args['credits']:,} credits from {len(agent_ids):,} agents")
+
+    elif command == "export":
+        out = sys.stdout if args["output"] == "-" else open(args["output"], "w", newline="")
+        try:
+            store.export(out, args["format"])
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+if __name__ == "__main__":
+    main()
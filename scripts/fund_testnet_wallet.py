@@ -4,23 +4,29 @@ Fund agent wallet with testnet USDC from faucet.
 Testnet only - Base Sepolia.
 """
 
-import json
 import sys
-from pathlib import Path
 
-def get_agent_dir(agent_id: str) -> Path:
-    return Path(f"agents/{agent_id}")
+import daemon_client
+import ledger
 
 def load_balance(agent_id: str) -> dict:
-    balance_file = get_agent_dir(agent_id) / "balance.json"
-    if not balance_file.exists():
+    try:
+        balance = daemon_client.call("balance", agent_id=agent_id) if daemon_client.enabled() \
+            else ledger.load_balance(agent_id)
+    except ledger.AgentNotFound:
+        balance = None
+    if balance is None:
         print(f"❌ Agent '{agent_id}' not found. Run check_balance.py first.")
         sys.exit(1)
-    return json.loads(balance_file.read_text())
+    return balance
 
-def save_balance(agent_id: str, balance: dict):
-    balance_file = get_agent_dir(agent_id) / "balance.json"
-    balance_file.write_text(json.dumps(balance, indent=2))
+def fund_agent(agent_id: str, amount: float) -> dict:
+    """Add simulated faucet USDC and matching credits; returns the new balance."""
+    # Locked, so concurrent calls can't lose the deposit
+    with ledger.update_balance(agent_id) as balance:
+        balance["usdc_balance"] += amount
+        balance["credits"] += int(amount * 1000000)  # 1 USDC = 1M credits
+    return balance
 
 def main():
     # Parse args
@@ -56,9 +62,10 @@ def main():
     print("   Simulating faucet deposit...")
     
     # Update balance
-    balance["usdc_balance"] += amount
-    balance["credits"] += int(amount * 1000000)  # 1 USDC = 1M credits
-    save_balance(agent_id, balance)
+    if daemon_client.enabled():
+        balance = daemon_client.call("fund", agent_id=agent_id, amount=amount)
+    else:
+        balance = fund_agent(agent_id, amount)
     
     print(f"\n✅ Funded!")
     print(f"   +{amount} USDC")
@@ -2,18 +2,33 @@
 """
 Get OpenRouter credits balance.
 GET /api/v1/credits (requires provisioning key)
+
+The API reports USD; amounts are converted to integer credits
+(1 credit = $0.000001, the same unit as the local ledger).
 """
 
 import json
 import os
 import sys
+from decimal import Decimal
 from pathlib import Path
 
+import daemon_client
+import http_client
+import ledger
+import pricing
+
+def usd_to_credits(usd) -> int:
+    """USD amount as reported by the API to exact integer credits (rounded to the nearest credit)."""
+    picos_per_credit = pricing.PICO_PER_USD // ledger.CREDITS_PER_USDC
+    return (pricing.to_pico(usd) + picos_per_credit // 2) // picos_per_credit
+
 def get_openrouter_credits() -> dict:
     """
     Get OpenRouter credits balance.
     Calls GET https://openrouter.ai/api/v1/credits
     Requires OPENROUTER_API_KEY environment variable.
+    Returns {"data": {total_credits, total_usage, remaining_credits, demo_mode}} in credits.
     """
     
     api_key = os.getenv("OPENROUTER_API_KEY")
@@ -22,33 +37,37 @@ def get_openrouter_credits() -> dict:
         # Demo mode - return mock data
         return {
             "data": {
-                "total_credits": 10000000,  # $100.00
-                "total_usage": 2500000,     # $25.00 used
-                "remaining_credits": 7500000,  # $75.00 remaining
+                "total_credits": 100000000,  # $100.00
+                "total_usage": 25000000,     # $25.00 used
+                "remaining_credits": 75000000,  # $75.00 remaining
                 "demo_mode": True
             }
         }
     
     # Production: Make actual API call
-    import requests
-    url = "https://openrouter.ai/api/v1/credits"
-    headers = {
-        "Authorization": f"Bearer {api_key}"
+    response = http_client.request("GET", "credits", api_key=api_key)
+    response.raise_for_status()
+    data = response.json()["data"]
+    total_credits = usd_to_credits(data["total_credits"])
+    total_usage = usd_to_credits(data["total_usage"])
+    return {
+        "data": {
+            "total_credits": total_credits,
+            "total_usage": total_usage,
+            "remaining_credits": total_credits - total_usage,
+            "demo_mode": False
+        }
     }
-    response = requests.get(url, headers=headers)
-    data = response.json()
-    data["data"]["demo_mode"] = False
-    return data
 
 def format_credits(credits: int) -> str:
-    """Format credits as dollars (1 credit = $0.0001)."""
-    return f"${credits / 10000:.2f}"
+    """Format credits as dollars (1 credit = $0.000001)."""
+    return f"${Decimal(credits).scaleb(-6):,.2f}"
 
 def main():
     print("\n🔍 Checking OpenRouter Credits")
     print("-" * 40)
     
-    credits = get_openrouter_credits()
+    credits = daemon_client.call("credits") if daemon_client.enabled() else get_openrouter_credits()
     data = credits["data"]
     
     print(f"💰 Total Credits Purchased: {format_credits(data['total_credits'])}")
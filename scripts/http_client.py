@@ -0,0 +1,219 @@
+"""
+Shared HTTP client for OpenRouter API calls.
+One pooled keep-alive session per process, with connect/read timeouts and
+retries with backoff on 429 and 5xx; a 429 also pauses the shared rate
+limiter (ratelimit.py). Uses httpx over HTTP/2 when httpx and h2 are
+installed, otherwise requests.
+
+Tunable via env vars:
+  OPENROUTER_BASE_URL         API base URL (default https://openrouter.ai/api/v1;
+                              point at scripts/mock_server.py for offline load tests)
+  OPENROUTER_POOL_SIZE        max pooled connections (default 10)
+  OPENROUTER_CONNECT_TIMEOUT  seconds (default 5)
+  OPENROUTER_READ_TIMEOUT     seconds (default 60)
+  OPENROUTER_MAX_RETRIES      retries after the first attempt (default 3)
+  OPENROUTER_BACKOFF          base backoff in seconds, doubled per retry (default 0.5)
+"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+import metrics
+import ratelimit
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Set by scripts/mock_server.py on every response it sends
+MOCK_HEADER = "X-Mock-Server"
+
+POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "3"))
+BACKOFF = float(os.getenv("OPENROUTER_BACKOFF", "0.5"))
+
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "https://github.com/cubo-ai/usdc-openrouter-skill-hackathon",
+    "X-Title": "USDC OpenRouter Skill",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+class DeadlineExceeded(TimeoutError):
+    """A call's deadline passed before it could finish."""
+
+def _create_session():
+    try:
+        import h2  # noqa: F401 - httpx needs it for http2=True
+        import httpx
+    except ImportError:
+        httpx = None
+
+    if httpx is not None:
+        return httpx.Client(
+            http2=True,
+            headers=DEFAULT_HEADERS,
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+def _is_httpx(session) -> bool:
+    return type(session).__module__.startswith("httpx")
+
+def _connect_errors(session) -> tuple:
+    """Errors raised before the request reached the server, so safe to retry."""
+    if _is_httpx(session):
+        import httpx
+        return (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    import requests
+    return (requests.ConnectionError, requests.ConnectTimeout)
+
+def request_errors() -> tuple:
+    """Base exceptions for any failed request on the active backend (connection, timeout, HTTP status)."""
+    if _is_httpx(get_session()):
+        import httpx
+        return (httpx.HTTPError, httpx.StreamError)
+    import requests
+    return (requests.RequestException,)
+
+def _retry_delay(attempt: int, response=None) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return BACKOFF * (2 ** attempt) * (0.5 + random.random())
+
+def _timeouts(deadline: float) -> tuple:
+    """(connect, read) timeouts, cut down to what is left before a time.monotonic() deadline."""
+    if deadline is None:
+        return CONNECT_TIMEOUT, READ_TIMEOUT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("deadline passed before the request was sent")
+    return min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining)
+
+def request(method: str, path: str, api_key: str = None, json: dict = None,
+            headers: dict = None, stream: bool = False, deadline: float = None):
+    """
+    Send a request to the OpenRouter API through the shared session.
+    Returns the response object (requests or httpx); callers use
+    .status_code, .headers, .json() and .raise_for_status().
+    With stream=True the body is not read; close the response when done.
+    With a deadline (a time.monotonic() value) timeouts are shortened to
+    fit and no retry is started that would run past it.
+    """
+    session = get_session()
+    url = f"{OPENROUTER_BASE_URL}/{path.lstrip('/')}"
+    all_headers = dict(headers or {})
+    if api_key:
+        all_headers["Authorization"] = f"Bearer {api_key}"
+
+    for attempt in range(MAX_RETRIES + 1):
+        last_attempt = attempt == MAX_RETRIES
+        connect_timeout, read_timeout = _timeouts(deadline)
+        try:
+            if _is_httpx(session):
+                import httpx
+                req = session.build_request(method, url, json=json, headers=all_headers,
+                                            timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+                response = session.send(req, stream=stream)
+            else:
+                response = session.request(method, url, json=json, headers=all_headers,
+                                           stream=stream, timeout=(connect_timeout, read_timeout))
+        except _connect_errors(session):
+            delay = _retry_delay(attempt)
+            if last_attempt or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            metrics.inc("http_retries", status="connect_error")
+            time.sleep(delay)
+            continue
+
+        if response.status_code in RETRY_STATUSES and not last_attempt:
+            delay = _retry_delay(attempt, response)
+            if response.status_code == 429:
+                # Hold every process sharing this key, not just this request
+                ratelimit.pause(delay)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                return response
+            metrics.inc("http_retries", status=str(response.status_code))
+            response.close()
+            time.sleep(delay)
+            continue
+        return response
+
+def is_mock(response) -> bool:
+    """True if the response came from scripts/mock_server.py rather than OpenRouter."""
+    return MOCK_HEADER in response.headers
+
+def _socket(response):
+    """The socket under a streamed response, or None if it isn't ours alone to shut down."""
+    if _is_httpx(response):
+        # Over HTTP/2 the connection carries other requests' streams too
+        if response.http_version != "HTTP/1.1":
+            return None
+        stream = response.extensions.get("network_stream")
+        return stream.get_extra_info("socket") if stream is not None else None
+    connection = getattr(getattr(response, "raw", None), "_connection", None)
+    return getattr(connection, "sock", None)
+
+def abort(response):
+    """
+    Close a streamed response from another thread. The socket is shut down
+    first so a reader blocked on it wakes up with an error instead of
+    waiting out its read timeout.
+
+    On httpx over HTTP/2 the socket is shared with other streams, so only
+    the stream is closed (RST_STREAM): a reader already blocked on it wakes
+    up at the next frame on the connection or at its read timeout, which
+    request() shortens to the call's deadline.
+    """
+    sock = _socket(response)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+def iter_sse(response):
+    """
+    Yield the JSON payload of each server-sent event from a streamed response,
+    stopping at the [DONE] sentinel. Comment lines (keep-alives) are skipped.
+    Event streams are always UTF-8, whatever the Content-Type says.
+    """
+    if _is_httpx(response):
+        lines = response.iter_lines()
+    else:
+        # requests falls back to ISO-8859-1 for text/* without a charset
+        response.encoding = "utf-8"
+        lines = response.iter_lines(decode_unicode=True)
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return
+        yield json.loads(payload)
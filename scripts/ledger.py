@@ -0,0 +1,486 @@
+"""
+Concurrency-safe balance ledger for agents/{agent_id}/.
+
+Two files per agent:
+  balance.json  snapshot; `journal_offset` marks how much of the journal it includes
+  usage.jsonl   append-only usage journal, one JSON record per call
+
+The current balance is the snapshot with the journal tail past
+`journal_offset` folded in. Debits on the hot path are a single small append
+to the journal; compaction folds the tail into a new snapshot.
+
+Each record deducts `cost_credits` and gives back `released_credits`. A
+pre-flight reservation is a record that deducts the estimated maximum cost;
+the matching settlement releases it and deducts the actual cost. Usage
+records also carry the exact `cost_picos`; they are billed in whole credits
+and the sub-credit remainder is carried in the balance (`remainder_picos`),
+so calls cheaper than a credit still add up instead of rounding to zero.
+Reconciliation against the provider's bill books "adjustment" records,
+whose cost_credits is negative for refunds.
+
+Agents imported into the fleet store (fleet.py) have every balance change
+written through to their fleet row as well.
+
+Writers hold an exclusive fcntl lock on agents/{agent_id}/.lock, snapshots
+land via temp file + fsync + atomic rename, and journal fsyncs are batched.
+The journal is fsynced before every snapshot, so a snapshot's offset never
+points past journal bytes a crash could lose; an offset past the end of the
+journal is clamped anyway. Parallel processes never lose each other's
+deductions, and a crash never leaves a truncated balance file.
+
+Usage:
+    python3 ledger.py history --agent-id <id> [--limit <n>]
+    python3 ledger.py compact --agent-id <id>
+"""
+
+import atexit
+import ctypes
+import ctypes.util
+import fcntl
+import json
+import os
+import select
+import struct
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import fleet
+import metrics
+
+# 1 credit = 1 micro-USDC, USDC's smallest unit
+CREDITS_PER_USDC = 1_000_000
+# Calls are priced in pico-USD (1e-12); 1 credit = 1,000,000 picos
+PICOS_PER_CREDIT = 1_000_000
+# Fsync the journal after this many appends or seconds, whichever comes first
+FSYNC_EVERY = int(os.getenv("LEDGER_FSYNC_EVERY", "64"))
+FSYNC_INTERVAL = float(os.getenv("LEDGER_FSYNC_INTERVAL", "1.0"))
+# Fold the journal into the snapshot once the unfolded tail reaches this many records
+COMPACT_EVERY = int(os.getenv("LEDGER_COMPACT_EVERY", "1000"))
+
+class AgentNotFound(Exception):
+    pass
+
+class InsufficientCredits(Exception):
+    def __init__(self, required: int, available: int):
+        super().__init__(f"required {required:,} credits, available {available:,}")
+        self.required = required
+        self.available = available
+
+def get_agent_dir(agent_id: str) -> Path:
+    return Path(f"agents/{agent_id}")
+
+@contextmanager
+def agent_lock(agent_id: str, name: str = ".lock"):
+    """Hold the agent's exclusive cross-process lock (or another named lock in its directory)."""
+    lock_file = get_agent_dir(agent_id) / name
+    fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def atomic_write(path: Path, text: str):
+    """Write text to path via temp file + fsync + rename."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class _Journal:
+    """Append handle for one agent's usage.jsonl with batched fsync."""
+
+    def __init__(self, path: Path):
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def append(self, records: list):
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        os.write(self.fd, data.encode())
+        self.unsynced += len(records)
+        if self.unsynced >= FSYNC_EVERY or time.monotonic() - self.last_sync >= FSYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        if self.unsynced:
+            os.fsync(self.fd)
+            self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+_journals = {}
+
+def _journal(agent_id: str) -> _Journal:
+    if agent_id not in _journals:
+        _journals[agent_id] = _Journal(get_agent_dir(agent_id) / "usage.jsonl")
+    return _journals[agent_id]
+
+@atexit.register
+def flush_journals():
+    """Fsync every journal this process has appended to."""
+    for journal in _journals.values():
+        journal.sync()
+
+def _net_cost(record: dict) -> int:
+    return record.get("cost_credits", 0) - record.get("released_credits", 0)
+
+def _apply(balance: dict, record: dict):
+    balance["credits"] -= _net_cost(record)
+    if "cost_picos" in record:
+        balance["remainder_picos"] = (balance.get("remainder_picos", 0) + record["cost_picos"]
+                                      - record["cost_credits"] * PICOS_PER_CREDIT)
+
+def _bill_picos(balance: dict, records: list):
+    """Fill in cost_credits for records priced only in cost_picos, carrying the sub-credit remainder."""
+    remainder = balance.get("remainder_picos", 0)
+    for record in records:
+        if "cost_picos" not in record:
+            continue
+        if "cost_credits" not in record:
+            record["cost_credits"] = (remainder + record["cost_picos"]) // PICOS_PER_CREDIT
+        remainder += record["cost_picos"] - record["cost_credits"] * PICOS_PER_CREDIT
+
+def read_journal(agent_id: str, offset: int = 0):
+    """
+    Yield (end_offset, record) for each complete journal line from offset on.
+    A partially written last line is left for the next reader.
+    """
+    journal_file = get_agent_dir(agent_id) / "usage.jsonl"
+    try:
+        f = open(journal_file, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            yield offset, json.loads(line)
+
+def _fold(agent_id: str, repair: bool = False):
+    """
+    Return (balance, journal_end, tail_records), or (None, 0, 0) if the agent
+    doesn't exist. A snapshot offset past the end of the journal (its unsynced
+    tail was lost in a crash; the snapshot already includes those records) is
+    clamped to the journal size. With repair, which needs the agent's lock,
+    the snapshot is rewritten at that offset before anything is appended.
+    """
+    balance_file = get_agent_dir(agent_id) / "balance.json"
+    try:
+        balance = json.loads(balance_file.read_text())
+    except FileNotFoundError:
+        return None, 0, 0
+    end = balance.get("journal_offset", 0)
+    size = _journal_size(agent_id)
+    if end > size:
+        end = size
+        if repair:
+            _write_snapshot(agent_id, balance, end)
+    tail = 0
+    for end, record in read_journal(agent_id, end):
+        _apply(balance, record)
+        tail += 1
+    balance["journal_offset"] = end
+    return balance, end, tail
+
+def _sync_journal(agent_id: str):
+    """Fsync the agent's journal, including appends by other processes still in the page cache."""
+    if agent_id in _journals:
+        os.fsync(_journals[agent_id].fd)
+        _journals[agent_id].unsynced = 0
+        return
+    try:
+        fd = os.open(get_agent_dir(agent_id) / "usage.jsonl", os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_snapshot(agent_id: str, balance: dict, journal_end: int):
+    # The snapshot must never point past journal bytes that could still be lost
+    _sync_journal(agent_id)
+    balance["journal_offset"] = journal_end
+    with metrics.phase("ledger_write"):
+        atomic_write(get_agent_dir(agent_id) / "balance.json", json.dumps(balance, indent=2))
+
+def _journal_size(agent_id: str) -> int:
+    try:
+        return (get_agent_dir(agent_id) / "usage.jsonl").stat().st_size
+    except FileNotFoundError:
+        return 0
+
+def load_balance(agent_id: str) -> dict:
+    """
+    Read the agent's current balance (snapshot + journal tail), or None if
+    the agent doesn't exist. Lock-free: snapshots are renamed into place and
+    journal lines are appended whole.
+    """
+    return _fold(agent_id)[0]
+
+def save_balance(agent_id: str, balance: dict):
+    """Atomically replace the agent's balance; it supersedes everything journaled so far."""
+    with agent_lock(agent_id):
+        previous = load_balance(agent_id)
+        _write_snapshot(agent_id, balance, _journal_size(agent_id))
+        if previous is not None:
+            fleet.apply_ledger_delta(agent_id, balance["credits"] - previous["credits"])
+
+@contextmanager
+def update_balance(agent_id: str):
+    """
+    Locked read-modify-write:
+
+        with update_balance(agent_id) as balance:
+            balance["credits"] += 100
+
+    The change is saved as a new snapshot when the block exits without raising.
+    """
+    if not get_agent_dir(agent_id).exists():
+        raise AgentNotFound(agent_id)
+    with agent_lock(agent_id):
+        balance, end, _ = _fold(agent_id, repair=True)
+        if balance is None:
+            raise AgentNotFound(agent_id)
+        credits = balance["credits"]
+        yield balance
+        _write_snapshot(agent_id, balance, end)
+        fleet.apply_ledger_delta(agent_id, balance["credits"] - credits)
+
+def create_balance(agent_id: str, balance: dict) -> dict:
+    """Store balance for a new agent; returns the existing one if another process won the race."""
+    get_agent_dir(agent_id).mkdir(parents=True, exist_ok=True)
+    with agent_lock(agent_id):
+        existing = load_balance(agent_id)
+        if existing is not None:
+            return existing
+        _write_snapshot(agent_id, balance, _journal_size(agent_id))
+        return balance
+
+def compact(agent_id: str) -> dict:
+    """Fold the journal tail into a fresh balance snapshot."""
+    with update_balance(agent_id) as balance:
+        pass
+    return balance
+
+def append_records(agent_id: str, records: list, check_credits: bool = True) -> dict:
+    """
+    Append records to the agent's journal in one locked write and return the
+    resulting balance. With check_credits, raises InsufficientCredits instead
+    of letting the balance go negative. Records with cost_picos but no
+    cost_credits get cost_credits filled in.
+    """
+    if not get_agent_dir(agent_id).exists():
+        raise AgentNotFound(agent_id)
+    with agent_lock(agent_id):
+        balance, end, tail = _fold(agent_id, repair=True)
+        if balance is None:
+            raise AgentNotFound(agent_id)
+        _bill_picos(balance, records)
+        required = sum(_net_cost(r) for r in records)
+        if check_credits and balance["credits"] < required:
+            raise InsufficientCredits(required, balance["credits"])
+        _journal(agent_id).append(records)
+        for record in records:
+            _apply(balance, record)
+        if tail + len(records) >= COMPACT_EVERY:
+            _write_snapshot(agent_id, balance, _journal_size(agent_id))
+        balance["journal_offset"] = _journal_size(agent_id)
+        fleet.apply_ledger_delta(agent_id, -required)
+    return balance
+
+def usage_record(model: str, usage: dict, cost_credits: int = None, **extra) -> dict:
+    """
+    Build a journal record for one call. Pass cost_picos (exact) instead of
+    cost_credits to have the ledger bill it against the carried remainder.
+    """
+    record = {
+        "ts": round(time.time(), 3),
+        "model": model,
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+    }
+    if cost_credits is not None:
+        record["cost_credits"] = cost_credits
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached_tokens:
+        record["cached_tokens"] = cached_tokens
+    record.update(extra)
+    return record
+
+def record_usage(agent_id: str, model: str, usage: dict, cost_credits: int) -> dict:
+    """Journal one call and deduct its cost; raises InsufficientCredits if unaffordable."""
+    return append_records(agent_id, [usage_record(model, usage, cost_credits)])
+
+def debit(agent_id: str, credits: int) -> dict:
+    """Atomically deduct credits; raises InsufficientCredits without changing anything."""
+    return append_records(agent_id, [{"ts": round(time.time(), 3), "cost_credits": credits}])
+
+def reserve(agent_id: str, credits: int) -> dict:
+    """
+    Hold credits for a call before it is made; raises InsufficientCredits if
+    the agent can't cover them. Returns the reservation to pass to settle()
+    or release().
+    """
+    reservation = {"ts": round(time.time(), 3), "type": "reserve",
+                   "reservation": os.urandom(8).hex(), "cost_credits": credits}
+    append_records(agent_id, [reservation])
+    return reservation
+
+def settle(agent_id: str, reservation: dict, record: dict) -> dict:
+    """
+    Replace a reservation with the call's usage record (from usage_record)
+    and return the new balance; the record's cost_credits is filled in when
+    it was priced in cost_picos.
+    """
+    record.update(reservation=reservation["reservation"], released_credits=reservation["cost_credits"])
+    return append_records(agent_id, [record], check_credits=False)
+
+def release(agent_id: str, reservation: dict) -> dict:
+    """Give back a reservation whose call never completed."""
+    record = {"ts": round(time.time(), 3), "type": "release", "reservation": reservation["reservation"],
+              "released_credits": reservation["cost_credits"]}
+    return append_records(agent_id, [record], check_credits=False)
+
+def adjust(agent_id: str, credits: int, **extra) -> dict:
+    """Book a correction (positive charges, negative refunds); never refused for lack of credits."""
+    record = {"ts": round(time.time(), 3), "type": "adjustment", "cost_credits": credits, **extra}
+    return append_records(agent_id, [record], check_credits=False)
+
+# inotify(7) event masks
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_LEDGER_FILES = {"balance.json", "usage.jsonl"}
+
+class ChangeFeed:
+    """
+    Wakes up when an agent's balance snapshot or journal changes.
+
+        feed = ChangeFeed(agent_id)
+        while feed.wait():
+            balance = load_balance(agent_id)
+
+    Uses inotify on the agent directory where available (snapshots are
+    renamed into place, so the directory is watched rather than the file),
+    and falls back to polling file sizes and mtimes.
+    """
+
+    def __init__(self, agent_id: str, poll_interval: float = 1.0):
+        self.agent_dir = get_agent_dir(agent_id)
+        if not self.agent_dir.exists():
+            raise AgentNotFound(agent_id)
+        self.poll_interval = poll_interval
+        self.fd = self._inotify()
+        self.signature = self._signature()
+
+    def _inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(fd, str(self.agent_dir).encode(), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _signature(self):
+        signature = []
+        for name in sorted(_LEDGER_FILES):
+            try:
+                st = os.stat(self.agent_dir / name)
+                signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except FileNotFoundError:
+                signature.append(None)
+        return signature
+
+    def _drain(self) -> bool:
+        """Read pending inotify events; True if any touched a ledger file."""
+        changed = False
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        pos = 0
+        while pos + 16 <= len(data):
+            _, _, _, length = struct.unpack_from("iIII", data, pos)
+            name = data[pos + 16:pos + 16 + length].rstrip(b"\0").decode(errors="replace")
+            changed = changed or name in _LEDGER_FILES
+            pos += 16 + length
+        return changed
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the ledger changes (True) or timeout seconds pass (False)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if self.fd is not None:
+                ready, _, _ = select.select([self.fd], [], [], remaining)
+                if ready and self._drain():
+                    return True
+            else:
+                time.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+                signature = self._signature()
+                if signature != self.signature:
+                    self.signature = signature
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def main():
+    # Parse args
+    args = {"command": sys.argv[1] if len(sys.argv) > 1 else None, "agent_id": None, "limit": 20}
+    for i in range(2, len(sys.argv)):
+        if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
+            args["agent_id"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--limit" and i + 1 < len(sys.argv):
+            args["limit"] = int(sys.argv[i + 1])
+
+    if args["command"] not in ("history", "compact") or not args["agent_id"]:
+        print("Usage: python3 ledger.py history --agent-id <id> [--limit <n>]")
+        print("       python3 ledger.py compact --agent-id <id>")
+        sys.exit(1)
+
+    agent_id = args["agent_id"]
+    if load_balance(agent_id) is None:
+        print(f"❌ Agent '{agent_id}' not found. Run check_balance.py first.")
+        sys.exit(1)
+
+    if args["command"] == "compact":
+        balance = compact(agent_id)
+        print(f"\n🗜️  Compacted journal for {agent_id}")
+        print(f"   Snapshot offset: {balance['journal_offset']:,} bytes")
+        print(f"💰 Credits: {balance['credits']:,}")
+        return
+
+    records = [record for _, record in read_journal(agent_id)][-args["limit"]:]
+    print(f"\n📜 Usage history for {agent_id} (last {len(records)})")
+    for r in records:
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["ts"]))
+        label = r.get("model", r.get("type", "-"))
+        print(f"   {when}  {label:<36} "
+              f"in={r.get('prompt_tokens', 0):>6,} out={r.get('completion_tokens', 0):>6,} "
+              f"cost={r.get('cost_credits', 0):>8,}"
+              + (f" cached_in={r['cached_tokens']:,}" if r.get("cached_tokens") else "")
+              + (f" released={r['released_credits']:,}" if r.get("released_credits") else "")
+              + (" (cached)" if r.get("cache_hit") else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Call instrumentation: phase timings, per-model latency and throughput
+histograms, token and credit counters, error counts.
+
+Disabled by default; every hook is then a no-op. Enable with any of:
+
+  USDC_OPENROUTER_METRICS=1        collect in memory (agentd serves GET /metrics)
+  USDC_OPENROUTER_METRICS_FILE     OpenMetrics text file, merged across processes
+                                   at exit (for node_exporter's textfile collector)
+  USDC_OPENROUTER_METRICS_LOG      JSON log line per call: a file path, or - for stderr
+
+Phases: http (request until the response is read), decode (JSON parse),
+ttfb (stream time to first delta), cost, reserve, settle, ledger_write,
+ratelimit (waiting for the shared rate limiter).
+Connect and TLS time are part of http; the pooled session reuses
+connections, so they only show up on the first call per connection.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_FILE = os.getenv("USDC_OPENROUTER_METRICS_FILE")
+METRICS_LOG = os.getenv("USDC_OPENROUTER_METRICS_LOG")
+ENABLED = bool(os.getenv("USDC_OPENROUTER_METRICS") or METRICS_FILE or METRICS_LOG)
+
+PREFIX = "usdc_openrouter"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TPS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+HELP = {
+    "call_duration_seconds": ("histogram", LATENCY_BUCKETS, "End-to-end call latency"),
+    "phase_duration_seconds": ("histogram", LATENCY_BUCKETS, "Time spent per call phase"),
+    "output_tokens_per_second": ("histogram", TPS_BUCKETS, "Completion tokens per second of call time"),
+    "calls": ("counter", None, "Calls by model and outcome"),
+    "tokens": ("counter", None, "Tokens by model and kind"),
+    "credits_burned": ("counter", None, "Credits charged by model"),
+    "errors": ("counter", None, "Failed calls by model and error type"),
+    "http_retries": ("counter", None, "Retried HTTP attempts by status"),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_local = threading.local()
+
+def enable():
+    """Turn collection on for this process (agentd does this to serve /metrics)."""
+    global ENABLED
+    ENABLED = True
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+def inc(name: str, value: float = 1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name: str, value: float, **labels):
+    if not ENABLED:
+        return
+    buckets = HELP[name][1]
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+class _NoopPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopPhase()
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        observe("phase_duration_seconds", elapsed, phase=self.name)
+        phases = getattr(_local, "phases", None)
+        if phases is not None:
+            phases[self.name] = phases.get(self.name, 0.0) + elapsed
+        return False
+
+def phase(name: str):
+    """Time a block as one phase of the current call: `with metrics.phase("http"): ...`"""
+    return _Phase(name) if ENABLED else _NOOP
+
+def mark(name: str, elapsed: float):
+    """Record a phase measured elsewhere (e.g. time to first streamed delta)."""
+    if not ENABLED:
+        return
+    observe("phase_duration_seconds", elapsed, phase=name)
+    phases = getattr(_local, "phases", None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + elapsed
+
+@contextmanager
+def call_span():
+    """Collect this thread's phase timings for one call; yields the {phase: seconds} dict."""
+    if not ENABLED:
+        yield {}
+        return
+    previous = getattr(_local, "phases", None)
+    _local.phases = {}
+    try:
+        yield _local.phases
+    finally:
+        _local.phases = previous
+
+def record_call(model: str, latency: float, usage: dict = None, cost_credits: int = 0, ok: bool = True,
+                error: str = None, phases: dict = None, **fields):
+    """Count one finished (or failed) call and write its JSON log line."""
+    if not ENABLED:
+        return
+    usage = usage or {}
+    completion_tokens = usage.get("completion_tokens", 0)
+    inc("calls", model=model, outcome="ok" if ok else "error")
+    if ok:
+        observe("call_duration_seconds", latency, model=model)
+        inc("tokens", usage.get("prompt_tokens", 0), model=model, kind="prompt")
+        inc("tokens", completion_tokens, model=model, kind="completion")
+        inc("credits_burned", cost_credits, model=model)
+        if completion_tokens and latency > 0:
+            observe("output_tokens_per_second", completion_tokens / latency, model=model)
+    else:
+        inc("errors", model=model, error=error or "unknown")
+    if METRICS_LOG:
+        log({
+            "ts": round(time.time(), 3),
+            "event": "call",
+            "model": model,
+            "ok": ok,
+            "error": error,
+            "latency": round(latency, 6),
+            "phases": {k: round(v, 6) for k, v in (phases or {}).items()},
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": completion_tokens,
+            "cost_credits": cost_credits,
+            **fields,
+        })
+
+def log(event: dict):
+    """Write one structured JSON log line."""
+    line = json.dumps(event, separators=(",", ":")) + "\n"
+    if METRICS_LOG == "-":
+        sys.stderr.write(line)
+    else:
+        with open(METRICS_LOG, "a") as f:
+            f.write(line)
+
+def snapshot() -> dict:
+    """Current values as a JSON-serializable dict (used to merge across processes)."""
+    with _lock:
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "histograms": [[name, list(labels), list(h)] for (name, labels), h in _histograms.items()],
+        }
+
+def _merge(state: dict, other: dict) -> dict:
+    counters = {(n, tuple(map(tuple, l))): v for n, l, v in state.get("counters", [])}
+    histograms = {(n, tuple(map(tuple, l))): h for n, l, h in state.get("histograms", [])}
+    for n, l, v in other["counters"]:
+        key = (n, tuple(map(tuple, l)))
+        counters[key] = counters.get(key, 0) + v
+    for n, l, h in other["histograms"]:
+        key = (n, tuple(map(tuple, l)))
+        histograms[key] = [a + b for a, b in zip(histograms[key], h)] if key in histograms else h
+    return {
+        "counters": [[n, list(l), v] for (n, l), v in counters.items()],
+        "histograms": [[n, list(l), h] for (n, l), h in histograms.items()],
+    }
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels, le: str = None) -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if le is not None:
+        parts.append(f'le="{le}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def render(state: dict = None) -> str:
+    """OpenMetrics text exposition of state (default: this process's metrics)."""
+    state = state or snapshot()
+    by_name = {}
+    for name, labels, value in state["counters"]:
+        by_name.setdefault(name, []).append((labels, value))
+    for name, labels, h in state["histograms"]:
+        by_name.setdefault(name, []).append((labels, h))
+    lines = []
+    for name in sorted(by_name):
+        kind, buckets, help_text = HELP[name]
+        metric = f"{PREFIX}_{name}"
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.append(f"# HELP {metric} {help_text}")
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            labels = [tuple(l) for l in labels]
+            if kind == "counter":
+                lines.append(f"{metric}_total{_labels(labels)} {value}")
+                continue
+            for bound, count in zip(buckets, value):
+                lines.append(f"{metric}_bucket{_labels(labels, bound)} {count}")
+            lines.append(f"{metric}_bucket{_labels(labels, '+Inf')} {value[-1]}")
+            lines.append(f"{metric}_sum{_labels(labels)} {round(value[-2], 6)}")
+            lines.append(f"{metric}_count{_labels(labels)} {value[-1]}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+@atexit.register
+def write_file():
+    """Fold this process's metrics into METRICS_FILE (and its .json state) under a lock."""
+    if not (ENABLED and METRICS_FILE):
+        return
+    current = snapshot()
+    if not current["counters"] and not current["histograms"]:
+        return
+    path = Path(METRICS_FILE)
+    state_file = path.with_name(path.name + ".json")
+    fd = os.open(path.with_name(path.name + ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            state = json.loads(state_file.read_text())
+        except (FileNotFoundError, ValueError):
+            state = {}
+        state = _merge(state, current)
+        for target, text in ((state_file, json.dumps(state)), (path, render(state))):
+            tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+            tmp.write_text(text)
+            os.replace(tmp, target)
+        with _lock:
+            _counters.clear()
+            _histograms.clear()
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
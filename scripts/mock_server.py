@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenRouter API, for load testing the real client
+path (pooling, retries, streaming, concurrency) on an offline box.
+
+Serves under /api/v1:
+    POST chat/completions    JSON or SSE (stream: true), with usage; repeated
+                             prompt prefixes report cached_tokens
+    GET  credits             USD purchased / used
+    POST credits/coinbase    Coinbase charge for {amount, sender, chain_id}
+    GET  models              models list with pricing (ETag / 304)
+POST /rpc is a Base Sepolia JSON-RPC stand-in for onchain.py (single and
+batch requests): eth_chainId, eth_blockNumber (one block per 2s), and
+eth_call to the USDC contract's balanceOf or to Multicall3's aggregate3.
+Every address holds a fixed pseudo-random balance.
+GET /stats returns request and injected-failure counters.
+
+Point the scripts at it:
+
+    python3 scripts/mock_server.py --port 8787 --latency lognormal:0.2,0.5 --rate-limit-rate 0.05
+    export OPENROUTER_BASE_URL=http://127.0.0.1:8787/api/v1
+    export OPENROUTER_API_KEY=sk-or-mock AGENT_PRIVATE_KEY=0xmock
+    export BASE_SEPOLIA_RPC_URL=http://127.0.0.1:8787/rpc
+
+Latencies and completion lengths take a distribution spec: a number, or
+fixed:<x>, uniform:<lo>,<hi>, normal:<mean>,<sd>, lognormal:<median>,<sigma>,
+exponential:<mean>. --model-latency adds a per-model delay before a
+completion's first byte (repeatable), for tail-latency and hedging tests.
+--seed makes the sampled sequence reproducible. --usage-markup bills
+usage that much above list price (0.02 = 2%), so the local ledger drifts
+from /credits for reconcile.py to catch.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import onchain
+import pricing
+import tokens
+
+API_PREFIX = "/api/v1"
+PREFIX_CACHE_SIZE = 4096
+WORDS = ("the", "agent", "paid", "for", "compute", "with", "testnet", "credits", "and", "got", "an", "answer")
+
+def parse_distribution(spec: str):
+    """Return a function rng -> sample for a distribution spec (see module docstring)."""
+    kind, _, params = spec.partition(":")
+    if not params:
+        value = float(kind)
+        return lambda rng: value
+    values = [float(v) for v in params.split(",")]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: values[0] * math.exp(rng.gauss(0.0, values[1]))
+    if kind == "exponential":
+        return lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Unknown distribution '{spec}'")
+
+class MockState:
+    """Settings, seeded randomness and counters shared by all handler threads."""
+
+    def __init__(self, args: dict):
+        self.latency = parse_distribution(args["latency"])
+        self.model_latency = {model: parse_distribution(spec) for model, spec in args["model_latency"].items()}
+        self.token_delay = args["token_delay"]
+        self.completion_tokens = parse_distribution(args["completion_tokens"])
+        self.error_rate = args["error_rate"]
+        self.rate_limit_rate = args["rate_limit_rate"]
+        self.retry_after = args["retry_after"]
+        self.rng = random.Random(args["seed"])
+        self.lock = threading.Lock()
+        self.usage_markup = args["usage_markup"]
+        self.total_credits = 100 * pricing.PICO_PER_USD  # pico-USD, reported in USD like the real API
+        self.total_usage = 0
+        self.prefixes = {}  # hash of a cached prompt prefix -> None, oldest first
+        self.stats = {"requests": 0, "completions": 0, "streams": 0, "errors_injected": 0,
+                      "rate_limited": 0, "charges": 0, "cached_prompts": 0,
+                      "cancelled": 0, "rpc_requests": 0, "rpc_calls": 0}
+        self.started = time.time()
+
+    def sample(self, dist) -> float:
+        with self.lock:
+            return dist(self.rng)
+
+    def roll(self) -> str:
+        """Decide this request's injected outcome: None, "error" or "rate_limit"."""
+        with self.lock:
+            self.stats["requests"] += 1
+            r = self.rng.random()
+            if r < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return "rate_limit"
+            if r < self.rate_limit_rate + self.error_rate:
+                self.stats["errors_injected"] += 1
+                return "error"
+            return None
+
+    def cached_prefix(self, messages: list, model: str) -> int:
+        """
+        Tokens of messages served from the simulated prompt cache. Like the
+        providers, a prompt is cached up to its last cache_control block (or,
+        for providers that cache automatically, up to its final message) and
+        later prompts to the same model hit the longest cached prefix, markers
+        ignored. The newest PREFIX_CACHE_SIZE prefixes are kept.
+        """
+        breakpoint = 0
+        digests = []
+        digest = hashlib.sha256(model.encode())
+        for i, message in enumerate(messages):
+            content = message.get("content")
+            if isinstance(content, list):
+                if any(block.get("cache_control") for block in content):
+                    breakpoint = i + 1
+                content = tokens.message_text(message)
+            digest.update(json.dumps([message.get("role"), content]).encode())
+            digests.append(digest.copy().hexdigest())
+        if not breakpoint and not model.startswith(("anthropic/", "google/")):
+            breakpoint = len(messages) - 1
+        with self.lock:
+            hit = next((i for i in range(breakpoint, 0, -1) if digests[i - 1] in self.prefixes), 0)
+            if breakpoint:
+                self.prefixes.pop(digests[breakpoint - 1], None)
+                self.prefixes[digests[breakpoint - 1]] = None
+                while len(self.prefixes) > PREFIX_CACHE_SIZE:
+                    del self.prefixes[next(iter(self.prefixes))]
+            if hit:
+                self.stats["cached_prompts"] += 1
+        return tokens.count_message_tokens(messages[:hit], model) if hit else 0
+
+    def count(self, name: str, usage_picos: int = 0):
+        with self.lock:
+            self.stats[name] += 1
+            self.total_usage += usage_picos
+
+STATE = None
+
+def _usdc_balance(address: str) -> int:
+    """A fixed balance in 0-100 USDC (6 decimals) per address."""
+    return int(hashlib.sha256(address.lower().encode()).hexdigest()[:12], 16) % 100_000_001
+
+def _eth_call(to: str, data: str) -> str:
+    """Answer balanceOf on the USDC contract and aggregate3 on Multicall3; raises ValueError otherwise."""
+    raw = bytes.fromhex(data[2:] if data.startswith("0x") else data)
+    selector, args = raw[:4].hex(), raw[4:]
+
+    def word(at: int) -> int:
+        return int.from_bytes(args[at:at + 32], "big")
+
+    if to.lower() == onchain.USDC_ADDRESS.lower() and selector == onchain.BALANCE_OF:
+        return "0x" + f"{_usdc_balance('0x' + args[12:32].hex()):064x}"
+    if to.lower() == onchain.MULTICALL3_ADDRESS.lower() and selector == onchain.AGGREGATE3:
+        results = []
+        array = word(0)
+        count = word(array)
+        for i in range(count):
+            item = array + 32 + word(array + 32 + 32 * i)
+            target = "0x" + args[item + 12:item + 32].hex()
+            data_at = item + word(item + 64)
+            call = args[data_at + 32:data_at + 32 + word(data_at)]
+            try:
+                results.append((True, bytes.fromhex(_eth_call(target, "0x" + call.hex())[2:])))
+            except ValueError:
+                if not word(item + 32):
+                    raise
+                results.append((False, b""))
+        # (bool success, bytes returnData)[]
+        heads, tails, offset = [], [], 32 * len(results)
+        for success, ret in results:
+            tail = (f"{int(success):064x}" + f"{64:064x}" + f"{len(ret):064x}"
+                    + ret.hex().ljust((len(ret) + 31) // 32 * 64, "0"))
+            heads.append(f"{offset:064x}")
+            tails.append(tail)
+            offset += len(tail) // 2
+        return "0x" + f"{32:064x}" + f"{len(results):064x}" + "".join(heads) + "".join(tails)
+    raise ValueError("execution reverted")
+
+def _rpc(request: dict) -> dict:
+    method = request.get("method")
+    params = request.get("params") or []
+    response = {"jsonrpc": "2.0", "id": request.get("id")}
+    try:
+        if method == "eth_chainId":
+            response["result"] = hex(onchain.CHAIN_ID)
+        elif method == "eth_blockNumber":
+            response["result"] = hex(20_000_000 + int((time.time() - STATE.started) / 2))
+        elif method == "eth_call":
+            response["result"] = _eth_call(params[0]["to"], params[0].get("data") or params[0].get("input", ""))
+        else:
+            response["error"] = {"code": -32601, "message": f"Method {method} not found"}
+    except (ValueError, KeyError, IndexError) as e:
+        response["error"] = {"code": 3 if str(e) == "execution reverted" else -32602, "message": str(e)}
+    return response
+
+def _models_json() -> dict:
+    return {"data": [{
+        "id": model,
+        "pricing": {
+            "prompt": f"{price['input'] / 1_000_000:.12f}",
+            "completion": f"{price['output'] / 1_000_000:.12f}",
+            "input_cache_read": f"{pricing.get_price(model)['cache_read'] / 1_000_000:.12f}",
+            "request": "0",
+            "image": "0",
+        },
+    } for model, price in sorted(pricing.MODEL_PRICING.items())]}
+
+def _iso(when: datetime) -> str:
+    return when.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def end_headers(self):
+        # Lets clients tell simulated responses from real ones (e.g. to keep them out of caches)
+        self.send_header("X-Mock-Server", "1")
+        super().end_headers()
+
+    def _send(self, status: int, data: dict, headers: dict = None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _preamble(self) -> bool:
+        """Auth check, injected failures and latency; False if a response was already sent."""
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._send(401, {"error": {"code": 401, "message": "No auth credentials found"}})
+            return False
+        outcome = STATE.roll()
+        if outcome == "rate_limit":
+            self._send(429, {"error": {"code": 429, "message": "Rate limit exceeded"}},
+                       {"Retry-After": str(STATE.retry_after)})
+            return False
+        if outcome == "error":
+            self._send(502, {"error": {"code": 502, "message": "Injected upstream error"}})
+            return False
+        time.sleep(STATE.sample(STATE.latency))
+        return True
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with STATE.lock:
+                self._send(200, dict(STATE.stats))
+            return
+        if self.path == f"{API_PREFIX}/models":
+            body = _models_json()
+            etag = '"' + hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send(200, body, {"ETag": etag})
+            return
+        if self.path == f"{API_PREFIX}/credits":
+            if not self._preamble():
+                return
+            with STATE.lock:
+                data = {"total_credits": STATE.total_credits / pricing.PICO_PER_USD,
+                        "total_usage": STATE.total_usage / pricing.PICO_PER_USD}
+            self._send(200, {"data": data})
+            return
+        self._send(404, {"error": {"code": 404, "message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send(400, {"error": {"code": 400, "message": "Invalid JSON body"}})
+            return
+        if self.path == "/rpc":
+            requests = body if isinstance(body, list) else [body]
+            with STATE.lock:
+                STATE.stats["rpc_requests"] += 1
+                STATE.stats["rpc_calls"] += len(requests)
+            time.sleep(STATE.sample(STATE.latency))
+            responses = [_rpc(r) for r in requests]
+            self._send(200, responses if isinstance(body, list) else responses[0])
+        elif self.path == f"{API_PREFIX}/chat/completions":
+            if self._preamble():
+                self._chat(body)
+        elif self.path == f"{API_PREFIX}/credits/coinbase":
+            if self._preamble():
+                self._charge(body)
+        else:
+            self._send(404, {"error": {"code": 404, "message": f"Unknown path {self.path}"}})
+
+    def _chat(self, body: dict):
+        model = body.get("model", pricing.DEFAULT_MODEL)
+        if model in STATE.model_latency:
+            time.sleep(STATE.sample(STATE.model_latency[model]))
+        messages = body.get("messages") or []
+        n = max(1, round(STATE.sample(STATE.completion_tokens)))
+        max_tokens = body.get("max_tokens")
+        finish_reason = "length" if max_tokens and n > max_tokens else "stop"
+        if max_tokens:
+            n = min(n, max_tokens)
+        words = [WORDS[i % len(WORDS)] for i in range(n)]
+        content = " ".join(words)
+        prompt_tokens = tokens.count_message_tokens(messages, model)
+        completion_tokens = tokens.count_tokens(content, model)
+        cached_tokens = min(STATE.cached_prefix(messages, model), prompt_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens,
+                 "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+        price = pricing.get_price_exact(model)
+        cost = ((prompt_tokens - cached_tokens) * price["input"] + cached_tokens * price["cache_read"]
+                + completion_tokens * price["output"] + price["request"])
+        cost = round(cost * (1 + STATE.usage_markup))
+        usage["cost"] = cost / pricing.PICO_PER_USD
+        gen_id = f"gen-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            STATE.count("completions", cost)
+            self._send(200, {
+                "id": gen_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+
+        STATE.count("streams", cost)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._write_chunk(b": OPENROUTER PROCESSING\n\n")
+            for i, word in enumerate(words):
+                if i and STATE.token_delay:
+                    time.sleep(STATE.token_delay)
+                chunk = {"id": gen_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                      "finish_reason": None}]}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            final = {"id": gen_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}
+            if (body.get("usage") or {}).get("include"):
+                final["usage"] = usage
+            self._write_chunk(f"data: {json.dumps(final)}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cut the stream off (e.g. spend cap reached, or a hedge won)
+            STATE.count("cancelled")
+            self.close_connection = True
+
+    def _charge(self, body: dict):
+        if "amount" not in body or "sender" not in body:
+            self._send(400, {"error": {"code": 400, "message": "amount and sender are required"}})
+            return
+        STATE.count("charges")
+        now = datetime.now(timezone.utc)
+        self._send(200, {"data": {
+            "id": f"charge_{uuid.uuid4().hex[:20]}",
+            "created_at": _iso(now),
+            "expires_at": _iso(now + timedelta(minutes=30)),
+            "web3_data": {
+                "transfer_intent": {
+                    "call_data": {
+                        "deadline": _iso(now + timedelta(minutes=25)),
+                        "fee_amount": "0.0005",
+                        "id": f"tx_{uuid.uuid4().hex[:20]}",
+                        "operator": "0xOperator1234567890abcdef1234567890abcdef",
+                        "prefix": "0x",
+                        "recipient": "0xRecipient0987654321fedcba0987654321fedcba",
+                        "recipient_amount": str(body["amount"]),
+                        "recipient_currency": "USDC",
+                        "refund_destination": body["sender"],
+                        "signature": "0x" + os.urandom(32).hex(),
+                    },
+                    "metadata": {
+                        "chain_id": body.get("chain_id", 84532),
+                        "contract_address": "0x036CbD53842c5426634e7929541eC2318f3dCF7e",
+                        "sender": body["sender"],
+                    },
+                },
+            },
+        }})
+
+    def log_message(self, format, *args):
+        if os.getenv("MOCK_SERVER_VERBOSE"):
+            super().log_message(format, *args)
+
+def main():
+    global STATE
+    # Parse args
+    args = {"host": "127.0.0.1", "port": 8787, "latency": "0", "token_delay": 0.0, "completion_tokens": "64",
+            "error_rate": 0.0, "rate_limit_rate": 0.0, "retry_after": 1, "seed": None, "model_latency": {},
+            "usage_markup": 0.0}
+    for i in range(1, len(sys.argv)):
+        if sys.argv[i] == "--host" and i + 1 < len(sys.argv):
+            args["host"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--port" and i + 1 < len(sys.argv):
+            args["port"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--latency" and i + 1 < len(sys.argv):
+            args["latency"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--model-latency" and i + 1 < len(sys.argv):
+            model, _, spec = sys.argv[i + 1].partition("=")
+            args["model_latency"][model] = spec
+        elif sys.argv[i] == "--token-delay" and i + 1 < len(sys.argv):
+            args["token_delay"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--completion-tokens" and i + 1 < len(sys.argv):
+            args["completion_tokens"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--error-rate" and i + 1 < len(sys.argv):
+            args["error_rate"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--rate-limit-rate" and i + 1 < len(sys.argv):
+            args["rate_limit_rate"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--retry-after" and i + 1 < len(sys.argv):
+            args["retry_after"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--usage-markup" and i + 1 < len(sys.argv):
+            args["usage_markup"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--seed" and i + 1 < len(sys.argv):
+            args["seed"] = int(sys.argv[i + 1])
+        elif sys.argv[i] in ("-h", "--help"):
+            print("Usage: python3 mock_server.py [--host <host>] [--port <port>] [--seed <n>]")
+            print("       [--latency <dist>] [--model-latency <model>=<dist> ...] [--token-delay <seconds>]")
+            print("       [--completion-tokens <dist>]")
+            print("       [--error-rate <0-1>] [--rate-limit-rate <0-1>] [--retry-after <seconds>]")
+            print("       [--usage-markup <ratio>]")
+            sys.exit(0)
+
+    # Prices come from the bundled table (or a cached catalog); never revalidate the catalog against ourselves
+    os.environ.pop("OPENROUTER_API_KEY", None)
+    try:
+        STATE = MockState(args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    server = ThreadingHTTPServer((args["host"], args["port"]), Handler)
+    server.daemon_threads = True
+    base_url = f"http://{args['host']}:{args['port']}{API_PREFIX}"
+    print(f"\n🧪 Mock OpenRouter listening on {base_url}")
+    print(f"   export OPENROUTER_BASE_URL={base_url}")
+    print(f"   export OPENROUTER_API_KEY=sk-or-mock AGENT_PRIVATE_KEY=0xmock")
+    print(f"   export BASE_SEPOLIA_RPC_URL=http://{args['host']}:{args['port']}/rpc")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
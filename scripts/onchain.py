@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+On-chain USDC balances for agent wallets on Base Sepolia.
+
+Reads balanceOf(wallet) from the testnet USDC contract over JSON-RPC,
+packing many wallets into few round trips:
+
+- JSON-RPC batches: up to RPC_BATCH_SIZE eth_calls per HTTP request.
+- --multicall: up to MULTICALL_SIZE balanceOf calls folded into a single
+  eth_call to Multicall3's aggregate3, falling back to batches if the
+  Multicall3 call fails.
+
+Every read is pinned to one block number, and balances are cached per
+block in .cache/onchain.json: asking again within the same block (Base
+makes one every ~2s) costs at most an eth_blockNumber call.
+
+Point BASE_SEPOLIA_RPC_URL at scripts/mock_server.py's /rpc for offline
+tests. Testnet only.
+
+Usage:
+    python3 onchain.py balance (--agent-id <id> | --address <0x...>) [--multicall]
+    python3 onchain.py sync (--all | --agents <id,id,...>) [--fleet] [--multicall]
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import http_client
+import ledger
+from pricing import CACHE_DIR
+
+RPC_URL = os.getenv("BASE_SEPOLIA_RPC_URL", "https://sepolia.base.org")
+CHAIN_ID = 84532
+USDC_ADDRESS = "0x036CbD53842c5426634e7929541eC2318f3dCF7e"
+USDC_DECIMALS = 6
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+BALANCE_OF = "70a08231"  # balanceOf(address)
+AGGREGATE3 = "82ad56cb"  # aggregate3((address,bool,bytes)[])
+
+RPC_BATCH_SIZE = int(os.getenv("RPC_BATCH_SIZE", "100"))
+MULTICALL_SIZE = int(os.getenv("MULTICALL_SIZE", "500"))
+# The block number is reused for this long before asking the node again
+BLOCK_TIME = float(os.getenv("BASE_BLOCK_TIME", "2.0"))
+
+CACHE_FILE = CACHE_DIR / "onchain.json"
+
+class RPCError(Exception):
+    pass
+
+def is_address(value: str) -> bool:
+    if not isinstance(value, str) or len(value) != 42 or not value.startswith("0x"):
+        return False
+    try:
+        int(value[2:], 16)
+    except ValueError:
+        return False
+    return True
+
+def _word(value: int) -> str:
+    return f"{value:064x}"
+
+def _address_word(address: str) -> str:
+    return address[2:].lower().rjust(64, "0")
+
+def balance_of_data(address: str) -> str:
+    return BALANCE_OF + _address_word(address)
+
+def encode_aggregate3(calls: list) -> str:
+    """ABI-encode aggregate3 calldata for [(target, allow_failure, calldata_hex), ...]."""
+    heads = []
+    tails = []
+    offset = 32 * len(calls)
+    for target, allow_failure, data in calls:
+        data = bytes.fromhex(data)
+        padded = data.hex().ljust((len(data) + 31) // 32 * 64, "0")
+        tail = _address_word(target) + _word(int(allow_failure)) + _word(96) + _word(len(data)) + padded
+        heads.append(_word(offset))
+        tails.append(tail)
+        offset += len(tail) // 2
+    return "0x" + AGGREGATE3 + _word(32) + _word(len(calls)) + "".join(heads) + "".join(tails)
+
+def decode_aggregate3(result: str) -> list:
+    """Decode aggregate3's (bool success, bytes returnData)[] into [(success, bytes), ...]."""
+    raw = bytes.fromhex(result[2:] if result.startswith("0x") else result)
+
+    def word(at: int) -> int:
+        return int.from_bytes(raw[at:at + 32], "big")
+
+    array = word(0)
+    count = word(array)
+    base = array + 32
+    results = []
+    for i in range(count):
+        item = base + word(base + 32 * i)
+        success = bool(word(item))
+        data_at = item + word(item + 32)
+        length = word(data_at)
+        results.append((success, raw[data_at + 32:data_at + 32 + length]))
+    return results
+
+def _post(payload):
+    try:
+        response = http_client.get_session().post(RPC_URL, json=payload, timeout=http_client.READ_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        # requests and httpx raise unrelated exception types; callers only need to know the node failed
+        raise RPCError(f"{type(e).__name__}: {e}") from e
+
+def rpc(method: str, params: list):
+    data = _post({"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
+    if data.get("error"):
+        raise RPCError(data["error"].get("message", data["error"]))
+    return data["result"]
+
+def rpc_batch(calls: list) -> list:
+    """Send [(method, params), ...] as one JSON-RPC batch; results in order (RPCError for failed calls)."""
+    data = _post([{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)])
+    if isinstance(data, dict):
+        # Some nodes answer a rejected batch with a single error object
+        raise RPCError((data.get("error") or {}).get("message", "batch rejected"))
+    by_id = {item.get("id"): item for item in data}
+    results = []
+    for i in range(len(calls)):
+        item = by_id.get(i) or {"error": {"message": "missing from batch response"}}
+        results.append(RPCError(item["error"].get("message")) if item.get("error") else item["result"])
+    return results
+
+class BalanceCache:
+    """balanceOf results for one block, shared across processes through CACHE_FILE."""
+
+    def __init__(self, path: Path = CACHE_FILE):
+        self.path = path
+        try:
+            data = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            data = {}
+        if data.get("rpc_url") != RPC_URL or data.get("token") != USDC_ADDRESS:
+            data = {}
+        self.block = data.get("block")
+        self.block_seen_at = data.get("block_seen_at", 0.0)
+        self.balances = data.get("balances", {})
+        self.dirty = False
+
+    def current_block(self) -> int:
+        if self.block is None or time.time() - self.block_seen_at >= BLOCK_TIME:
+            block = int(rpc("eth_blockNumber", []), 16)
+            if block != self.block:
+                self.block = block
+                self.balances = {}
+            self.block_seen_at = time.time()
+            self.dirty = True
+        return self.block
+
+    def save(self):
+        if self.dirty:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            ledger.atomic_write(self.path, json.dumps({
+                "rpc_url": RPC_URL, "token": USDC_ADDRESS, "block": self.block,
+                "block_seen_at": self.block_seen_at, "balances": self.balances,
+            }))
+            self.dirty = False
+
+def _fetch_batched(addresses: list, block_tag: str) -> dict:
+    balances = {}
+    for start in range(0, len(addresses), RPC_BATCH_SIZE):
+        chunk = addresses[start:start + RPC_BATCH_SIZE]
+        results = rpc_batch([("eth_call", [{"to": USDC_ADDRESS, "data": "0x" + balance_of_data(a)}, block_tag])
+                             for a in chunk])
+        for address, result in zip(chunk, results):
+            if isinstance(result, RPCError):
+                raise result
+            balances[address] = int(result, 16) if result not in ("0x", None) else 0
+    return balances
+
+def _fetch_multicall(addresses: list, block_tag: str) -> dict:
+    balances = {}
+    chunks = [addresses[i:i + MULTICALL_SIZE] for i in range(0, len(addresses), MULTICALL_SIZE)]
+    # Several aggregate3 calls still go out as one batch
+    for start in range(0, len(chunks), RPC_BATCH_SIZE):
+        group = chunks[start:start + RPC_BATCH_SIZE]
+        results = rpc_batch([("eth_call", [{"to": MULTICALL3_ADDRESS, "data": encode_aggregate3(
+            [(USDC_ADDRESS, True, balance_of_data(a)) for a in chunk])}, block_tag]) for chunk in group])
+        for chunk, result in zip(group, results):
+            if isinstance(result, RPCError):
+                raise result
+            for address, (success, data) in zip(chunk, decode_aggregate3(result)):
+                if not success:
+                    raise RPCError(f"balanceOf({address}) reverted")
+                balances[address] = int.from_bytes(data, "big") if data else 0
+    return balances
+
+def get_balances(addresses: list, multicall: bool = False, cache: BalanceCache = None) -> dict:
+    """
+    {address: USDC balance} for many wallets at the latest block, in whole
+    USDC. Addresses already cached for this block aren't fetched again.
+    """
+    cache = cache or BalanceCache()
+    block_tag = hex(cache.current_block())
+    wanted = list(dict.fromkeys(a.lower() for a in addresses))
+    missing = [a for a in wanted if a not in cache.balances]
+    if missing:
+        fetched = None
+        if multicall:
+            try:
+                fetched = _fetch_multicall(missing, block_tag)
+            except (RPCError, ValueError):
+                fetched = None
+        if fetched is None:
+            fetched = _fetch_batched(missing, block_tag)
+        cache.balances.update(fetched)
+        cache.dirty = True
+    cache.save()
+    return {a: cache.balances[a.lower()] / 10 ** USDC_DECIMALS for a in addresses}
+
+def get_balance(address: str, multicall: bool = False) -> float:
+    return get_balances([address], multicall)[address]
+
+def _agent_wallets(args: dict, store=None) -> dict:
+    """{agent_id: wallet_address} for the agents named on the command line."""
+    wanted = [a for a in (args["agents"] or args["agent_id"] or "").split(",") if a]
+    if store is not None:
+        wallets = {a["agent_id"]: a["wallet_address"] for a in store.list_agents()}
+        return {a: wallets[a] for a in wanted if a in wallets} if wanted else wallets
+    if args["all"]:
+        wanted = sorted(p.parent.name for p in Path("agents").glob("*/balance.json"))
+    wallets = {}
+    for agent_id in wanted:
+        balance = ledger.load_balance(agent_id)
+        if balance is None:
+            print(f"❌ Agent '{agent_id}' not found. Run check_balance.py first.")
+            sys.exit(1)
+        wallets[agent_id] = balance["wallet_address"]
+    return wallets
+
+def sync(wallets: dict, multicall: bool = False, store=None) -> dict:
+    """Write on-chain balances into usdc_balance (agent files, or the fleet store); returns {agent_id: usdc}."""
+    balances = get_balances([w for w in wallets.values() if is_address(w)], multicall)
+    onchain = {agent_id: balances[w] for agent_id, w in wallets.items() if is_address(w)}
+    if store is not None:
+        store.set_usdc(onchain)
+        return onchain
+    for agent_id, usdc in onchain.items():
+        if ledger.load_balance(agent_id)["usdc_balance"] != usdc:
+            with ledger.update_balance(agent_id) as balance:
+                balance["usdc_balance"] = usdc
+    return onchain
+
+def main():
+    # Parse args
+    args = {"command": sys.argv[1] if len(sys.argv) > 1 else None, "agent_id": None, "address": None,
+            "agents": None, "all": False, "fleet": False, "multicall": False}
+    for i in range(2, len(sys.argv)):
+        if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
+            args["agent_id"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--address" and i + 1 < len(sys.argv):
+            args["address"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--agents" and i + 1 < len(sys.argv):
+            args["agents"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--all":
+            args["all"] = True
+        elif sys.argv[i] == "--fleet":
+            args["fleet"] = True
+        elif sys.argv[i] == "--multicall":
+            args["multicall"] = True
+
+    command = args["command"]
+    if command not in ("balance", "sync") \
+            or (command == "balance" and not (args["agent_id"] or args["address"])) \
+            or (command == "sync" and not (args["all"] or args["agents"] or args["fleet"])):
+        print("Usage: python3 onchain.py balance (--agent-id <id> | --address <0x...>) [--multicall]")
+        print("       python3 onchain.py sync (--all | --agents <id,id,...>) [--fleet] [--multicall]")
+        sys.exit(1)
+
+    try:
+        if command == "balance":
+            address = args["address"] or _agent_wallets(args)[args["agent_id"]]
+            if not is_address(address):
+                print(f"❌ Not a wallet address: {address}")
+                sys.exit(1)
+            usdc = get_balance(address, args["multicall"])
+            print(f"\n⛓️  {address}")
+            print(f"💰 USDC Balance: {usdc:.6f} (Base Sepolia, on-chain)")
+
+        elif command == "sync":
+            store = None
+            if args["fleet"]:
+                import fleet
+                store = fleet.FleetStore()
+            wallets = _agent_wallets(args, store)
+            started = time.monotonic()
+            onchain = sync(wallets, args["multicall"], store)
+            skipped = len(wallets) - len(onchain)
+            print(f"\n⛓️  Synced {len(onchain):,} wallets in {time.monotonic() - started:.2f}s "
+                  f"({'multicall' if args['multicall'] else 'batched'} JSON-RPC)")
+            print(f"   Total: {sum(onchain.values()):,.6f} USDC on-chain")
+            if skipped:
+                print(f"   ⚠️  {skipped:,} agents without a valid wallet address skipped")
+    except RPCError as e:
+        print(f"❌ RPC error ({RPC_URL}): {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -7,66 +7,134 @@ Testnet only - uses demo API key, no real charges.
 import json
 import os
 import sys
-from pathlib import Path
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-# Demo pricing per 1K tokens (approximate, for hackathon demo)
-MODEL_PRICING = {
-    "openai/gpt-4o-mini": {"input": 0.15, "output": 0.60},  # per 1M tokens
-    "openai/gpt-4o": {"input": 2.50, "output": 10.00},
-    "anthropic/claude-3.5-sonnet": {"input": 3.00, "output": 15.00},
-    "anthropic/claude-3-haiku": {"input": 0.25, "output": 1.25},
-    "google/gemini-flash-1.5": {"input": 0.075, "output": 0.30},
-    "meta-llama/llama-3.1-8b-instruct": {"input": 0.02, "output": 0.02},
-}
+import daemon_client
+import http_client
+import ledger
+import metrics
+import pricing
+import ratelimit
+import response_cache
+import router
+import sessions
+import tokens
+from pricing import MODEL_PRICING
 
-def get_agent_dir(agent_id: str) -> Path:
-    return Path(f"agents/{agent_id}")
+# Output cap sent as max_tokens; bounds the pre-flight cost estimate
+DEFAULT_MAX_TOKENS = 1024
+# Output cap for --summarize calls that fold trimmed session turns into a summary
+SUMMARY_MAX_TOKENS = 512
+# Hedge once a call has waited longer than this percentile of the model's recent
+# time to first token; HEDGE_DEFAULT_AFTER seconds until enough calls are observed
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_AFTER = float(os.getenv("HEDGE_DEFAULT_AFTER", "2.0"))
 
 def load_balance(agent_id: str) -> dict:
-    balance_file = get_agent_dir(agent_id) / "balance.json"
-    if not balance_file.exists():
+    try:
+        balance = daemon_client.call("balance", agent_id=agent_id) if daemon_client.enabled() \
+            else ledger.load_balance(agent_id)
+    except ledger.AgentNotFound:
+        balance = None
+    except daemon_client.DaemonError as e:
+        print(f"❌ agentd error: {e}")
+        sys.exit(1)
+    if balance is None:
         print(f"❌ Agent '{agent_id}' not found. Run check_balance.py first.")
         sys.exit(1)
-    return json.loads(balance_file.read_text())
+    return balance
 
-def save_balance(agent_id: str, balance: dict):
-    balance_file = get_agent_dir(agent_id) / "balance.json"
-    balance_file.write_text(json.dumps(balance, indent=2))
+def cost_in_picos(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> int:
+    """Exact cost in pico-USD (1e-12). cached_tokens of the input are billed at the cached-input rate."""
+    price = pricing.get_price_exact(model)
+    return ((input_tokens - cached_tokens) * price["input"] + cached_tokens * price["cache_read"]
+            + output_tokens * price["output"] + price["request"])
 
-def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calculate cost in USDC cents."""
-    pricing = MODEL_PRICING.get(model, MODEL_PRICING["openai/gpt-4o-mini"])
-    
-    input_cost = (input_tokens / 1000000) * pricing["input"] * 100  # cents
-    output_cost = (output_tokens / 1000000) * pricing["output"] * 100
+def calculate_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """Cost in USDC cents, for display; billing uses the exact integer cost."""
+    return cost_in_picos(model, input_tokens, output_tokens, cached_tokens) / 10 ** 10
+
+def cached_tokens(usage: dict) -> int:
+    """Prompt tokens the provider served from its prompt cache."""
+    return (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+def usage_cost_picos(model: str, usage: dict) -> int:
+    """Exact cost of a call's token usage in pico-USD; this is what the ledger bills."""
+    return cost_in_picos(model, usage["prompt_tokens"], usage["completion_tokens"], cached_tokens(usage))
+
+def cost_in_credits(model: str, usage: dict) -> int:
+    """Convert a call's token usage into credits (1 credit = $0.000001), rounded down; for estimates and caps."""
+    return usage_cost_picos(model, usage) // ledger.PICOS_PER_CREDIT
+
+def user_messages(prompt: str, messages: list = None) -> list:
+    """The chat messages for a request: an explicit list, or the prompt as a single user turn."""
+    return messages if messages is not None else [{"role": "user", "content": prompt}]
+
+def estimate_max_cost(model: str, prompt: str, max_tokens: int, messages: list = None) -> int:
+    """
+    Upper-bound credits for a call before it is made: the tokenized prompt
+    plus a 10% margin for tokenizer drift, and output at the full max_tokens.
+    """
+    prompt_tokens = tokens.count_message_tokens(user_messages(prompt, messages), model) * 11 // 10 + 1
+    return cost_in_credits(model, {"prompt_tokens": prompt_tokens, "completion_tokens": max_tokens}) + 1
+
+def request_cache_key(prompt: str, model: str, max_tokens: int, messages: list = None) -> str:
+    """Response-cache key for a request to the configured endpoint."""
+    return response_cache.cache_key(model, user_messages(prompt, messages), {"max_tokens": max_tokens},
+                                    http_client.OPENROUTER_BASE_URL)
+
+def cacheable(result: dict) -> bool:
+    """Only complete, real responses are cached: never cut-off, demo-mode or mock-server ones."""
+    return not (result.get("aborted") or result.get("demo_mode") or result.get("mock"))
+
+def mock_response_text(prompt: str) -> str:
+    """Canned demo-mode reply for a prompt."""
+    mock_responses = {
+        "meaning of life": "The meaning of life is a philosophical question concerning the significance of living or existence in general. Many philosophical and religious traditions suggest that life's meaning is found in achieving virtue, happiness, or connection with others.",
+        "hello": "Hello! I'm an AI assistant running on OpenRouter. How can I help you today?",
+        "default": f"This is a mock response to: '{prompt[:50]}...' Set OPENROUTER_API_KEY for real API calls."
+    }
     
-    return input_cost + output_cost
+    prompt_lower = prompt.lower()
+    for key in mock_responses:
+        if key in prompt_lower:
+            return mock_responses[key]
+    return mock_responses["default"]
 
-def make_openrouter_call(prompt: str, model: str) -> dict:
+def acquire_rate_limit(agent_id: str, model: str, prompt: str, max_tokens: int, messages: list = None,
+                       max_wait: float = ratelimit.MAX_WAIT):
+    """Wait for the shared rate limiter to admit this request (a no-op when no limits are set)."""
+    if not ratelimit.enabled():
+        return ratelimit.NO_LIMIT
+    request_tokens = tokens.count_message_tokens(user_messages(prompt, messages), model) + max_tokens
+    with metrics.phase("ratelimit"):
+        return ratelimit.acquire(agent_id, model, request_tokens, max_wait)
+
+def hedge_delay(model: str, percentile: float = HEDGE_PERCENTILE) -> float:
+    """Seconds to wait for a first token from model before hedging."""
+    observed = router.ttfb_percentile(model, percentile)
+    return observed if observed is not None else HEDGE_DEFAULT_AFTER
+
+def make_openrouter_call(prompt: str, model: str, max_tokens: int = None, messages: list = None) -> dict:
     """
     Make OpenRouter API call.
     Uses OPENROUTER_API_KEY env var if available, otherwise returns mock response.
+    messages, if given, is sent instead of the prompt as a single user turn.
     """
     api_key = os.getenv("OPENROUTER_API_KEY")
+    messages = sessions.messages_for_model(messages, model)
     
     if not api_key:
         # Demo mode - return mock response
-        mock_responses = {
-            "meaning of life": "The meaning of life is a philosophical question concerning the significance of living or existence in general. Many philosophical and religious traditions suggest that life's meaning is found in achieving virtue, happiness, or connection with others.",
-            "hello": "Hello! I'm an AI assistant running on OpenRouter. How can I help you today?",
-            "default": f"This is a mock response to: '{prompt[:50]}...' Set OPENROUTER_API_KEY for real API calls."
-        }
+        response_text = mock_response_text(prompt)
+        if max_tokens:
+            response_text = response_text[:max_tokens * 4]
         
-        prompt_lower = prompt.lower()
-        response_text = mock_responses["default"]
-        for key in mock_responses:
-            if key in prompt_lower:
-                response_text = mock_responses[key]
-                break
-        
-        # Estimate tokens (rough approximation: 1 token ≈ 4 chars)
-        input_tokens = len(prompt) // 4
-        output_tokens = len(response_text) // 4
+        # Count tokens locally with the model's tokenizer
+        input_tokens = tokens.count_message_tokens(user_messages(prompt, messages), model)
+        output_tokens = tokens.count_tokens(response_text, model)
         
         return {
             "content": response_text,
@@ -79,37 +147,584 @@ def make_openrouter_call(prompt: str, model: str) -> dict:
             }
         }
     
-    # Production: Make actual API call
-    import requests
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/cubo-ai/usdc-openrouter-skill-hackathon",
-        "X-Title": "USDC OpenRouter Skill"
-    }
+    # Production: Make actual API call over the shared pooled session
     data = {
         "model": model,
-        "messages": [{"role": "user", "content": prompt}]
+        "messages": user_messages(prompt, messages)
     }
+    if max_tokens:
+        data["max_tokens"] = max_tokens
     
-    response = requests.post(url, headers=headers, json=data)
-    result = response.json()
+    with metrics.phase("http"):
+        response = http_client.request("POST", "chat/completions", api_key=api_key, json=data)
+    response.raise_for_status()
+    with metrics.phase("decode"):
+        result = response.json()
+    content = result["choices"][0]["message"]["content"]
+    
+    if "usage" in result:
+        usage = result["usage"]
+    else:
+        prompt_tokens = tokens.count_message_tokens(data["messages"], model)
+        completion_tokens = tokens.count_tokens(content, model)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
     
     return {
-        "content": result["choices"][0]["message"]["content"],
+        "content": content,
         "model": model,
         "demo_mode": False,
-        "usage": result.get("usage", {
-            "prompt_tokens": len(prompt) // 4,
-            "completion_tokens": len(result["choices"][0]["message"]["content"]) // 4,
-            "total_tokens": (len(prompt) + len(result["choices"][0]["message"]["content"])) // 4
-        })
+        "mock": http_client.is_mock(response),
+        "usage": usage
     }
 
+def stream_openrouter_call(prompt: str, model: str, max_credits: int, on_text, max_tokens: int = None,
+                           messages: list = None, deadline: float = None, on_response=None) -> dict:
+    """
+    Make a streaming OpenRouter API call, passing each text delta to on_text
+    as it arrives. Final usage comes from the stream's usage chunk.
+
+    The stream is cut off before the running cost of the output would exceed
+    max_credits; the result then has "aborted": True and usage estimated
+    from the text actually received. deadline (a time.monotonic() value)
+    bounds the request's timeouts; on_response(response) gets the open
+    response so another thread can abort it. The result's "ttfb" is the
+    time to the first text delta.
+    """
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    # Fallback and hedge models may be from a provider the session's cache breakpoints weren't built for
+    messages = sessions.messages_for_model(messages, model)
+    prompt_tokens = tokens.count_message_tokens(user_messages(prompt, messages), model)
+    completion_tokens = 0
+    ttfb = None
+    
+    if not api_key:
+        # Demo mode - replay the mock response word by word
+        response_text = mock_response_text(prompt)
+        if max_tokens:
+            response_text = response_text[:max_tokens * 4]
+        words = response_text.split(" ")
+        deltas = (word if i == 0 else " " + word for i, word in enumerate(words))
+        usage_chunk = None
+        response = None
+    else:
+        data = {
+            "model": model,
+            "messages": user_messages(prompt, messages),
+            "stream": True,
+            "usage": {"include": True}
+        }
+        if max_tokens:
+            data["max_tokens"] = max_tokens
+        started = time.perf_counter()
+        with metrics.phase("http"):
+            response = http_client.request("POST", "chat/completions", api_key=api_key, json=data, stream=True,
+                                           deadline=deadline)
+        if on_response:
+            on_response(response)
+        response.raise_for_status()
+        usage_chunk = {}
+        
+        def deltas():
+            nonlocal ttfb
+            for chunk in http_client.iter_sse(response):
+                if chunk.get("usage"):
+                    usage_chunk.update(chunk["usage"])
+                for choice in chunk.get("choices", []):
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        if ttfb is None:
+                            ttfb = time.perf_counter() - started
+                            metrics.mark("ttfb", ttfb)
+                        yield content
+        deltas = deltas()
+    
+    text = ""
+    aborted = False
+    try:
+        for delta in deltas:
+            # Count per delta so metering stays linear in the output length
+            delta_tokens = tokens.count_tokens(delta, model)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens + delta_tokens}
+            if cost_in_credits(model, usage) > max_credits:
+                aborted = True
+                break
+            completion_tokens += delta_tokens
+            text += delta
+            on_text(delta)
+    finally:
+        if response is not None:
+            response.close()
+    
+    if usage_chunk and not aborted:
+        usage = usage_chunk
+    else:
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    
+    return {
+        "content": text,
+        "model": model,
+        "demo_mode": not api_key,
+        "mock": response is not None and http_client.is_mock(response),
+        "aborted": aborted,
+        "ttfb": ttfb,
+        "usage": usage
+    }
+
+class _Cancelled(Exception):
+    """Raised inside a hedged attempt's stream once the other attempt has won."""
+
+def hedged_call(prompt: str, model: str, max_credits: dict, on_text=None, max_tokens: int = None,
+                messages: list = None, deadline: float = None, hedge_model: str = None,
+                hedge_after: float = None, on_hedge=None) -> dict:
+    """
+    Stream a call with a hard deadline and optional hedging.
+
+    If no text has arrived from model after hedge_after seconds, the same
+    request goes to hedge_model as well (when on_hedge(hedge_model) allows
+    it) and whichever produces text first wins; the other stream is aborted.
+    Only the winner's deltas reach on_text. max_credits maps each model to
+    its spend cap. The result is the winner's, with "hedged" set when the
+    duplicate was sent and "hedge_won" when the duplicate won.
+
+    Raises http_client.DeadlineExceeded if nothing arrived by the deadline;
+    a winner still streaming at the deadline is cut off and returned with
+    "aborted": True and "deadline_exceeded": True.
+    """
+    lock = threading.Lock()
+    changed = threading.Event()
+    winner = []
+    attempts = []
+    
+    def start(attempt_model: str):
+        attempt = {"model": attempt_model, "response": None, "text": "", "result": None, "error": None,
+                   "done": False, "cancelled": False}
+        
+        def forward(delta: str):
+            with lock:
+                if not winner:
+                    winner.append(attempt)
+                    changed.set()
+            # Also stops a stream that abort() couldn't interrupt (httpx over HTTP/2)
+            if winner[0] is not attempt or attempt["cancelled"]:
+                raise _Cancelled()
+            attempt["text"] += delta
+            if on_text:
+                on_text(delta)
+        
+        def set_response(response):
+            attempt["response"] = response
+            if winner and winner[0] is not attempt:
+                http_client.abort(response)
+        
+        def run():
+            try:
+                attempt["result"] = stream_openrouter_call(prompt, attempt_model, max_credits[attempt_model], forward,
+                                                           max_tokens, messages, deadline, set_response)
+            except Exception as e:
+                attempt["error"] = e
+            with lock:
+                attempt["done"] = True
+                # A reply with no text at all still wins if nothing else has
+                if attempt["result"] is not None and not winner:
+                    winner.append(attempt)
+            changed.set()
+        
+        attempts.append(attempt)
+        threading.Thread(target=run, daemon=True).start()
+    
+    def wait_for(until: float) -> bool:
+        """Wait until there's a winner, every attempt is done, or until; True unless timed out."""
+        while not winner and not all(a["done"] for a in attempts):
+            remaining = None if until is None else until - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            changed.wait(remaining)
+            changed.clear()
+        return True
+    
+    def abort(attempt: dict):
+        attempt["cancelled"] = True
+        if attempt["response"] is not None:
+            http_client.abort(attempt["response"])
+    
+    start(model)
+    hedged = False
+    if hedge_model and hedge_after is not None:
+        hedge_at = time.monotonic() + hedge_after
+        if deadline is None or hedge_at < deadline:
+            if not wait_for(hedge_at) and (on_hedge is None or on_hedge(hedge_model)):
+                hedged = True
+                start(hedge_model)
+    finished = wait_for(deadline)
+    
+    if not winner:
+        for attempt in attempts:
+            abort(attempt)
+        if not finished:
+            raise http_client.DeadlineExceeded(f"no response from {', '.join(a['model'] for a in attempts)} "
+                                               f"before the deadline")
+        raise attempts[0]["error"]
+    
+    won = winner[0]
+    for attempt in attempts:
+        if attempt is not won:
+            abort(attempt)
+    
+    # The winner streams on until it finishes or the deadline cuts it off
+    while not won["done"]:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            abort(won)
+            with lock:
+                won["done"] = True
+            prompt_tokens = tokens.count_message_tokens(user_messages(prompt, messages), won["model"])
+            completion_tokens = tokens.count_tokens(won["text"], won["model"]) if won["text"] else 0
+            return {"content": won["text"], "model": won["model"], "demo_mode": not os.getenv("OPENROUTER_API_KEY"),
+                    "aborted": True,
+                    "deadline_exceeded": True, "hedged": hedged, "hedge_won": won is not attempts[0], "ttfb": None,
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens}}
+        changed.wait(remaining)
+        changed.clear()
+    if won["result"] is None:
+        raise won["error"]
+    return dict(won["result"], hedged=hedged, hedge_won=won is not attempts[0])
+
+def run_call(agent_id: str, prompt: str, candidates: list, max_tokens: int = DEFAULT_MAX_TOKENS,
+             cache: response_cache.ResponseCache = None, on_text=None, on_fallback=None,
+             messages: list = None, deadline: float = None, hedge_model: str = None,
+             hedge_percentile: float = HEDGE_PERCENTILE) -> dict:
+    """
+    Run one prompt end to end: cache lookup, pre-flight reservation, the call
+    (falling back through candidates on errors) and settlement.
+
+    With on_text the response is streamed through it. on_fallback(model, error)
+    is called when a candidate fails and the next one is tried. messages
+    (e.g. from a session) replaces the single user turn. Raises
+    ledger.InsufficientCredits when the reservation can't be made.
+
+    deadline (seconds) bounds the whole call, fallbacks included. With
+    hedge_model, a duplicate request goes to it once the first token is later
+    than hedge_percentile of the model's recent calls; the slower one is
+    cancelled and only the winner is billed (see hedged_call).
+
+    Returns {"result", "model", "cost_credits", "cost_cents", "balance",
+    "cache_hit", "saved_credits"}.
+    """
+    model = candidates[0]
+    
+    # Identical requests are answered from the cache at zero cost
+    key = request_cache_key(prompt, model, max_tokens, messages) if cache else None
+    cached = cache.get(key) if cache else None
+    if cached is not None:
+        saved_credits = cost_in_credits(model, cached["usage"])
+        cache.record_hit(saved_credits)
+        metrics.inc("calls", model=model, outcome="cache_hit")
+        balance = ledger.append_records(agent_id, [ledger.usage_record(model, cached["usage"], 0, cache_hit=True)])
+        if on_text:
+            on_text(cached["content"])
+        return {"result": dict(cached, model=model), "model": model, "cost_credits": 0, "cost_cents": 0.0,
+                "balance": balance, "cache_hit": True, "saved_credits": saved_credits}
+    if cache:
+        cache.record_miss()
+    
+    deadline_at = time.monotonic() + deadline if deadline is not None else None
+    for attempt, model in enumerate(candidates):
+        with metrics.call_span() as phases:
+            # Pre-flight: reserve the worst-case cost before any network round trip
+            estimate = estimate_max_cost(model, prompt, max_tokens, messages)
+            with metrics.phase("reserve"):
+                reservation = ledger.reserve(agent_id, estimate)
+            caps = {model: estimate}
+            hedge = {}
+            
+            def on_hedge(hedge_to: str) -> bool:
+                # The duplicate needs its own reservation and rate-limit slot, or it isn't sent
+                hedge_estimate = estimate_max_cost(hedge_to, prompt, max_tokens, messages)
+                try:
+                    hedge["reservation"] = ledger.reserve(agent_id, hedge_estimate)
+                except ledger.InsufficientCredits:
+                    return False
+                try:
+                    hedge["ticket"] = acquire_rate_limit(agent_id, hedge_to, prompt, max_tokens, messages, 0)
+                except ratelimit.RateLimited:
+                    ledger.release(agent_id, hedge.pop("reservation"))
+                    return False
+                caps[hedge_to] = max(caps.get(hedge_to, 0), hedge_estimate)
+                return True
+            
+            def release_hedge():
+                if "reservation" in hedge:
+                    ledger.release(agent_id, hedge.pop("reservation"))
+                if "ticket" in hedge:
+                    ratelimit.settle(hedge.pop("ticket"), 0)
+            
+            started = time.monotonic()
+            ticket = None
+            try:
+                ticket = acquire_rate_limit(agent_id, model, prompt, max_tokens, messages)
+                started = time.monotonic()
+                if deadline_at is not None or hedge_model:
+                    result = hedged_call(prompt, model, caps, on_text, max_tokens, messages, deadline_at, hedge_model,
+                                         hedge_delay(model, hedge_percentile) if hedge_model else None, on_hedge)
+                elif on_text:
+                    result = stream_openrouter_call(prompt, model, estimate, on_text, max_tokens, messages)
+                else:
+                    result = make_openrouter_call(prompt, model, max_tokens, messages)
+            except Exception as e:
+                if ticket:
+                    ratelimit.settle(ticket, 0)
+                release_hedge()
+                ledger.release(agent_id, reservation)
+                router.record(model, ok=False)
+                metrics.record_call(model, time.monotonic() - started, ok=False, error=type(e).__name__,
+                                    phases=phases, agent_id=agent_id)
+                out_of_time = deadline_at is not None and time.monotonic() >= deadline_at
+                if attempt + 1 < len(candidates) and not out_of_time:
+                    if on_fallback:
+                        on_fallback(model, e)
+                    continue
+                raise
+            except BaseException:
+                release_hedge()
+                ledger.release(agent_id, reservation)
+                raise
+            latency = time.monotonic() - started
+            used_tokens = result["usage"]["prompt_tokens"] + result["usage"]["completion_tokens"]
+            if result.get("hedge_won"):
+                # Only the winner is billed: swap the primary's reservation and slot for the hedge's
+                ratelimit.settle(ticket, 0)
+                ledger.release(agent_id, reservation)
+                ticket = hedge.pop("ticket")
+                reservation = hedge.pop("reservation")
+                model = result["model"]
+            ratelimit.settle(ticket, used_tokens)
+            release_hedge()
+            if not result.get("demo_mode"):
+                # Simulated responses would teach the router meaningless latencies
+                router.record(model, latency, result["usage"]["completion_tokens"], ttfb=result.get("ttfb"))
+            
+            # Calculate cost and swap the reservation for it
+            with metrics.phase("cost"):
+                cost_cents = calculate_cost(model, result["usage"]["prompt_tokens"],
+                                            result["usage"]["completion_tokens"], cached_tokens(result["usage"]))
+                usage_record = ledger.usage_record(model, result["usage"],
+                                                   cost_picos=usage_cost_picos(model, result["usage"]),
+                                                   latency_ms=round(latency * 1000))
+            with metrics.phase("settle"):
+                balance = ledger.settle(agent_id, reservation, usage_record)
+            cost_credits = usage_record["cost_credits"]
+            metrics.record_call(model, latency, result["usage"], cost_credits, phases=phases, agent_id=agent_id,
+                                streamed=bool(on_text), aborted=result.get("aborted", False))
+        break
+    
+    if cache and cacheable(result):
+        cache.put(key, {k: result[k] for k in ("content", "usage", "demo_mode")})
+    
+    return {"result": result, "model": model, "cost_credits": cost_credits, "cost_cents": cost_cents,
+            "balance": balance, "cache_hit": False, "saved_credits": 0}
+
+def read_batch(source: str):
+    """
+    Yield prompt requests from a JSONL file, or stdin when source is "-".
+    Each line is {"prompt": ..., "model": ..., "id": ...}; model and id are optional.
+    """
+    stream = sys.stdin if source == "-" else open(source)
+    try:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def run_batch(agent_id: str, requests_iter, default_model: str, concurrency: int, out,
+              max_tokens: int = DEFAULT_MAX_TOKENS, cache: response_cache.ResponseCache = None,
+              budget: int = None, max_latency: float = None, tier: str = None) -> dict:
+    """
+    Run prompts through a bounded worker pool, streaming one JSONL result per
+    prompt to `out` as calls finish.
+
+    Each prompt's maximum cost is reserved in the ledger before it is
+    dispatched and settled as soon as its call returns, exactly like a single
+    call, so concurrent spenders can't overdraw the agent and a crash leaves
+    finished calls billed. A prompt that can't be reserved waits for
+    in-flight calls to settle and is skipped without a request if there is
+    still not enough. With model "auto" each prompt is routed within
+    budget/max_latency/tier. With a cache, hits are answered immediately at
+    zero cost.
+    """
+    load_balance(agent_id)
+    summary = {"completed": 0, "failed": 0, "skipped": 0, "cache_hits": 0, "cost_credits": 0}
+
+    def run_one(index: int, request: dict, model: str, reservation: dict, key: str) -> dict:
+        record = {"index": index, "id": request.get("id", index), "model": model, "cache_key": key}
+        with metrics.call_span() as phases:
+            started = time.monotonic()
+            request_max_tokens = request.get("max_tokens", max_tokens)
+            ticket = None
+            try:
+                ticket = acquire_rate_limit(agent_id, model, request["prompt"], request_max_tokens)
+                started = time.monotonic()
+                result = make_openrouter_call(request["prompt"], model, request_max_tokens)
+            except Exception as e:
+                if ticket:
+                    ratelimit.settle(ticket, 0)
+                ledger.release(agent_id, reservation)
+                record["error"] = f"{type(e).__name__}: {e}"
+                metrics.record_call(model, time.monotonic() - started, ok=False, error=type(e).__name__,
+                                    phases=phases, agent_id=agent_id, batch=True)
+                return record
+            except BaseException:
+                ledger.release(agent_id, reservation)
+                raise
+            latency = time.monotonic() - started
+            ratelimit.settle(ticket, result["usage"]["prompt_tokens"] + result["usage"]["completion_tokens"])
+            usage_record = ledger.usage_record(model, result["usage"],
+                                               cost_picos=usage_cost_picos(model, result["usage"]),
+                                               latency_ms=round(latency * 1000))
+            with metrics.phase("settle"):
+                ledger.settle(agent_id, reservation, usage_record)
+            cost_credits = usage_record["cost_credits"]
+            record.update(
+                content=result["content"],
+                usage=result["usage"],
+                cost_credits=cost_credits,
+                demo_mode=result.get("demo_mode", False),
+                mock=result.get("mock", False),
+            )
+            metrics.record_call(model, latency, result["usage"], cost_credits,
+                                phases=phases, agent_id=agent_id, batch=True)
+        return record
+
+    def emit(record: dict):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    def finish(done):
+        for future in done:
+            record = future.result()
+            key = record.pop("cache_key")
+            if "error" in record:
+                summary["failed"] += 1
+            else:
+                summary["completed"] += 1
+                summary["cost_credits"] += record["cost_credits"]
+                if cache and cacheable(record):
+                    cache.put(key, {k: record[k] for k in ("content", "usage", "demo_mode")})
+            emit(record)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = set()
+        for index, request in enumerate(requests_iter):
+            request_id = request.get("id", index)
+            model = request.get("model", default_model)
+            request_max_tokens = request.get("max_tokens", max_tokens)
+            if model == "auto":
+                route = router.route(lambda m: estimate_max_cost(m, request["prompt"], request_max_tokens),
+                                     budget, max_latency, tier)
+                if not route:
+                    summary["skipped"] += 1
+                    emit({"index": index, "id": request_id, "model": model,
+                          "error": "Skipped: no model fits the routing constraints"})
+                    continue
+                model = route[0]["model"]
+            key = None
+            if cache:
+                key = request_cache_key(request["prompt"], model, request_max_tokens)
+                cached = cache.get(key)
+                if cached:
+                    cache.record_hit(cost_in_credits(model, cached["usage"]))
+                    metrics.inc("calls", model=model, outcome="cache_hit")
+                    summary["completed"] += 1
+                    summary["cache_hits"] += 1
+                    ledger.append_records(agent_id, [ledger.usage_record(model, cached["usage"], 0, cache_hit=True)])
+                    emit(dict(cached, index=index, id=request_id, model=model, cost_credits=0, cache_hit=True))
+                    continue
+                cache.record_miss()
+            estimate = estimate_max_cost(model, request["prompt"], request_max_tokens)
+            reservation = None
+            while reservation is None:
+                try:
+                    with metrics.phase("reserve"):
+                        reservation = ledger.reserve(agent_id, estimate)
+                except ledger.InsufficientCredits:
+                    if not pending:
+                        break
+                    # In-flight reservations free up once their actual cost is settled
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    finish(done)
+            if reservation is None:
+                summary["skipped"] += 1
+                emit({"index": index, "id": request_id, "model": model,
+                      "estimated_credits": estimate, "error": "Skipped: insufficient credits"})
+                continue
+            pending.add(pool.submit(run_one, index, request, model, reservation, key))
+            # Keep the queue bounded so huge inputs aren't read into memory up front
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finish(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            finish(done)
+
+    summary["remaining_credits"] = ledger.load_balance(agent_id)["credits"]
+    return summary
+
+def main_batch(args: dict):
+    agent_id = args["agent_id"]
+    out = sys.stdout if args["output"] == "-" else open(args["output"], "w")
+    log = sys.stderr if out is sys.stdout else sys.stdout
+
+    print(f"\n🤖 Agent: {agent_id}", file=log)
+    print(f"📦 Batch: {args['batch']} (concurrency {args['concurrency']})", file=log)
+
+    cache = response_cache.ResponseCache(agent_id, ttl=args["cache_ttl"]) if args["cache"] else None
+    try:
+        summary = run_batch(agent_id, read_batch(args["batch"]), args["model"], args["concurrency"], out,
+                            args["max_tokens"], cache, args["budget"], args["max_latency"], args["tier"])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"\n📊 Batch Summary:", file=log)
+    print(f"   Completed: {summary['completed']:,}", file=log)
+    print(f"   Failed: {summary['failed']:,}", file=log)
+    print(f"   Skipped: {summary['skipped']:,}", file=log)
+    if cache:
+        print(f"   Cache hits: {summary['cache_hits']:,}", file=log)
+    print(f"   Cost: {summary['cost_credits']:,} credits", file=log)
+    print(f"\n💰 Remaining credits: {summary['remaining_credits']:,}", file=log)
+
+def session_summarizer(agent_id: str, model: str):
+    """A sessions.Session.trim summarizer that makes a normal, billed call to model."""
+    def summarize(previous: str, dropped: list) -> str:
+        transcript = "\n".join(f"{m['role']}: {tokens.message_text(m)}" for m in dropped)
+        prompt = ("Summarize this conversation in a few sentences, keeping facts, decisions and open "
+                  "questions needed to continue it.\n\n"
+                  + (f"Earlier summary:\n{previous}\n\n" if previous else "")
+                  + f"Conversation:\n{transcript}")
+        call = run_call(agent_id, prompt, [model], SUMMARY_MAX_TOKENS)
+        return call["result"]["content"]
+    return summarize
+
 def main():
     # Parse args
-    args = {"agent_id": None, "model": "openai/gpt-4o-mini", "prompt": None}
+    args = {"agent_id": None, "model": "openai/gpt-4o-mini", "prompt": None,
+            "batch": None, "concurrency": 8, "output": "-", "stream": False,
+            "max_tokens": DEFAULT_MAX_TOKENS, "cache": False, "cache_ttl": response_cache.DEFAULT_TTL,
+            "budget": None, "max_latency": None, "tier": None,
+            "session": None, "system": None, "window": None, "summarize": False, "reset": False,
+            "deadline": None, "hedge_model": None, "hedge_percentile": HEDGE_PERCENTILE}
     for i in range(1, len(sys.argv)):
         if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
             args["agent_id"] = sys.argv[i + 1]
@@ -117,9 +732,65 @@ def main():
             args["model"] = sys.argv[i + 1]
         elif sys.argv[i] == "--prompt" and i + 1 < len(sys.argv):
             args["prompt"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--batch" and i + 1 < len(sys.argv):
+            args["batch"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--concurrency" and i + 1 < len(sys.argv):
+            args["concurrency"] = max(1, int(sys.argv[i + 1]))
+        elif sys.argv[i] == "--output" and i + 1 < len(sys.argv):
+            args["output"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--stream":
+            args["stream"] = True
+        elif sys.argv[i] == "--max-tokens" and i + 1 < len(sys.argv):
+            args["max_tokens"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--cache":
+            args["cache"] = True
+        elif sys.argv[i] == "--cache-ttl" and i + 1 < len(sys.argv):
+            args["cache"] = True
+            args["cache_ttl"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--budget" and i + 1 < len(sys.argv):
+            args["budget"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--max-latency" and i + 1 < len(sys.argv):
+            args["max_latency"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--tier" and i + 1 < len(sys.argv):
+            args["tier"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--session" and i + 1 < len(sys.argv):
+            args["session"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--system" and i + 1 < len(sys.argv):
+            args["system"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--window" and i + 1 < len(sys.argv):
+            args["window"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--summarize":
+            args["summarize"] = True
+        elif sys.argv[i] == "--reset":
+            args["reset"] = True
+        elif sys.argv[i] == "--deadline" and i + 1 < len(sys.argv):
+            args["deadline"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--hedge-model" and i + 1 < len(sys.argv):
+            args["hedge_model"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--hedge-percentile" and i + 1 < len(sys.argv):
+            args["hedge_percentile"] = float(sys.argv[i + 1])
+    
+    if args["tier"] and args["tier"] not in router.TIERS:
+        print(f"❌ Unknown tier '{args['tier']}' (choose from: {', '.join(router.TIERS)})")
+        sys.exit(1)
+    
+    if args["agent_id"] and args["batch"]:
+        unsupported = [flag for flag, key in (("--stream", "stream"), ("--session", "session"),
+                                              ("--system", "system"), ("--deadline", "deadline"),
+                                              ("--hedge-model", "hedge_model")) if args[key]]
+        if unsupported:
+            print(f"❌ {', '.join(unsupported)} can't be used with --batch")
+            sys.exit(1)
+        main_batch(args)
+        return
     
     if not args["agent_id"] or not args["prompt"]:
-        print("Usage: python3 openrouter_call.py --agent-id <id> --prompt <text> [--model <model>]")
+        print("Usage: python3 openrouter_call.py --agent-id <id> --prompt <text> [--model <model>] [--max-tokens <n>] [--stream] [--cache] [--cache-ttl <s>]")
+        print("       python3 openrouter_call.py --agent-id <id> --prompt <text> --model auto [--budget <credits>] [--max-latency <s>] [--tier cheap|mid|premium]")
+        print("       python3 openrouter_call.py --agent-id <id> --prompt <text> --session <name> [--system <text>] [--reset] [--window <tokens>] [--summarize]")
+        print("       python3 openrouter_call.py --agent-id <id> --prompt <text> [--deadline <s>] [--hedge-model <model>] [--hedge-percentile <p>]")
+        print("       python3 openrouter_call.py --agent-id <id> --batch <prompts.jsonl|-> [--concurrency <n>] [--output <results.jsonl|->]")
+        print("              [--model <model>|auto] [--max-tokens <n>] [--cache] [--budget <credits>] [--max-latency <s>] [--tier <tier>]")
         print(f"\nAvailable models:")
         for m in MODEL_PRICING:
             print(f"  - {m}")
@@ -129,41 +800,137 @@ def main():
     model = args["model"]
     prompt = args["prompt"]
     
-    # Load balance
-    balance = load_balance(agent_id)
+    max_tokens = args["max_tokens"]
+    load_balance(agent_id)
+    
+    # Conversation history: a session, or just a system prompt ahead of this one
+    session = None
+    if args["session"]:
+        try:
+            session = sessions.Session(agent_id, args["session"], args["system"], args["reset"])
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if args["window"]:
+            summary_model = pricing.DEFAULT_MODEL if model == "auto" else model
+            summarizer = session_summarizer(agent_id, summary_model) if args["summarize"] else None
+            try:
+                trimmed = session.trim(summary_model, args["window"], summarizer)
+            except ledger.InsufficientCredits as e:
+                print(f"\n❌ Insufficient credits to summarize the session ({e.available:,} available)")
+                sys.exit(1)
+            if trimmed:
+                print(f"✂️  Session trimmed: {trimmed} oldest turn{'s' if trimmed != 1 else ''}"
+                      f"{' summarized' if summarizer else ' dropped'}")
+    
+    def messages_for(m: str) -> list:
+        if session:
+            return session.build_messages(prompt, m)
+        if args["system"]:
+            return [{"role": "system", "content": args["system"]}, {"role": "user", "content": prompt}]
+        return None
+    
+    # Pick the model: fixed, or the cheapest that fits the budget/latency/tier
+    if model == "auto":
+        route = router.route(lambda m: estimate_max_cost(m, prompt, max_tokens, messages_for(m)),
+                             args["budget"], args["max_latency"], args["tier"])
+        if not route:
+            print(f"\n❌ No model fits the routing constraints")
+            budget = f"{args['budget']:,} credits" if args["budget"] is not None else "none"
+            max_latency = f"{args['max_latency']}s" if args["max_latency"] is not None else "none"
+            print(f"   Budget: {budget}, max latency: {max_latency}, tier: {args['tier'] or 'any'}")
+            sys.exit(1)
+        candidates = [c["model"] for c in route]
+    else:
+        route = None
+        candidates = [model]
+    
+    cache = None
+    if args["cache"] and not daemon_client.enabled():
+        cache = response_cache.ResponseCache(agent_id, ttl=args["cache_ttl"])
     
     # Make API call
     print(f"\n🤖 Agent: {agent_id}")
-    print(f"📤 Calling OpenRouter ({model})...")
+    if route:
+        chosen = route[0]
+        latency = f"~{chosen['latency']:.2f}s" if chosen["latency"] is not None else "latency unknown"
+        print(f"🧭 Route: {chosen['model']} ({chosen['tier']}, ≤{chosen['estimated_credits']:,} credits, {latency})")
+        if len(route) > 1:
+            print(f"   Fallbacks: {', '.join(c['model'] for c in route[1:])}")
+    print(f"📤 Calling OpenRouter ({candidates[0]})...")
     print(f"💬 Prompt: {prompt[:60]}{'...' if len(prompt) > 60 else ''}")
+    if session:
+        print(f"🧵 Session: {session.name} ({len(session.turns)} earlier turn{'s' if len(session.turns) != 1 else ''})")
+    messages = messages_for(candidates[0])
     
-    result = make_openrouter_call(prompt, model)
+    def on_fallback(failed_model: str, error: Exception):
+        print(f"\n⚠️  {failed_model} failed: {type(error).__name__}: {error}")
+        print(f"↪️  Falling back to {candidates[candidates.index(failed_model) + 1]}...")
     
-    # Calculate cost
-    cost_cents = calculate_cost(model, result["usage"]["prompt_tokens"], result["usage"]["completion_tokens"])
-    cost_credits = int(cost_cents * 10000)  # Convert to credits
-    
-    # Check if agent has enough credits
-    if balance["credits"] < cost_credits:
+    if args["stream"]:
+        print(f"\n✅ Response:")
+        print("   ", end="", flush=True)
+    try:
+        if daemon_client.enabled() and not args["stream"]:
+            call = daemon_client.call("call", agent_id=agent_id, prompt=prompt, candidates=candidates,
+                                      max_tokens=max_tokens, cache=args["cache"], cache_ttl=args["cache_ttl"],
+                                      messages=messages, deadline=args["deadline"], hedge_model=args["hedge_model"],
+                                      hedge_percentile=args["hedge_percentile"])
+        else:
+            call = run_call(agent_id, prompt, candidates, max_tokens, cache,
+                            on_text=(lambda text: print(text, end="", flush=True)) if args["stream"] else None,
+                            on_fallback=on_fallback, messages=messages, deadline=args["deadline"],
+                            hedge_model=args["hedge_model"], hedge_percentile=args["hedge_percentile"])
+    except http_client.DeadlineExceeded as e:
+        print(f"\n❌ Deadline of {args['deadline']}s exceeded: {e}")
+        print(f"   Nothing was billed")
+        sys.exit(1)
+    except ledger.InsufficientCredits as e:
         print(f"\n❌ Insufficient credits!")
-        print(f"   Required: {cost_credits:,} credits")
-        print(f"   Available: {balance['credits']:,} credits")
+        print(f"   Required: {e.required:,} credits (max estimate for {max_tokens:,} output tokens)")
+        print(f"   Available: {e.available:,} credits")
         print(f"\n   Fund wallet with testnet USDC:")
         print(f"   python3 scripts/fund_testnet_wallet.py --agent-id {agent_id}")
         sys.exit(1)
-    
-    # Deduct credits
-    balance["credits"] -= cost_credits
-    save_balance(agent_id, balance)
+    except ratelimit.RateLimited as e:
+        print(f"\n❌ Rate limited: {e}")
+        print(f"   Nothing was billed")
+        sys.exit(1)
+    except http_client.request_errors() as e:
+        print(f"\n❌ OpenRouter request failed: {type(e).__name__}: {e}")
+        print(f"   Nothing was billed")
+        sys.exit(1)
+    except daemon_client.DaemonError as e:
+        print(f"\n❌ agentd error: {e}")
+        sys.exit(1)
+    result = call["result"]
+    if session and not result.get("aborted"):
+        session.record_turn(prompt, result["content"], call["model"], result["usage"])
     
     # Display result
-    print(f"\n✅ Response:")
-    print(f"   {result['content']}")
+    if args["stream"]:
+        print()
+        if result.get("deadline_exceeded"):
+            print(f"\n⛔ Stream stopped: deadline of {args['deadline']}s reached")
+        elif result.get("aborted"):
+            print(f"\n⛔ Stream stopped: reserved credits reached")
+    else:
+        print(f"\n✅ Response:")
+        print(f"   {result['content']}")
+        if result.get("deadline_exceeded"):
+            print(f"\n⛔ Cut off: deadline of {args['deadline']}s reached")
+    if result.get("hedged"):
+        print(f"\n🏁 Hedged: {call['model']} answered first"
+              f"{' (hedge)' if result.get('hedge_won') else ''}; the other request was cancelled and not billed")
+    if call["cache_hit"]:
+        print(f"\n♻️  Cache hit: {call['saved_credits']:,} credits saved")
     print(f"\n📊 Usage:")
     print(f"   Input tokens: {result['usage']['prompt_tokens']:,}")
+    if cached_tokens(result["usage"]):
+        print(f"   Cached input tokens: {cached_tokens(result['usage']):,}")
     print(f"   Output tokens: {result['usage']['completion_tokens']:,}")
-    print(f"   Cost: {cost_credits:,} credits (${cost_cents/100:.4f} USDC)")
-    print(f"\n💰 Remaining credits: {balance['credits']:,}")
+    print(f"   Cost: {call['cost_credits']:,} credits (${call['cost_cents']/100:.6f} USDC)")
+    print(f"\n💰 Remaining credits: {call['balance']['credits']:,}")
     
     if result.get("demo_mode"):
         print(f"\n⚠️  Demo Mode: Set OPENROUTER_API_KEY for real API calls")
@@ -0,0 +1,191 @@
+"""
+Model pricing catalog.
+
+Prices come from OpenRouter's models list (GET /api/v1/models), stored in a
+compact on-disk cache and loaded once per process into a dict for O(1)
+lookup. A stale cache is revalidated with its ETag when an API key is set;
+offline, or for models the catalog doesn't know, the bundled table is used.
+
+Prices are USD: `input`/`output` per 1M tokens, `request` per call,
+`image` per input image and `cache_read` per 1M prompt tokens served from
+the provider's prompt cache. get_price_exact() gives the same prices as
+integers in pico-USD (1e-12 USD), per token or per call, so cost math
+stays exact.
+
+Usage:
+    python3 pricing.py refresh                 # fetch/revalidate from the API
+    python3 pricing.py ingest <models.json>    # load a saved models-list response
+    python3 pricing.py show <model>
+"""
+
+import json
+import os
+import sys
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+
+import http_client
+
+CACHE_DIR = Path(os.getenv("USDC_OPENROUTER_CACHE_DIR", ".cache"))
+CATALOG_FILE = CACHE_DIR / "pricing.json"
+CATALOG_TTL = float(os.getenv("PRICING_TTL", str(24 * 3600)))
+
+DEFAULT_MODEL = "openai/gpt-4o-mini"
+
+# Bundled fallback, per 1M tokens (see references/pricing.md)
+MODEL_PRICING = {
+    "openai/gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "openai/gpt-4o": {"input": 2.50, "output": 10.00},
+    "openai/gpt-5": {"input": 120.00, "output": 120.00},
+    "anthropic/claude-3.5-sonnet": {"input": 3.00, "output": 15.00},
+    "anthropic/claude-3-haiku": {"input": 0.25, "output": 1.25},
+    "anthropic/claude-3-opus": {"input": 15.00, "output": 75.00},
+    "google/gemini-flash-1.5": {"input": 0.075, "output": 0.30},
+    "meta-llama/llama-3.1-8b-instruct": {"input": 0.02, "output": 0.02},
+}
+
+# Cached-input price as a fraction of the input price, for models without a catalog cache price
+CACHE_READ_RATIO = [
+    ("anthropic/", 0.1),
+    ("openai/", 0.5),
+    ("google/", 0.25),
+]
+
+_FIELDS = ("input", "output", "request", "image", "cache_read")
+PICO_PER_USD = 10 ** 12
+# Fields priced per 1M tokens; the rest are per call / per image
+_PER_TOKEN = ("input", "output", "cache_read")
+_catalog = None
+_exact = {}  # model -> (catalog the prices came from, integer prices)
+_warned = set()
+
+def parse_models(models_json: dict) -> dict:
+    """Convert an OpenRouter models-list response to {model: [input, output, request, image, cache_read]}."""
+    models = {}
+    for entry in models_json.get("data", []):
+        p = entry.get("pricing") or {}
+        models[entry["id"]] = [
+            round(float(p.get("prompt") or 0) * 1_000_000, 6),
+            round(float(p.get("completion") or 0) * 1_000_000, 6),
+            float(p.get("request") or 0),
+            float(p.get("image") or 0),
+            round(float(p["input_cache_read"]) * 1_000_000, 6) if p.get("input_cache_read") else None,
+        ]
+    return models
+
+def _read_cache() -> dict:
+    try:
+        return json.loads(CATALOG_FILE.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_cache(cache: dict):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = CATALOG_FILE.with_name(f".{CATALOG_FILE.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(cache, separators=(",", ":")))
+    os.replace(tmp, CATALOG_FILE)
+
+def ingest(models_json: dict, etag: str = None) -> dict:
+    """Store a models-list response as the catalog cache."""
+    global _catalog
+    cache = {"fetched_at": time.time(), "etag": etag, "models": parse_models(models_json)}
+    _write_cache(cache)
+    _catalog = cache["models"]
+    return cache
+
+def refresh(api_key: str = None) -> str:
+    """
+    Revalidate the catalog against the API. Returns "updated", "not-modified",
+    or raises on network/HTTP errors.
+    """
+    global _catalog
+    cache = _read_cache()
+    headers = {"If-None-Match": cache["etag"]} if cache and cache.get("etag") else {}
+    response = http_client.request("GET", "models", api_key=api_key, headers=headers)
+    if response.status_code == 304 and cache:
+        cache["fetched_at"] = time.time()
+        _write_cache(cache)
+        _catalog = cache["models"]
+        return "not-modified"
+    response.raise_for_status()
+    ingest(response.json(), response.headers.get("ETag"))
+    return "updated"
+
+def load_catalog() -> dict:
+    """Return {model: [input, output, request, image, cache_read]} from the cache, loading it once per process."""
+    global _catalog
+    if _catalog is not None:
+        return _catalog
+    cache = _read_cache()
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if api_key and (cache is None or time.time() - cache["fetched_at"] > CATALOG_TTL):
+        try:
+            refresh(api_key)
+            return _catalog
+        except Exception:
+            # Offline or API error: keep whatever we have
+            pass
+    _catalog = cache["models"] if cache else {}
+    return _catalog
+
+def _with_cache_read(model: str, price: dict) -> dict:
+    if price.get("cache_read") is None:
+        ratio = next((r for prefix, r in CACHE_READ_RATIO if model.startswith(prefix)), 1.0)
+        price["cache_read"] = round(price["input"] * ratio, 6)
+    return price
+
+def get_price(model: str) -> dict:
+    """Prices for a model: catalog first, then the bundled table, then the default model."""
+    entry = load_catalog().get(model)
+    if entry is not None:
+        return _with_cache_read(model, dict(zip(_FIELDS, entry)))
+    if model in MODEL_PRICING:
+        return _with_cache_read(model, {"request": 0.0, "image": 0.0, **MODEL_PRICING[model]})
+    if model not in _warned:
+        _warned.add(model)
+        print(f"⚠️  No pricing for '{model}', billing at {DEFAULT_MODEL} rates", file=sys.stderr)
+    return _with_cache_read(DEFAULT_MODEL, {"request": 0.0, "image": 0.0, **MODEL_PRICING[DEFAULT_MODEL]})
+
+def to_pico(usd) -> int:
+    """USD (float or decimal string) to integer pico-USD, rounded half up."""
+    return int((Decimal(str(usd)) * PICO_PER_USD).to_integral_value(ROUND_HALF_UP))
+
+def get_price_exact(model: str) -> dict:
+    """get_price() as integers: pico-USD per token for input/output/cache_read, per call/image otherwise."""
+    catalog = load_catalog()
+    cached = _exact.get(model)
+    if cached is None or cached[0] is not catalog:
+        price = get_price(model)
+        cached = _exact[model] = (catalog, {
+            field: to_pico(price[field]) // (1_000_000 if field in _PER_TOKEN else 1) for field in _FIELDS})
+    return cached[1]
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == "refresh":
+        status = refresh(os.getenv("OPENROUTER_API_KEY"))
+        print(f"\n🔄 Pricing catalog {status}: {len(load_catalog()):,} models")
+        print(f"   Cache: {CATALOG_FILE}")
+    elif command == "ingest" and len(sys.argv) > 2:
+        cache = ingest(json.loads(Path(sys.argv[2]).read_text()))
+        print(f"\n📥 Ingested {len(cache['models']):,} models into {CATALOG_FILE}")
+    elif command == "show" and len(sys.argv) > 2:
+        model = sys.argv[2]
+        price = get_price(model)
+        source = "catalog" if model in load_catalog() else "bundled" if model in MODEL_PRICING else "default"
+        print(f"\n🏷️  {model} ({source})")
+        print(f"   Input: ${price['input']:.4f} / 1M tokens")
+        print(f"   Output: ${price['output']:.4f} / 1M tokens")
+        print(f"   Request: ${price['request']:.6f}")
+        print(f"   Image: ${price['image']:.6f}")
+        print(f"   Cached input: ${price['cache_read']:.4f} / 1M tokens")
+    else:
+        print("Usage: python3 pricing.py refresh")
+        print("       python3 pricing.py ingest <models.json>")
+        print("       python3 pricing.py show <model>")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Cross-process rate limiter for upstream calls sharing one OPENROUTER_API_KEY.
+
+Token buckets for requests per minute and tokens per minute at three scopes
+(the API key, each model, each agent) live in one SQLite database (WAL
+mode), so every process and thread on the host draws from the same budget.
+Buckets refill continuously and hold up to one minute's worth.
+
+Waiting requests are queued with weighted fair queuing: each gets a
+virtual finish tag of start + cost / weight, where start is the later of
+the queue's virtual time and the agent's previous finish tag, and cost
+grows with its tokens. Requests are admitted in tag order per bucket: a
+request goes only once its buckets also cover every earlier-tagged request
+still queued on them, so a waiter that hasn't woken up yet can't be
+overtaken, and an agent flooding the queue only pushes back its own tags.
+A request held up by its own agent or model bucket only blocks later
+requests on that bucket.
+Waiters sleep until their buckets should have refilled instead of polling
+upstream, and a 429 from upstream pauses the key for its Retry-After.
+
+Off unless a limit is configured (an env var, or a limit stored with
+`set`); `status` and `reset` don't turn it on. Defaults come from env vars
+(RATELIMIT_KEY_RPM, RATELIMIT_KEY_TPM, RATELIMIT_MODEL_RPM,
+RATELIMIT_MODEL_TPM, RATELIMIT_AGENT_RPM, RATELIMIT_AGENT_TPM); limits and
+weights set with this script override them.
+
+Usage:
+    python3 ratelimit.py set --scope <key|model|model:<id>|agent|agent:<id>> [--rpm <n>] [--tpm <n>]
+    python3 ratelimit.py weight --agent-id <id> --weight <w>
+    python3 ratelimit.py status
+    python3 ratelimit.py reset
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Same directory as pricing.CACHE_DIR; not imported from there since http_client imports this module
+RATELIMIT_DB = Path(os.getenv("USDC_OPENROUTER_RATELIMIT_DB",
+                              Path(os.getenv("USDC_OPENROUTER_CACHE_DIR", ".cache")) / "ratelimit.db"))
+# Longest a request waits for capacity before RateLimited is raised
+MAX_WAIT = float(os.getenv("RATELIMIT_MAX_WAIT", "300"))
+# Bounds on one sleep between admission checks
+MIN_SLEEP = 0.005
+MAX_SLEEP = 1.0
+
+ENV_LIMITS = {
+    "key": (os.getenv("RATELIMIT_KEY_RPM"), os.getenv("RATELIMIT_KEY_TPM")),
+    "model": (os.getenv("RATELIMIT_MODEL_RPM"), os.getenv("RATELIMIT_MODEL_TPM")),
+    "agent": (os.getenv("RATELIMIT_AGENT_RPM"), os.getenv("RATELIMIT_AGENT_TPM")),
+}
+
+class RateLimited(Exception):
+    """No capacity within the wait limit."""
+
+def enabled() -> bool:
+    """True once any limit is configured: env vars, or a non-empty limit stored by `set`."""
+    if any(v for pair in ENV_LIMITS.values() for v in pair):
+        return True
+    return RATELIMIT_DB.exists() and get_limiter().has_limits()
+
+def key_id() -> str:
+    """Short, non-reversible id for the configured API key."""
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12] if api_key else "demo"
+
+def _cost(tokens: int) -> float:
+    """WFQ cost of a request: one unit plus one per thousand tokens."""
+    return 1.0 + tokens / 1000
+
+class Ticket:
+    """An admitted request; pass to settle() once actual token usage is known."""
+    __slots__ = ("buckets", "tokens")
+
+    def __init__(self, buckets: list, tokens: int):
+        self.buckets = buckets  # tpm bucket names charged with tokens
+        self.tokens = tokens
+
+NO_LIMIT = Ticket([], 0)
+
+class Limiter:
+    def __init__(self, path: Path = RATELIMIT_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS limits (
+                scope TEXT PRIMARY KEY,
+                rpm REAL,
+                tpm REAL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS weights (
+                agent_id TEXT PRIMARY KEY,
+                weight REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS flows (
+                agent_id TEXT PRIMARY KEY,
+                finish REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS queue (
+                id INTEGER PRIMARY KEY,
+                agent_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                start REAL NOT NULL,
+                finish REAL NOT NULL,
+                pid INTEGER NOT NULL,
+                enqueued REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS queue_finish ON queue (finish);
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL
+            ) WITHOUT ROWID;
+        """)
+
+    def _transaction(self):
+        store = self
+
+        class _Tx:
+            def __enter__(self):
+                store.db.execute("BEGIN IMMEDIATE")
+                return store.db
+
+            def __exit__(self, exc_type, exc, tb):
+                store.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return _Tx()
+
+    def _meta(self, name: str, default: float = 0.0) -> float:
+        row = self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, name: str, value: float):
+        self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def set_limit(self, scope: str, rpm: float = None, tpm: float = None):
+        self.db.execute("INSERT OR REPLACE INTO limits (scope, rpm, tpm) VALUES (?, ?, ?)", (scope, rpm, tpm))
+
+    def set_weight(self, agent_id: str, weight: float):
+        self.db.execute("INSERT OR REPLACE INTO weights (agent_id, weight) VALUES (?, ?)", (agent_id, weight))
+
+    def has_limits(self) -> bool:
+        return self.db.execute("SELECT 1 FROM limits WHERE rpm IS NOT NULL OR tpm IS NOT NULL "
+                               "LIMIT 1").fetchone() is not None
+
+    def _limits(self) -> dict:
+        limits = {scope: tuple(float(v) if v else None for v in pair) for scope, pair in ENV_LIMITS.items()}
+        for scope, rpm, tpm in self.db.execute("SELECT scope, rpm, tpm FROM limits"):
+            limits[scope] = (rpm, tpm)
+        return limits
+
+    def _needs(self, limits: dict, agent_id: str, model: str, tokens: int) -> dict:
+        """{bucket name: (amount, capacity per minute)} for one request."""
+        needs = {}
+        for scope, name in (("key", f"key:{key_id()}"), ("model", f"model:{model}"), ("agent", f"agent:{agent_id}")):
+            specific = name if scope != "key" else "key"
+            rpm, tpm = limits.get(specific) or limits.get(scope) or (None, None)
+            if rpm:
+                needs[f"{name}:rpm"] = (1, rpm)
+            if tpm:
+                needs[f"{name}:tpm"] = (tokens, tpm)
+        return needs
+
+    def _level(self, levels: dict, name: str, capacity: float, now: float) -> float:
+        if name not in levels:
+            row = self.db.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            level, updated = row if row else (capacity, now)
+            levels[name] = min(capacity, level + (now - updated) * capacity / 60)
+        return levels[name]
+
+    def _enqueue(self, agent_id: str, model: str, tokens: int) -> int:
+        with self._transaction() as db:
+            row = db.execute("SELECT weight FROM weights WHERE agent_id = ?", (agent_id,)).fetchone()
+            weight = row[0] if row else 1.0
+            row = db.execute("SELECT finish FROM flows WHERE agent_id = ?", (agent_id,)).fetchone()
+            start = max(self._meta("vtime"), row[0] if row else 0.0)
+            finish = start + _cost(tokens) / weight
+            db.execute("INSERT OR REPLACE INTO flows (agent_id, finish) VALUES (?, ?)", (agent_id, finish))
+            return db.execute("INSERT INTO queue (agent_id, model, tokens, start, finish, pid, enqueued) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (agent_id, model, tokens, start, finish, os.getpid(), time.time())).lastrowid
+
+    def _try_admit(self, ticket_id: int) -> tuple:
+        """(Ticket, 0) if the request was admitted, else (None, seconds to sleep)."""
+        now = time.time()
+        with self._transaction() as db:
+            limits = self._limits()
+            levels = {}
+            demand = {}  # bucket -> amount wanted by earlier-tagged requests still queued
+            paused = self._meta(f"paused:{key_id()}") - now
+            for qid, agent_id, model, tokens, start, pid in db.execute(
+                    "SELECT id, agent_id, model, tokens, start, pid FROM queue ORDER BY finish, id").fetchall():
+                if pid != os.getpid() and not _alive(pid):
+                    db.execute("DELETE FROM queue WHERE id = ?", (qid,))
+                    continue
+                needs = self._needs(limits, agent_id, model, tokens)
+                short = {}
+                for name, (amount, capacity) in needs.items():
+                    level = self._level(levels, name, capacity, now)
+                    ahead = demand.get(name, 0)
+                    wanted = ahead + amount
+                    # An oversize request goes once its bucket is full rather than never
+                    if (ahead and level < wanted) or (not ahead and level < amount and level < capacity):
+                        short[name] = (wanted - level) / (capacity / 60)
+                if qid != ticket_id:
+                    # Admissible or not, it is ahead: its share of each bucket is spoken for
+                    for name, (amount, _) in needs.items():
+                        demand[name] = demand.get(name, 0) + amount
+                    continue
+                if short or paused > 0:
+                    return None, min(MAX_SLEEP, max(MIN_SLEEP, paused, *short.values()))
+                for name, (amount, capacity) in needs.items():
+                    db.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                               (name, levels[name] - amount, now))
+                db.execute("DELETE FROM queue WHERE id = ?", (qid,))
+                self._set_meta("vtime", max(self._meta("vtime"), start))
+                return Ticket([name for name in needs if name.endswith(":tpm")], tokens), 0
+        raise RateLimited("request left the queue")
+
+    def acquire(self, agent_id: str, model: str, tokens: int, max_wait: float = MAX_WAIT) -> Ticket:
+        """Wait (asleep) for this request's turn and capacity, then charge its buckets."""
+        ticket_id = self._enqueue(agent_id, model, tokens)
+        deadline = time.monotonic() + max_wait
+        try:
+            while True:
+                ticket, delay = self._try_admit(ticket_id)
+                if ticket:
+                    return ticket
+                if time.monotonic() + delay > deadline:
+                    raise RateLimited(f"no capacity for {model} within {max_wait:g}s")
+                time.sleep(delay)
+        except BaseException:
+            self.db.execute("DELETE FROM queue WHERE id = ?", (ticket_id,))
+            raise
+
+    def settle(self, ticket: Ticket, used_tokens: int):
+        """Return the tokens a request reserved but didn't use (or charge the overrun)."""
+        refund = ticket.tokens - used_tokens
+        if not ticket.buckets or not refund:
+            return
+        with self._transaction() as db:
+            limits = self._limits()
+            for name in ticket.buckets:
+                scope = name.split(":", 1)[0]
+                specific = name.rsplit(":", 1)[0] if scope != "key" else "key"
+                capacity = (limits.get(specific) or limits.get(scope) or (None, None))[1]
+                if capacity:
+                    db.execute("UPDATE buckets SET level = MIN(?, level + ?) WHERE name = ?",
+                               (capacity, refund, name))
+
+    def pause(self, seconds: float):
+        """Hold every request on this API key for seconds (after an upstream 429)."""
+        with self._transaction():
+            name = f"paused:{key_id()}"
+            self._set_meta(name, max(self._meta(name), time.time() + seconds))
+
+    def status(self) -> dict:
+        now = time.time()
+        limits = self._limits()
+        buckets = {}
+        for name, level, updated in self.db.execute("SELECT name, level, updated FROM buckets ORDER BY name"):
+            scope, rest = name.split(":", 1)
+            specific = rest.rsplit(":", 1)[0]
+            kind = name.rsplit(":", 1)[1]
+            pair = limits.get("key" if scope == "key" else f"{scope}:{specific}") or limits.get(scope) or (None, None)
+            capacity = pair[0] if kind == "rpm" else pair[1]
+            if capacity:
+                buckets[name] = (min(capacity, level + (now - updated) * capacity / 60), capacity)
+        queued = self.db.execute("SELECT agent_id, COUNT(*) FROM queue GROUP BY agent_id ORDER BY 2 DESC").fetchall()
+        return {"limits": limits, "buckets": buckets, "queued": queued,
+                "weights": self.db.execute("SELECT agent_id, weight FROM weights ORDER BY agent_id").fetchall()}
+
+    def reset(self):
+        with self._transaction() as db:
+            for table in ("buckets", "flows", "queue", "meta"):
+                db.execute(f"DELETE FROM {table}")
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+_local = threading.local()
+
+def get_limiter() -> Limiter:
+    """This thread's limiter (SQLite connections aren't shared across threads)."""
+    limiter = getattr(_local, "limiter", None)
+    if limiter is None:
+        limiter = _local.limiter = Limiter()
+    return limiter
+
+def acquire(agent_id: str, model: str, tokens: int, max_wait: float = MAX_WAIT) -> Ticket:
+    """Module-level acquire; a no-op when no limits are configured."""
+    if not enabled():
+        return NO_LIMIT
+    return get_limiter().acquire(agent_id, model, tokens, max_wait)
+
+def settle(ticket: Ticket, used_tokens: int):
+    if ticket.buckets:
+        get_limiter().settle(ticket, used_tokens)
+
+def pause(seconds: float):
+    if enabled():
+        get_limiter().pause(seconds)
+
+def main():
+    # Parse args
+    args = {"command": sys.argv[1] if len(sys.argv) > 1 else None, "scope": None, "rpm": None, "tpm": None,
+            "agent_id": None, "weight": None}
+    for i in range(2, len(sys.argv)):
+        if sys.argv[i] == "--scope" and i + 1 < len(sys.argv):
+            args["scope"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--rpm" and i + 1 < len(sys.argv):
+            args["rpm"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--tpm" and i + 1 < len(sys.argv):
+            args["tpm"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
+            args["agent_id"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--weight" and i + 1 < len(sys.argv):
+            args["weight"] = float(sys.argv[i + 1])
+
+    command = args["command"]
+    scope = args["scope"] or ""
+    kind, colon, target = scope.partition(":")
+    valid_scope = scope in ENV_LIMITS or (kind in ("model", "agent") and colon and target)
+    if command not in ("set", "weight", "status", "reset") \
+            or (command == "set" and not valid_scope) \
+            or (command == "weight" and (not args["agent_id"] or not args["weight"] or args["weight"] <= 0)):
+        print("Usage: python3 ratelimit.py set --scope <key|model|model:<id>|agent|agent:<id>> [--rpm <n>] [--tpm <n>]")
+        print("       python3 ratelimit.py weight --agent-id <id> --weight <w>")
+        print("       python3 ratelimit.py status")
+        print("       python3 ratelimit.py reset")
+        sys.exit(1)
+
+    limiter = Limiter()
+
+    if command == "set":
+        limiter.set_limit(scope, args["rpm"], args["tpm"])
+        rpm = f"{args['rpm']:g}" if args["rpm"] else "unlimited"
+        tpm = f"{args['tpm']:g}" if args["tpm"] else "unlimited"
+        print(f"\n🚦 {scope}: {rpm} requests/min, {tpm} tokens/min")
+
+    elif command == "weight":
+        limiter.set_weight(args["agent_id"], args["weight"])
+        print(f"\n⚖️  {args['agent_id']}: weight {args['weight']:g}")
+
+    elif command == "status":
+        status = limiter.status()
+        print(f"\n🚦 Limits (per minute)")
+        for scope, (rpm, tpm) in sorted(status["limits"].items()):
+            if rpm or tpm:
+                print(f"   {scope:<40} rpm={rpm or '-'} tpm={tpm or '-'}")
+        print(f"\n🪣 Buckets")
+        for name, (level, capacity) in status["buckets"].items():
+            print(f"   {name:<48} {level:>12,.0f} / {capacity:,.0f}")
+        if status["weights"]:
+            print(f"\n⚖️  Weights")
+            for agent_id, weight in status["weights"]:
+                print(f"   {agent_id:<40} {weight:g}")
+        print(f"\n⏳ Queued: {sum(n for _, n in status['queued']):,}")
+        for agent_id, n in status["queued"]:
+            print(f"   {agent_id:<40} {n:,}")
+
+    elif command == "reset":
+        limiter.reset()
+        print(f"\n🧹 Buckets and queue cleared (limits and weights kept)")
+
+if __name__ == "__main__":
+    main()
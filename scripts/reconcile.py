@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Reconcile the local credit ledger with OpenRouter's bill (GET /api/v1/credits).
+
+Both sides are integer credits (1 credit = $0.000001). Each run compares
+what OpenRouter says was spent since the last run with what the agents'
+journals recorded for the same interval:
+
+  drift = upstream usage delta - local usage delta + carried drift
+
+The local side only reads journal lines past the checkpoint's per-agent
+byte offsets, so a run costs the same however long the history is. Drift
+beyond the tolerance is booked as "adjustment" journal records, split
+across the agents that spent in the interval in proportion to their
+spend; smaller drift (each agent's sub-credit remainder, calls still in
+flight) is carried to the next run. Drift from an interval with no local spend
+can't be attributed and is carried too.
+
+The checkpoint (agents/reconcile.json) is written after the adjustments.
+Adjustments carry their run number, so a run that crashed in between is
+accounted for, not booked twice. Every run is logged to
+agents/reconcile.jsonl. The first run only records a baseline. With
+--interval, a run that fails (network, bad response) is logged and
+retried at the next interval.
+
+Usage:
+    python3 reconcile.py run [--tolerance <credits>] [--dry-run] [--interval <seconds>]
+    python3 reconcile.py status
+    python3 reconcile.py history [--limit <n>]
+"""
+
+import fcntl
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import get_credits
+import http_client
+import ledger
+
+CHECKPOINT_FILE = Path("agents/reconcile.json")
+LOG_FILE = Path("agents/reconcile.jsonl")
+# Drift up to this many credits is carried instead of booked ($0.001)
+TOLERANCE = int(os.getenv("RECONCILE_TOLERANCE", "1000"))
+
+class ReconcileError(Exception):
+    pass
+
+def load_checkpoint() -> dict:
+    try:
+        return json.loads(CHECKPOINT_FILE.read_text())
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def _reconcile_lock():
+    CHECKPOINT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(CHECKPOINT_FILE.with_name(".reconcile.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def read_local(offsets: dict, last_run: int) -> tuple:
+    """
+    Local spend journaled past offsets: (usage by agent, unaccounted
+    adjustments, new offsets). Adjustments from runs up to last_run are
+    already in the checkpoint and skipped.
+    """
+    usage = {}
+    adjustments = 0
+    new_offsets = dict(offsets)
+    for journal in sorted(Path("agents").glob("*/usage.jsonl")):
+        agent_id = journal.parent.name
+        offset = offsets.get(agent_id, 0)
+        if journal.stat().st_size <= offset:
+            continue
+        spent = 0
+        for offset, record in ledger.read_journal(agent_id, offset):
+            if "model" in record:
+                spent += record.get("cost_credits", 0)
+            elif record.get("type") == "adjustment" and record.get("run", 0) > last_run:
+                adjustments += record["cost_credits"]
+        new_offsets[agent_id] = offset
+        if spent:
+            usage[agent_id] = spent
+    return usage, adjustments, new_offsets
+
+def apportion(total: int, weights: dict) -> dict:
+    """Split an integer total across keys in proportion to positive weights, exactly (largest remainder)."""
+    weight_sum = sum(weights.values())
+    magnitude = abs(total)
+    shares = {k: magnitude * w // weight_sum for k, w in weights.items()}
+    leftover = magnitude - sum(shares.values())
+    for k in sorted(weights, key=lambda k: (-(magnitude * weights[k] % weight_sum), k))[:leftover]:
+        shares[k] += 1
+    sign = 1 if total >= 0 else -1
+    return {k: sign * v for k, v in shares.items() if v}
+
+def reconcile(tolerance: int = TOLERANCE, dry_run: bool = False) -> dict:
+    """One reconciliation pass; returns the run summary (also logged unless dry_run)."""
+    with _reconcile_lock():
+        upstream = get_credits.get_openrouter_credits()["data"]
+        if upstream.get("demo_mode"):
+            raise ReconcileError("Demo mode has no upstream bill; set OPENROUTER_API_KEY")
+        checkpoint = load_checkpoint()
+        last_run = checkpoint["run"] if checkpoint else 0
+        usage, adjustments, offsets = read_local(checkpoint["offsets"] if checkpoint else {}, last_run)
+        local_usage = sum(usage.values())
+        summary = {"run": last_run + 1, "ts": round(time.time(), 3), "upstream_usage": upstream["total_usage"],
+                   "local_usage": local_usage, "agents": len(usage), "drift": 0, "booked": {}, "carry": 0}
+
+        if checkpoint is None:
+            summary["baseline"] = True
+        else:
+            upstream_delta = upstream["total_usage"] - checkpoint["upstream_usage"]
+            summary["upstream_delta"] = upstream_delta
+            drift = upstream_delta - local_usage - adjustments + checkpoint["carry"]
+            summary["drift"] = drift
+            if abs(drift) > tolerance and usage:
+                summary["booked"] = apportion(drift, usage)
+            summary["carry"] = drift - sum(summary["booked"].values())
+
+        if not dry_run:
+            for agent_id, credits in summary["booked"].items():
+                ledger.adjust(agent_id, credits, run=summary["run"])
+            ledger.atomic_write(CHECKPOINT_FILE, json.dumps({
+                "run": summary["run"], "ts": summary["ts"], "upstream_usage": upstream["total_usage"],
+                "carry": summary["carry"], "offsets": offsets,
+                "adjusted": (checkpoint or {}).get("adjusted", 0) + sum(summary["booked"].values()),
+            }))
+            with open(LOG_FILE, "a") as f:
+                f.write(json.dumps(summary, separators=(",", ":")) + "\n")
+        return summary
+
+def _print_summary(summary: dict, dry_run: bool):
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary["ts"]))
+    label = " (dry run)" if dry_run else ""
+    if summary.get("baseline"):
+        print(f"\n📍 Run {summary['run']} {when}{label}: baseline at "
+              f"{get_credits.format_credits(summary['upstream_usage'])} upstream usage")
+        return
+    print(f"\n🧾 Run {summary['run']} {when}{label}")
+    print(f"   Upstream: {summary['upstream_delta']:+,} credits")
+    print(f"   Local:    {summary['local_usage']:+,} credits ({summary['agents']:,} agents)")
+    print(f"   Drift:    {summary['drift']:+,} credits")
+    if summary["booked"]:
+        print(f"   Booked:   {sum(summary['booked'].values()):+,} credits across {len(summary['booked']):,} agents")
+    if summary["carry"]:
+        print(f"   Carried:  {summary['carry']:+,} credits")
+
+def main():
+    # Parse args
+    args = {"command": sys.argv[1] if len(sys.argv) > 1 else None, "tolerance": TOLERANCE, "dry_run": False,
+            "interval": None, "limit": 20}
+    for i in range(2, len(sys.argv)):
+        if sys.argv[i] == "--tolerance" and i + 1 < len(sys.argv):
+            args["tolerance"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--dry-run":
+            args["dry_run"] = True
+        elif sys.argv[i] == "--interval" and i + 1 < len(sys.argv):
+            args["interval"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--limit" and i + 1 < len(sys.argv):
+            args["limit"] = int(sys.argv[i + 1])
+
+    command = args["command"]
+    if command not in ("run", "status", "history"):
+        print("Usage: python3 reconcile.py run [--tolerance <credits>] [--dry-run] [--interval <seconds>]")
+        print("       python3 reconcile.py status")
+        print("       python3 reconcile.py history [--limit <n>]")
+        sys.exit(1)
+
+    if command == "run":
+        transient = (OSError, ValueError, LookupError) + http_client.request_errors()
+        while True:
+            try:
+                _print_summary(reconcile(args["tolerance"], args["dry_run"]), args["dry_run"])
+            except ReconcileError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            except transient as e:
+                print(f"❌ Reconciliation failed: {type(e).__name__}: {e}", file=sys.stderr)
+                if args["interval"] is None:
+                    sys.exit(1)
+                print(f"   Retrying in {args['interval']:g}s", file=sys.stderr)
+            if args["interval"] is None:
+                break
+            time.sleep(args["interval"])
+
+    elif command == "status":
+        checkpoint = load_checkpoint()
+        if checkpoint is None:
+            print("\n📍 Not reconciled yet. Run: python3 scripts/reconcile.py run")
+            return
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(checkpoint["ts"]))
+        print(f"\n🧾 Last run {checkpoint['run']} at {when}")
+        print(f"   Upstream usage: {get_credits.format_credits(checkpoint['upstream_usage'])}")
+        print(f"   Carried drift: {checkpoint['carry']:+,} credits")
+        print(f"   Adjusted so far: {checkpoint['adjusted']:+,} credits")
+        print(f"   Agents tracked: {len(checkpoint['offsets']):,}")
+
+    elif command == "history":
+        try:
+            lines = LOG_FILE.read_text().splitlines()[-args["limit"]:]
+        except FileNotFoundError:
+            lines = []
+        print(f"\n📜 Reconciliation history (last {len(lines)})")
+        for line in lines:
+            s = json.loads(line)
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(s["ts"]))
+            if s.get("baseline"):
+                print(f"   {s['run']:>5}  {when}  baseline")
+                continue
+            print(f"   {s['run']:>5}  {when}  upstream={s['upstream_delta']:>+12,} local={s['local_usage']:>+12,} "
+                  f"drift={s['drift']:>+10,} booked={sum(s['booked'].values()):>+10,} carry={s['carry']:>+8,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Opt-in response cache for identical prompts.
+
+Responses are keyed by a SHA-256 of endpoint + model + messages + sampling
+params (so a mock server's responses never answer production requests) and
+kept in two tiers: an in-process LRU, and agents/{agent_id}/cache.db
+(SQLite) shared across processes. Entries expire after a TTL and the disk
+tier is trimmed to a maximum entry count, least recently used first.
+Hit/miss/saved-credit counters live alongside the entries.
+
+Usage:
+    python3 response_cache.py stats --agent-id <id>
+    python3 response_cache.py clear --agent-id <id>
+"""
+
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+
+from ledger import get_agent_dir
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_ENTRIES = 10000
+MEMORY_ENTRIES = 256
+
+def cache_key(model: str, messages: list, params: dict = None, endpoint: str = None) -> str:
+    """Content address for a request: identical requests to the same endpoint hash to the same key."""
+    payload = json.dumps({"endpoint": endpoint, "model": model, "messages": messages, "params": params or {}},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ResponseCache:
+    def __init__(self, agent_id: str, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.db = sqlite3.connect(get_agent_dir(agent_id) / "cache.db", timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, created REAL NOT NULL, last_used REAL NOT NULL, response TEXT NOT NULL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _remember(self, key: str, created: float, result: dict):
+        self.memory[key] = (created, result)
+        self.memory.move_to_end(key)
+        while len(self.memory) > MEMORY_ENTRIES:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str) -> dict:
+        """Return the cached result for key, or None on a miss or expired entry."""
+        now = time.time()
+        if key in self.memory:
+            created, result = self.memory[key]
+            if now - created < self.ttl:
+                self.memory.move_to_end(key)
+                return result
+            del self.memory[key]
+
+        row = self.db.execute("SELECT created, response FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[0] >= self.ttl:
+            return None
+        self.db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+        result = json.loads(row[1])
+        self._remember(key, row[0], result)
+        return result
+
+    def put(self, key: str, result: dict):
+        """Store a result, evicting expired and least recently used entries."""
+        now = time.time()
+        self._remember(key, now, result)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                            (key, now, now, json.dumps(result)))
+            self.db.execute("DELETE FROM entries WHERE created <= ?", (now - self.ttl,))
+            self.db.execute("""DELETE FROM entries WHERE key IN (
+                SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def count(self, name: str, amount: int = 1):
+        self.db.execute("""INSERT INTO stats VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value""", (name, amount))
+
+    def record_hit(self, saved_credits: int):
+        self.count("hits")
+        self.count("saved_credits", saved_credits)
+
+    def record_miss(self):
+        self.count("misses")
+
+    def stats(self) -> dict:
+        stats = {"hits": 0, "misses": 0, "saved_credits": 0}
+        stats.update(self.db.execute("SELECT name, value FROM stats"))
+        stats["entries"] = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return stats
+
+    def clear(self):
+        self.memory.clear()
+        self.db.execute("DELETE FROM entries")
+        self.db.execute("DELETE FROM stats")
+
+def main():
+    # Parse args
+    args = {"command": sys.argv[1] if len(sys.argv) > 1 else None, "agent_id": None}
+    for i in range(2, len(sys.argv)):
+        if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
+            args["agent_id"] = sys.argv[i + 1]
+
+    if args["command"] not in ("stats", "clear") or not args["agent_id"]:
+        print("Usage: python3 response_cache.py stats --agent-id <id>")
+        print("       python3 response_cache.py clear --agent-id <id>")
+        sys.exit(1)
+
+    agent_id = args["agent_id"]
+    if not get_agent_dir(agent_id).exists():
+        print(f"❌ Agent '{agent_id}' not found. Run check_balance.py first.")
+        sys.exit(1)
+
+    cache = ResponseCache(agent_id)
+    if args["command"] == "clear":
+        cache.clear()
+        print(f"\n🧹 Cleared response cache for {agent_id}")
+        return
+
+    stats = cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    print(f"\n♻️  Response cache for {agent_id}")
+    print(f"   Entries: {stats['entries']:,}")
+    print(f"   Hits: {stats['hits']:,}  Misses: {stats['misses']:,}"
+          + (f"  ({stats['hits'] / lookups:.0%} hit rate)" if lookups else ""))
+    print(f"   Saved: {stats['saved_credits']:,} credits")
+
+if __name__ == "__main__":
+    main()
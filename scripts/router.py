@@ -0,0 +1,173 @@
+"""
+Cost-aware model routing.
+
+Picks the cheapest model whose estimated cost fits a per-request credit
+budget and whose observed latency fits a latency budget, optionally limited
+to one quality tier from references/pricing.md. Per-model latency and output
+throughput are learned from completed calls (exponentially weighted) and
+kept in .cache/model_stats.json; failures push a model down the ranking.
+Recent time-to-first-token samples are kept too, for hedging thresholds.
+
+Usage:
+    python3 router.py stats
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from ledger import atomic_write
+from pricing import CACHE_DIR
+
+TIERS = {
+    "cheap": ["meta-llama/llama-3.1-8b-instruct", "google/gemini-flash-1.5",
+              "openai/gpt-4o-mini", "anthropic/claude-3-haiku"],
+    "mid": ["openai/gpt-4o", "anthropic/claude-3.5-sonnet"],
+    "premium": ["anthropic/claude-3-opus", "openai/gpt-5"],
+}
+
+STATS_FILE = CACHE_DIR / "model_stats.json"
+EWMA_ALPHA = 0.2
+# Models failing more often than this (recent-weighted) are tried last
+MAX_ERROR_RATE = 0.5
+# Time-to-first-token samples kept per model, and how many a percentile needs
+TTFB_SAMPLES = 64
+MIN_TTFB_SAMPLES = 8
+# Buffered observations are written to STATS_FILE at most this often
+FLUSH_INTERVAL = float(os.getenv("ROUTER_FLUSH_INTERVAL", "1.0"))
+
+_pending = []
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+def tier_of(model: str) -> str:
+    for tier, models in TIERS.items():
+        if model in models:
+            return tier
+    return None
+
+@contextmanager
+def _stats_lock():
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd = os.open(CACHE_DIR / ".model_stats.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+def load_stats() -> dict:
+    try:
+        return json.loads(STATS_FILE.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _fold(s: dict, latency: float, completion_tokens: int, ok: bool, ts: float, ttfb: float = None):
+    s["calls"] += 1
+    if ok and ttfb is not None:
+        s["ttfb"] = (s.get("ttfb") or [])[-(TTFB_SAMPLES - 1):] + [round(ttfb, 4)]
+    s["error_rate"] = (1 - EWMA_ALPHA) * s["error_rate"] + EWMA_ALPHA * (0.0 if ok else 1.0)
+    if ok and latency is not None:
+        s["latency"] = latency if s["latency"] is None else (1 - EWMA_ALPHA) * s["latency"] + EWMA_ALPHA * latency
+        if completion_tokens and latency > 0:
+            tps = completion_tokens / latency
+            s["tps"] = tps if s["tps"] is None else (1 - EWMA_ALPHA) * s["tps"] + EWMA_ALPHA * tps
+    elif not ok:
+        s["errors"] += 1
+    s["updated_at"] = round(ts, 3)
+
+def flush():
+    """Fold this process's buffered observations into the shared stats file."""
+    global _last_flush
+    with _pending_lock:
+        pending = list(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    with _stats_lock():
+        stats = load_stats()
+        for model, latency, completion_tokens, ok, ts, ttfb in pending:
+            s = stats.setdefault(model, {"calls": 0, "errors": 0, "latency": None, "tps": None, "error_rate": 0.0})
+            _fold(s, latency, completion_tokens, ok, ts, ttfb)
+        atomic_write(STATS_FILE, json.dumps(stats, indent=2))
+
+def record(model: str, latency: float = None, completion_tokens: int = 0, ok: bool = True, ttfb: float = None):
+    """
+    Record one call's outcome (ttfb: seconds to the first streamed token).
+    Observations are buffered and written at most every FLUSH_INTERVAL
+    seconds (and at exit), so the per-call cost is an append to a list
+    rather than a locked rewrite of the stats file.
+    """
+    with _pending_lock:
+        _pending.append((model, latency, completion_tokens, ok, time.time(), ttfb))
+        due = time.monotonic() - _last_flush >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+atexit.register(flush)
+
+def ttfb_percentile(model: str, percentile: float) -> float:
+    """The percentile (0-100) of recent time-to-first-token for model, or None with too few samples."""
+    flush()
+    samples = sorted((load_stats().get(model) or {}).get("ttfb") or [])
+    if len(samples) < MIN_TTFB_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+def route(estimate_cost, budget: int = None, max_latency: float = None, tier: str = None) -> list:
+    """
+    Rank candidate models for a request, cheapest first.
+
+    estimate_cost(model) returns the request's maximum cost in credits.
+    Returns [{"model", "tier", "estimated_credits", "latency"}, ...]; models
+    over the budget or with observed latency over max_latency are excluded.
+    """
+    flush()
+    stats = load_stats()
+    tiers = [tier] if tier else list(TIERS)
+    candidates = []
+    for t in tiers:
+        for model in TIERS[t]:
+            estimate = estimate_cost(model)
+            if budget is not None and estimate > budget:
+                continue
+            latency = (stats.get(model) or {}).get("latency")
+            if max_latency is not None and latency is not None and latency > max_latency:
+                continue
+            error_rate = (stats.get(model) or {}).get("error_rate", 0.0)
+            candidates.append({
+                "model": model,
+                "tier": t,
+                "estimated_credits": estimate,
+                "latency": latency,
+                "_rank": (error_rate > MAX_ERROR_RATE, estimate, latency or 0.0),
+            })
+    candidates.sort(key=lambda c: c.pop("_rank"))
+    return candidates
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "stats":
+        print("Usage: python3 router.py stats")
+        sys.exit(1)
+
+    stats = load_stats()
+    print(f"\n🧭 Observed model stats ({STATS_FILE})")
+    if not stats:
+        print("   No calls recorded yet")
+    for model, s in sorted(stats.items()):
+        latency = f"{s['latency']:.2f}s" if s["latency"] is not None else "-"
+        tps = f"{s['tps']:.0f} tok/s" if s["tps"] is not None else "-"
+        ttfb = sorted(s.get("ttfb") or [])
+        p95 = f"{ttfb[min(len(ttfb) - 1, int(len(ttfb) * 0.95))]:.2f}s" if ttfb else "-"
+        print(f"   {model:<36} {tier_of(model) or '-':<8} latency={latency:<8} {tps:<12} ttfb_p95={p95:<8} "
+              f"calls={s['calls']:,} errors={s['errors']:,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Multi-turn conversation sessions for agents/{agent_id}/sessions/{name}.jsonl.
+
+A session file is compact JSON lines: a header with the system prompt, an
+optional summary of trimmed turns, then one line per turn. Each call sends
+the history as chat messages instead of pasting it into one prompt, which
+keeps the prefix (system prompt + earlier turns) byte-identical from turn to
+turn so providers can serve it from their prompt cache:
+
+- anthropic/ and google/ models get explicit cache_control breakpoints on
+  the system prompt and on the last history message.
+- OpenAI and most others cache long repeated prefixes automatically, and
+  get the messages without breakpoints when they serve a fallback or hedge
+  (messages_for_model).
+
+Cached input tokens are reported in usage.prompt_tokens_details and billed at
+the model's cache_read rate (see pricing.py).
+
+Once the history passes the token window, the oldest turns are dropped
+until it is back to half the window, so trimming happens rarely and the
+cached prefix stays stable between trims. Dropped turns can be folded into
+a running summary by a summarizer (openrouter_call.py --summarize makes
+that a normal billed call).
+
+Usage:
+    python3 sessions.py list --agent-id <id>
+    python3 sessions.py show --agent-id <id> --session <name>
+    python3 sessions.py delete --agent-id <id> --session <name>
+"""
+
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import ledger
+import tokens
+
+# Providers that only cache at explicit cache_control breakpoints
+CACHE_CONTROL_PREFIXES = ("anthropic/", "google/")
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+def sessions_dir(agent_id: str) -> Path:
+    return ledger.get_agent_dir(agent_id) / "sessions"
+
+def session_file(agent_id: str, name: str) -> Path:
+    if not _NAME_RE.match(name) or name.startswith("."):
+        raise ValueError(f"Invalid session name '{name}' (use letters, digits, '.', '-' and '_')")
+    return sessions_dir(agent_id) / f"{name}.jsonl"
+
+def list_sessions(agent_id: str) -> list:
+    return sorted(p.stem for p in sessions_dir(agent_id).glob("*.jsonl"))
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+def _cached(text: str) -> list:
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+def _has_breakpoint(message: dict) -> bool:
+    return isinstance(message["content"], list) and any("cache_control" in part for part in message["content"])
+
+def _mark_breakpoints(messages: list):
+    """Mark the system prompt and the last history message as cache breakpoints (plain text only)."""
+    if messages and messages[0]["role"] == "system" and isinstance(messages[0]["content"], str):
+        messages[0] = {"role": "system", "content": _cached(messages[0]["content"])}
+    if messages and messages[-1]["role"] == "assistant" and isinstance(messages[-1]["content"], str):
+        messages[-1] = {"role": "assistant", "content": _cached(messages[-1]["content"])}
+
+def messages_for_model(messages: list, model: str) -> list:
+    """
+    Session messages adapted to the model they are sent to. Breakpoints are
+    placed for the first candidate; a fallback or hedge model from another
+    provider gets them moved back to plain text (or re-placed, for another
+    cache_control provider). Messages without breakpoints are unchanged.
+    """
+    if not messages or not any(_has_breakpoint(m) for m in messages):
+        return messages
+    adapted = []
+    for message in messages:
+        if _has_breakpoint(message):
+            parts = [{k: v for k, v in part.items() if k != "cache_control"} for part in message["content"]]
+            message = dict(message, content=parts[0]["text"] if len(parts) == 1 and parts[0].get("type") == "text"
+                           else parts)
+        adapted.append(message)
+    if model.startswith(CACHE_CONTROL_PREFIXES):
+        history = adapted[:-1] if adapted[-1]["role"] == "user" else adapted
+        _mark_breakpoints(history)
+        adapted[:len(history)] = history
+    return adapted
+
+class Session:
+    def __init__(self, agent_id: str, name: str, system: str = None, reset: bool = False):
+        """
+        Open the session, creating it on first use. A system prompt that
+        differs from the session's raises ValueError unless reset is set,
+        which starts the conversation over.
+        """
+        if not ledger.get_agent_dir(agent_id).exists():
+            raise ledger.AgentNotFound(agent_id)
+        self.agent_id = agent_id
+        self.name = name
+        self.path = session_file(agent_id, name)
+        self.system = None
+        self.summary = None
+        self.turns = []
+        self.created = None
+        try:
+            lines = self.path.read_text().splitlines()
+        except FileNotFoundError:
+            lines = []
+        for line in lines:
+            if not line:
+                continue
+            record = json.loads(line)
+            if record["type"] == "session":
+                self.system = record.get("system")
+                self.created = record.get("created")
+            elif record["type"] == "summary":
+                self.summary = record["text"]
+            elif record["type"] == "turn":
+                self.turns.append(record)
+        if self.created is not None and system is not None and system != self.system and not reset:
+            raise ValueError(f"Session '{name}' was started with a different system prompt; "
+                             f"pass --reset to discard its {len(self.turns)} turns and start over")
+        if self.created is None or reset:
+            # --reset alone keeps the system prompt and clears the turns
+            if system is not None:
+                self.system = system
+            self.summary = None
+            self.turns = []
+            self.created = round(time.time(), 3)
+            self._rewrite()
+
+    def _header(self) -> list:
+        records = [{"type": "session", "system": self.system, "created": self.created}]
+        if self.summary:
+            records.append({"type": "summary", "text": self.summary})
+        return records
+
+    def _rewrite(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        ledger.atomic_write(self.path, "".join(_dumps(r) for r in self._header() + self.turns))
+
+    def _system_messages(self) -> list:
+        parts = [self.system] if self.system else []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+        return [{"role": "system", "content": "\n\n".join(parts)}] if parts else []
+
+    def history(self) -> list:
+        """System prompt, summary and past turns as chat messages (no cache markers)."""
+        messages = self._system_messages()
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn["user"]})
+            messages.append({"role": "assistant", "content": turn["assistant"]})
+        return messages
+
+    def build_messages(self, prompt: str, model: str) -> list:
+        """The messages for the next turn, with cache breakpoints for providers that need them."""
+        messages = self.history()
+        if model.startswith(CACHE_CONTROL_PREFIXES):
+            _mark_breakpoints(messages)
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def history_tokens(self, model: str) -> int:
+        return tokens.count_message_tokens(self.history(), model)
+
+    def record_turn(self, prompt: str, content: str, model: str, usage: dict):
+        """Append a finished turn."""
+        turn = {"type": "turn", "ts": round(time.time(), 3), "model": model, "user": prompt, "assistant": content,
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0}
+        self.turns.append(turn)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(_dumps(turn))
+
+    def trim(self, model: str, window: int, summarizer=None) -> int:
+        """
+        If the history is over window tokens, drop the oldest turns until it
+        is at most window // 2. summarizer(previous_summary, dropped_messages)
+        returns the new summary; without one the dropped turns are discarded.
+        Returns the number of turns dropped.
+        """
+        if not self.turns or self.history_tokens(model) <= window:
+            return 0
+        budget = window // 2 - tokens.count_message_tokens(self._system_messages(), model)
+        kept = 0
+        used = 0
+        for turn in reversed(self.turns):
+            used += tokens.count_message_tokens([{"role": "user", "content": turn["user"]},
+                                                 {"role": "assistant", "content": turn["assistant"]}], model)
+            if used > budget:
+                break
+            kept += 1
+        dropped = self.turns[:len(self.turns) - kept]
+        if summarizer:
+            self.summary = summarizer(self.summary, [
+                m for turn in dropped
+                for m in ({"role": "user", "content": turn["user"]}, {"role": "assistant", "content": turn["assistant"]})])
+        self.turns = self.turns[len(dropped):]
+        self._rewrite()
+        return len(dropped)
+
+def delete_session(agent_id: str, name: str) -> bool:
+    try:
+        session_file(agent_id, name).unlink()
+        return True
+    except FileNotFoundError:
+        return False
+
+def main():
+    # Parse args
+    args = {"command": sys.argv[1] if len(sys.argv) > 1 else None, "agent_id": None, "session": None}
+    for i in range(2, len(sys.argv)):
+        if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
+            args["agent_id"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--session" and i + 1 < len(sys.argv):
+            args["session"] = sys.argv[i + 1]
+
+    command = args["command"]
+    if command not in ("list", "show", "delete") or not args["agent_id"] \
+            or (command in ("show", "delete") and not args["session"]):
+        print("Usage: python3 sessions.py list --agent-id <id>")
+        print("       python3 sessions.py show --agent-id <id> --session <name>")
+        print("       python3 sessions.py delete --agent-id <id> --session <name>")
+        sys.exit(1)
+
+    agent_id = args["agent_id"]
+    if ledger.load_balance(agent_id) is None:
+        print(f"❌ Agent '{agent_id}' not found. Run check_balance.py first.")
+        sys.exit(1)
+
+    try:
+        if command == "list":
+            names = list_sessions(agent_id)
+            print(f"\n💬 Sessions for {agent_id} ({len(names)})")
+            for name in names:
+                session = Session(agent_id, name)
+                prompt_tokens = sum(t["prompt_tokens"] for t in session.turns)
+                cached = sum(t["cached_tokens"] for t in session.turns)
+                print(f"   {name:<24} {len(session.turns):>4} turns  {prompt_tokens:>10,} input tokens"
+                      f"  {cached:>10,} cached")
+
+        elif command == "show":
+            if not session_file(agent_id, args["session"]).exists():
+                print(f"❌ Session '{args['session']}' not found for {agent_id}")
+                sys.exit(1)
+            session = Session(agent_id, args["session"])
+            print(f"\n💬 Session {session.name} ({len(session.turns)} turns)")
+            if session.system:
+                print(f"   System: {session.system}")
+            if session.summary:
+                print(f"   Summary: {session.summary}")
+            for turn in session.turns:
+                print(f"\n   [{turn['model']}] input={turn['prompt_tokens']:,} cached_in={turn['cached_tokens']:,}")
+                print(f"   > {turn['user']}")
+                print(f"   < {turn['assistant']}")
+
+        elif command == "delete":
+            if delete_session(agent_id, args["session"]):
+                print(f"\n🗑️  Deleted session {args['session']}")
+            else:
+                print(f"❌ Session '{args['session']}' not found for {agent_id}")
+                sys.exit(1)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
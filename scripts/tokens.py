@@ -0,0 +1,120 @@
+"""
+Token counting per model family.
+
+Each model maps to a tokenizer family. Encoders are loaded lazily on first
+use and cached for the life of the process, so importing this module costs
+nothing. Real vocabularies are used when available offline:
+
+  - OpenAI families via tiktoken, reading BPE files from TOKENIZER_VOCAB_DIR
+    (default scripts/vocab/) or tiktoken's own cache (TIKTOKEN_CACHE_DIR)
+  - Llama via the `tokenizers` package and {vocab_dir}/llama3.json
+
+Anything else falls back to a heuristic that counts words, numbers,
+punctuation and CJK characters separately, which tracks BPE counts far
+better than len(text) // 4 for code and non-English text.
+"""
+
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+
+VOCAB_DIR = Path(os.getenv("TOKENIZER_VOCAB_DIR", Path(__file__).parent / "vocab"))
+
+# Model id prefix -> tokenizer family; first match wins
+MODEL_FAMILIES = [
+    ("openai/gpt-4o", "o200k_base"),
+    ("openai/gpt-5", "o200k_base"),
+    ("openai/o", "o200k_base"),
+    ("openai/", "cl100k_base"),
+    ("meta-llama/llama-3", "llama3"),
+    ("anthropic/", "heuristic"),
+    ("google/", "heuristic"),
+]
+
+# Per-message framing tokens added by chat templates (role markers etc.)
+MESSAGE_OVERHEAD = 4
+
+_HEURISTIC_RE = re.compile(
+    r"[A-Za-z\u00c0-\u024f\u0370-\u03ff\u0400-\u04ff]+"  # Latin/Greek/Cyrillic words
+    r"|\d{1,3}"                                            # numbers split into 3-digit groups
+    r"|\s*[^\w\s]"                                        # punctuation / symbols
+    r"|\w"                                                # CJK, kana, hangul, etc: ~1 token each
+)
+
+def get_family(model: str) -> str:
+    for prefix, family in MODEL_FAMILIES:
+        if model.startswith(prefix):
+            return family
+    return "heuristic"
+
+class _HeuristicEncoder:
+    def count(self, text: str) -> int:
+        tokens = 0
+        for match in _HEURISTIC_RE.finditer(text):
+            piece = match.group()
+            # Common words are one token; rare long ones split into ~8-char pieces
+            tokens += 1 + (len(piece) - 1) // 8
+        return tokens
+
+    def count_batch(self, texts: list) -> list:
+        return [self.count(t) for t in texts]
+
+class _TiktokenEncoder:
+    def __init__(self, name: str):
+        if VOCAB_DIR.is_dir():
+            os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(VOCAB_DIR))
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(name)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode_ordinary(text))
+
+    def count_batch(self, texts: list) -> list:
+        return [len(ids) for ids in self.encoding.encode_ordinary_batch(texts)]
+
+class _HFTokenizerEncoder:
+    def __init__(self, path: Path):
+        from tokenizers import Tokenizer
+        self.tokenizer = Tokenizer.from_file(str(path))
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def count_batch(self, texts: list) -> list:
+        return [len(e.ids) for e in self.tokenizer.encode_batch(texts, add_special_tokens=False)]
+
+@lru_cache(maxsize=None)
+def get_encoder(family: str):
+    """Load (once) the encoder for a tokenizer family, falling back to the heuristic."""
+    try:
+        if family in ("o200k_base", "cl100k_base"):
+            return _TiktokenEncoder(family)
+        if family == "llama3":
+            return _HFTokenizerEncoder(VOCAB_DIR / "llama3.json")
+    except Exception:
+        # Package missing or vocabulary not available offline
+        pass
+    return _HeuristicEncoder()
+
+def count_tokens(text: str, model: str) -> int:
+    """Count tokens in text as the model's tokenizer would."""
+    if not text:
+        return 0
+    return get_encoder(get_family(model)).count(text)
+
+def count_tokens_batch(texts: list, model: str) -> list:
+    """Count tokens for many strings at once (native batch encoding where available)."""
+    return get_encoder(get_family(model)).count_batch(list(texts))
+
+def message_text(message: dict) -> str:
+    """A message's text, whether its content is a string or a list of content blocks."""
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+def count_message_tokens(messages: list, model: str) -> int:
+    """Prompt tokens for a chat message list, including per-message framing."""
+    counts = count_tokens_batch([message_text(m) for m in messages], model)
+    return sum(counts) + MESSAGE_OVERHEAD * len(messages)
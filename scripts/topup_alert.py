@@ -1,39 +1,217 @@
 #!/usr/bin/env python3
 """
 Check if agent balance is below threshold and alert.
+With --fleet, scan every agent in the fleet store at once and report
+projected runway from recent burn rate. With --watch, stay running and
+create a Coinbase charge whenever the balance drops below the threshold.
 Testnet only.
 """
 
+import csv
 import json
+import os
 import sys
-from pathlib import Path
+import time
 
-def get_agent_dir(agent_id: str) -> Path:
-    return Path(f"agents/{agent_id}")
+import buy_credits
+import charges
+import daemon_client
+import fleet
+import ledger
+
+REPORT_FIELDS = ("agent_id", "credits", "threshold", "low", "burn_per_hour", "hours_to_empty")
+# Hourly spend buckets for the fleet report are kept this long
+BURN_RETENTION_HOURS = int(os.getenv("BURN_RETENTION_HOURS", str(7 * 24)))
 
 def load_balance(agent_id: str) -> dict:
-    balance_file = get_agent_dir(agent_id) / "balance.json"
-    if not balance_file.exists():
+    try:
+        if daemon_client.enabled():
+            return daemon_client.call("balance", agent_id=agent_id)
+        return ledger.load_balance(agent_id)
+    except ledger.AgentNotFound:
         return None
-    return json.loads(balance_file.read_text())
+
+def update_burn(store: fleet.FleetStore, now: float = None) -> int:
+    """
+    Count journal spend written since the last scan into the fleet store's
+    hourly burn buckets; returns the number of journal records read. Only
+    bytes past each agent's stored offset are read and idle journals are
+    only stat()ed, so a scan costs the new activity, not the history.
+    Reservations are skipped (their settlement carries the real cost);
+    adjustments count, refunds negatively.
+    """
+    keep_from_hour = int((now or time.time()) // 3600) - BURN_RETENTION_HOURS
+    seen = store.burn_offsets()
+    spent, offsets, read = {}, {}, 0
+    for agent_id in store.agent_ids():
+        offset = seen.get(agent_id, 0)
+        try:
+            size = (ledger.get_agent_dir(agent_id) / "usage.jsonl").stat().st_size
+        except FileNotFoundError:
+            continue
+        if size <= offset:
+            if size < offset:  # the journal lost an unsynced tail in a crash
+                offsets[agent_id] = size
+            continue
+        end = offset
+        for end, record in ledger.read_journal(agent_id, offset):
+            read += 1
+            hour = int(record.get("ts", 0) // 3600)
+            if record.get("cost_credits") and record.get("type") != "reserve" and hour >= keep_from_hour:
+                spent[agent_id, hour] = spent.get((agent_id, hour), 0) + record["cost_credits"]
+        offsets[agent_id] = end
+    store.add_burn(spent, offsets, seen, keep_from_hour)
+    return read
+
+def fleet_report(store: fleet.FleetStore, default_threshold: int, window_hours: float) -> list:
+    """
+    One row per agent, low-balance agents first, then shortest projected
+    runway. Runway is credits / burn over the last window_hours, where burn
+    is the agent's journaled spend (fleet debits included); agents with no
+    recent spend have hours_to_empty None and sort last. Spend is counted in
+    whole hours, so the window starts at the top of the hour it falls in,
+    and reaches back at most BURN_RETENTION_HOURS.
+    """
+    update_burn(store)
+    from_hour = int((time.time() - window_hours * 3600) // 3600)
+    return [{
+        "agent_id": agent_id,
+        "credits": credits,
+        "threshold": threshold,
+        "low": bool(low),
+        "burn_per_hour": round(burn, 2),
+        "hours_to_empty": round(runway, 2) if runway is not None else None,
+    } for agent_id, credits, threshold, low, burn, runway in store.runway(default_threshold, from_hour,
+                                                                           window_hours)]
+
+def write_report(report: list, out, fmt: str):
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(report)
+    else:
+        json.dump(report, out, indent=2)
+        out.write("\n")
+
+def main_fleet(args: dict):
+    report = fleet_report(fleet.FleetStore(), args["threshold"], args["window"])
+    low = sum(1 for row in report if row["low"])
+    if args["output"] == "-":
+        write_report(report, sys.stdout, args["format"])
+    else:
+        with open(args["output"], "w", newline="") as out:
+            write_report(report, out, args["format"])
+        print(f"\n🔔 Fleet scan: {len(report):,} agents, {low:,} below threshold")
+        print(f"   Report: {args['output']}")
+    if low:
+        sys.exit(2)  # Return error code for automation
+
+def request_topup(agent_id: str, amount: float, wallet_address: str, idempotency_key: str = None) -> dict:
+    """
+    Open a charge unless one is pending or was already opened under the
+    idempotency key; returns the new charge record, or None.
+    """
+    if charges.in_flight(agent_id):
+        return None
+    record, created = buy_credits.buy_credits(agent_id, amount, wallet_address, idempotency_key)
+    return record if created else None
+
+def watch(agent_id: str, threshold: int, resume_above: int, amount: float, debounce: float):
+    """
+    Top up automatically on balance changes. Bursts of changes are
+    coalesced (debounce seconds of quiet, capped at 10x that), one charge is
+    created per drop below threshold, and the watcher re-arms only once
+    credits recover to resume_above or no charge is pending any more (it
+    expired, or was paid and swept into the ledger). Each drop opens its
+    charge under its own idempotency key.
+    """
+    feed = ledger.ChangeFeed(agent_id)
+    armed = True
+    episode = None
+    changed = True
+    print(f"\n👀 Watching {agent_id}: top up ${amount:.2f} below {threshold:,} credits, "
+          f"re-arm at {resume_above:,}")
+    try:
+        while True:
+            if changed:
+                settle_by = time.monotonic() + debounce * 10
+                while time.monotonic() < settle_by and feed.wait(debounce):
+                    pass
+                balance = load_balance(agent_id)
+                if balance is None:
+                    print(f"❌ Agent '{agent_id}' not found")
+                    sys.exit(1)
+                credits = balance["credits"]
+                if not armed:
+                    if credits >= resume_above or not charges.in_flight(agent_id):
+                        armed = True
+                        episode = None
+                        print(f"🔁 Re-armed at {credits:,} credits")
+                if armed and credits < threshold:
+                    episode = episode or f"watch-{agent_id}-{os.urandom(8).hex()}"
+                    charge = request_topup(agent_id, amount, balance["wallet_address"], episode)
+                    armed = False
+                    if charge:
+                        print(f"⚠️  {credits:,} credits < {threshold:,}: created charge {charge['id']} "
+                              f"(expires {charge['expires_at']})")
+                    else:
+                        print(f"⏳ {credits:,} credits < {threshold:,}: charge already in flight")
+            # Wake periodically so an expired charge re-arms without new activity
+            changed = feed.wait(60) or not armed
+    except KeyboardInterrupt:
+        pass
+    finally:
+        feed.close()
 
 def main():
     # Parse args
-    args = {"agent_id": None, "threshold": 100000}
+    args = {"agent_id": None, "threshold": 100000, "fleet": False, "window": 24.0, "format": "json", "output": "-",
+            "watch": False, "resume_above": None, "amount": 5.0, "debounce": 2.0}
     for i in range(1, len(sys.argv)):
         if sys.argv[i] == "--agent-id" and i + 1 < len(sys.argv):
             args["agent_id"] = sys.argv[i + 1]
         elif sys.argv[i] == "--threshold" and i + 1 < len(sys.argv):
             args["threshold"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--fleet":
+            args["fleet"] = True
+        elif sys.argv[i] == "--window" and i + 1 < len(sys.argv):
+            args["window"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--format" and i + 1 < len(sys.argv):
+            args["format"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--output" and i + 1 < len(sys.argv):
+            args["output"] = sys.argv[i + 1]
+        elif sys.argv[i] == "--watch":
+            args["watch"] = True
+        elif sys.argv[i] == "--resume-above" and i + 1 < len(sys.argv):
+            args["resume_above"] = int(sys.argv[i + 1])
+        elif sys.argv[i] == "--amount" and i + 1 < len(sys.argv):
+            args["amount"] = float(sys.argv[i + 1])
+        elif sys.argv[i] == "--debounce" and i + 1 < len(sys.argv):
+            args["debounce"] = float(sys.argv[i + 1])
+    
+    if args["fleet"]:
+        main_fleet(args)
+        return
     
     if not args["agent_id"]:
         print("Usage: python3 topup_alert.py --agent-id <id> [--threshold <credits>]")
-        print("   Default threshold: 100,000 credits")
+        print("       python3 topup_alert.py --fleet [--threshold <credits>] [--window <hours>]")
+        print("              [--format json|csv] [--output <file>]")
+        print("       python3 topup_alert.py --agent-id <id> --watch [--threshold <credits>]")
+        print("              [--resume-above <credits>] [--amount <usd>] [--debounce <seconds>]")
+        print("   Default threshold: 100,000 credits (fleet agents may set their own)")
         sys.exit(1)
     
     agent_id = args["agent_id"]
     threshold = args["threshold"]
     
+    if args["watch"]:
+        if load_balance(agent_id) is None:
+            print(f"❌ Agent '{agent_id}' not found")
+            sys.exit(1)
+        watch(agent_id, threshold, args["resume_above"] or threshold * 2, args["amount"], args["debounce"])
+        return
+    
     balance = load_balance(agent_id)
     if not balance:
         print(f"❌ Agent '{agent_id}' not found")
@@ -0,0 +1,71 @@
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+SCRIPTS = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS))
+
+import fleet
+import ledger
+import ratelimit
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """
+    Run every test in an empty directory: the scripts keep agents/ and
+    .cache/ relative to the working directory. Per-process handles opened
+    in an earlier test's directory are dropped, and demo mode is the default.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("OPENROUTER_API_KEY", raising=False)
+    monkeypatch.setattr(ledger, "_journals", {})
+    monkeypatch.setattr(fleet, "_local", type(fleet._local)())
+    monkeypatch.setattr(ratelimit, "_local", type(ratelimit._local)())
+    return tmp_path
+
+@pytest.fixture
+def agent():
+    """A fresh agent holding 1,000,000 credits ($1)."""
+    ledger.create_balance("test-agent", {"agent_id": "test-agent", "credits": 1_000_000, "usdc_balance": 1.0,
+                                         "wallet_address": "0x" + "11" * 20, "network": "base-sepolia",
+                                         "demo_mode": True})
+    return "test-agent"
+
+@pytest.fixture(scope="session")
+def mock_server_url(tmp_path_factory):
+    """Base URL of scripts/mock_server.py running in a subprocess for the whole session."""
+    pytest.importorskip("requests")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, str(SCRIPTS / "mock_server.py"), "--port", str(port), "--seed", "1"],
+                            cwd=tmp_path_factory.mktemp("mock"), stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    pytest.fail("mock_server.py did not start")
+                time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.wait()
+
+@pytest.fixture
+def mock_server(mock_server_url, monkeypatch):
+    """Point the OpenRouter client and the Base Sepolia RPC at the mock server."""
+    import http_client
+    import onchain
+    monkeypatch.setenv("OPENROUTER_API_KEY", "sk-or-mock")
+    monkeypatch.setattr(http_client, "OPENROUTER_BASE_URL", f"{mock_server_url}/api/v1")
+    monkeypatch.setattr(onchain, "RPC_URL", f"{mock_server_url}/rpc")
+    return mock_server_url
@@ -0,0 +1,83 @@
+import http.client
+import json
+import os
+import stat
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import agentd
+import daemon_client
+import ledger
+
+@pytest.fixture
+def daemon(monkeypatch, tmp_path):
+    """agentd serving over TCP on a free port, with the clients pointed at it."""
+    monkeypatch.setattr(daemon_client, "TOKEN_FILE", tmp_path / "agents" / ".agentd-token")
+    monkeypatch.delenv("USDC_OPENROUTER_DAEMON_TOKEN", raising=False)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), agentd.Handler)
+    server.token = agentd.ensure_token()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setattr(daemon_client, "DAEMON", f"http://127.0.0.1:{server.server_address[1]}")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _post(server, path: str, body: bytes, headers: dict) -> tuple:
+    conn = http.client.HTTPConnection(*server.server_address, timeout=10)
+    try:
+        conn.request("POST", path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+def test_operations_round_trip(daemon):
+    assert daemon_client.call("init", agent_id="d")["credits"] == 0
+    assert daemon_client.call("fund", agent_id="d", amount=1.5)["credits"] == 1_500_000
+    result = daemon_client.call("call", agent_id="d", prompt="Hi", candidates=["openai/gpt-4o-mini"])
+    assert result["result"]["demo_mode"] and result["cost_credits"] > 0
+    assert daemon_client.call("balance", agent_id="d")["credits"] == 1_500_000 - result["cost_credits"]
+    charge = daemon_client.call("charge", agent_id="d", amount=5.0, idempotency_key="k")
+    assert charge["created"] and daemon_client.call("charge", agent_id="d", amount=5.0,
+                                                    idempotency_key="k") == dict(charge, created=False)
+
+def test_errors_come_back_as_exceptions(daemon):
+    with pytest.raises(ledger.AgentNotFound):
+        daemon_client.call("balance", agent_id="nobody")
+    ledger.create_balance("poor", {"agent_id": "poor", "credits": 1})
+    with pytest.raises(ledger.InsufficientCredits):
+        daemon_client.call("call", agent_id="poor", prompt="Hi", candidates=["openai/gpt-4o-mini"])
+
+def test_token_file_is_private(daemon):
+    assert stat.S_IMODE(os.stat(daemon_client.TOKEN_FILE).st_mode) == 0o600
+    assert agentd.ensure_token() == daemon.token
+
+def test_requests_without_the_token_are_refused(daemon):
+    body = json.dumps({"agent_id": "d"}).encode()
+    assert _post(daemon, "/init", body, {"Content-Type": "application/json"})[0] == 401
+    assert _post(daemon, "/init", body, {"Content-Type": "application/json",
+                                         "Authorization": "Bearer wrong"})[0] == 401
+    assert not ledger.get_agent_dir("d").exists()
+
+def test_form_posts_are_refused(daemon):
+    # What a cross-origin page can send without a CORS preflight
+    for content_type in ("text/plain", "application/x-www-form-urlencoded", None):
+        headers = {"Authorization": f"Bearer {daemon.token}"}
+        if content_type:
+            headers["Content-Type"] = content_type
+        assert _post(daemon, "/init", b'{"agent_id": "d"}', headers)[0] == 415
+    assert not ledger.get_agent_dir("d").exists()
+
+def test_unix_socket_is_private(monkeypatch, tmp_path):
+    path = str(tmp_path / "agentd.sock")
+    server = agentd.UnixHTTPServer(path, agentd.Handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        monkeypatch.setattr(daemon_client, "DAEMON", f"unix:{path}")
+        assert daemon_client.call("init", agent_id="u")["agent_id"] == "u"
+    finally:
+        server.shutdown()
+        server.server_close()
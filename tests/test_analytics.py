@@ -0,0 +1,65 @@
+import pytest
+
+import analytics
+import ledger
+
+HOUR = 3_600_000
+
+@pytest.fixture
+def store(monkeypatch):
+    """Two agents' calls over three hours, ingested into chunks of 4 rows."""
+    monkeypatch.setattr(analytics, "CHUNK_ROWS", 4)
+    calls = {
+        "agent-a": [(0, "openai/gpt-4o", 100, 500), (1, "openai/gpt-4o-mini", 10, None),
+                    (2, "openai/gpt-4o", 300, 700), (2, "openai/gpt-4o", 50, 100)],
+        "agent-b": [(0, "openai/gpt-4o-mini", 20, 300), (1, "openai/gpt-4o", 200, None),
+                    (1, "openai/gpt-4o-mini", 30, 900)],
+    }
+    for agent_id, rows in calls.items():
+        ledger.create_balance(agent_id, {"agent_id": agent_id, "credits": 10_000_000})
+        ledger.append_records(agent_id, [
+            ledger.usage_record(model, {"prompt_tokens": 1}, cost, ts=hour * 3600 + i, latency_ms=latency)
+            for i, (hour, model, cost, latency) in enumerate(rows)])
+    assert analytics.ingest() == 7
+    return calls
+
+def _query(**overrides) -> list:
+    query = {"group": [], "bucket": None, "metrics": ["calls", "cost_credits"], "since": None, "until": None,
+             "agent": None, "model": None}
+    query.update(overrides)
+    rows = analytics.run_query(query)
+    return sorted(rows, key=lambda r: tuple(r[g] for g in query["group"]))
+
+def test_ingest_is_incremental(store):
+    assert analytics.ingest() == 0
+    ledger.append_records("agent-a", [ledger.usage_record("openai/gpt-4o", {}, 5, ts=3 * 3600)])
+    assert analytics.ingest() == 1
+    assert analytics.store_stats()["rows"] == 8
+    assert _query() == [{"calls": 8, "cost_credits": 715}]
+
+def test_group_by_agent_and_model(store):
+    assert _query(group=["agent", "model"]) == [
+        {"agent": "agent-a", "model": "openai/gpt-4o", "calls": 3, "cost_credits": 450},
+        {"agent": "agent-a", "model": "openai/gpt-4o-mini", "calls": 1, "cost_credits": 10},
+        {"agent": "agent-b", "model": "openai/gpt-4o", "calls": 1, "cost_credits": 200},
+        {"agent": "agent-b", "model": "openai/gpt-4o-mini", "calls": 2, "cost_credits": 50},
+    ]
+
+def test_filters_and_time_range(store):
+    assert _query(model="openai/gpt-4o") == [{"calls": 4, "cost_credits": 650}]
+    assert _query(agent="agent-b", model="openai/gpt-4o-mini") == [{"calls": 2, "cost_credits": 50}]
+    assert _query(agent="nobody") == []
+    # since is inclusive, until exclusive
+    assert _query(since=1 * HOUR, until=2 * HOUR) == [{"calls": 3, "cost_credits": 240}]
+    assert _query(since=1 * HOUR, until=2 * HOUR, agent="agent-a") == [{"calls": 1, "cost_credits": 10}]
+
+def test_buckets_and_latency(store):
+    rows = _query(group=["bucket"], bucket=HOUR, metrics=["calls", "latency_ms"])
+    assert rows == [
+        {"bucket": "1970-01-01T00:00:00Z", "calls": 2, "latency_ms": 400.0},
+        {"bucket": "1970-01-01T01:00:00Z", "calls": 3, "latency_ms": 900.0},
+        {"bucket": "1970-01-01T02:00:00Z", "calls": 2, "latency_ms": 400.0},
+    ]
+    # Unknown latencies are left out of the mean, and a group with none has no mean
+    assert _query(metrics=["latency_ms"], since=1 * HOUR, until=2 * HOUR, model="openai/gpt-4o") == [
+        {"latency_ms": None}]
@@ -0,0 +1,61 @@
+import io
+import json
+import subprocess
+import sys
+
+import ledger
+import openrouter_call
+import router
+from conftest import SCRIPTS
+
+MODEL = "openai/gpt-4o-mini"
+
+def _run(agent_id: str, prompts: list, **kwargs) -> tuple:
+    out = io.StringIO()
+    summary = openrouter_call.run_batch(agent_id, iter(prompts), kwargs.pop("model", MODEL), 4, out, **kwargs)
+    return summary, [json.loads(line) for line in out.getvalue().splitlines()]
+
+def test_every_prompt_is_reserved_and_settled(agent):
+    prompts = [{"id": f"p{i}", "prompt": f"Say hello {i}"} for i in range(12)]
+    summary, results = _run(agent, prompts)
+    assert (summary["completed"], summary["failed"], summary["skipped"]) == (12, 0, 0)
+    assert sorted(r["id"] for r in results) == sorted(p["id"] for p in prompts)
+
+    records = [r for _, r in ledger.read_journal(agent)]
+    reserves = {r["reservation"] for r in records if r.get("type") == "reserve"}
+    assert len(reserves) == 12
+    assert reserves == {r["reservation"] for r in records if "model" in r}
+    assert summary["cost_credits"] == sum(r["cost_credits"] for r in results)
+    assert summary["remaining_credits"] == ledger.load_balance(agent)["credits"] \
+        == 1_000_000 - summary["cost_credits"]
+
+def test_prompts_beyond_the_balance_are_skipped():
+    estimate = openrouter_call.estimate_max_cost(MODEL, "Say hello", 256)
+    # Enough for one reservation; once the first call settles, what's left can't cover another
+    ledger.create_balance("poor", {"agent_id": "poor", "credits": estimate + 1})
+    summary, results = _run("poor", [{"prompt": "Say hello"}] * 6, max_tokens=256)
+    assert (summary["completed"], summary["skipped"]) == (1, 5)
+    skipped = [r for r in results if r.get("error") == "Skipped: insufficient credits"]
+    assert len(skipped) == summary["skipped"] and all(r["estimated_credits"] == estimate for r in skipped)
+    assert ledger.load_balance("poor")["credits"] >= 0
+
+def test_auto_routes_each_prompt(agent):
+    summary, results = _run(agent, [{"prompt": "Hi"}, {"prompt": "Hello", "model": MODEL}], model="auto",
+                            tier="cheap")
+    assert summary["completed"] == 2
+    by_prompt = {r["index"]: r["model"] for r in results}
+    assert by_prompt[0] in router.TIERS["cheap"] and by_prompt[1] == MODEL
+
+def test_auto_with_an_impossible_budget_skips(agent):
+    summary, results = _run(agent, [{"prompt": "Hi"}], model="auto", budget=0)
+    assert summary["skipped"] == 1
+    assert results[0]["error"] == "Skipped: no model fits the routing constraints"
+    assert ledger.load_balance(agent)["credits"] == 1_000_000
+
+def test_single_call_flags_are_rejected_with_batch(agent, tmp_path):
+    (tmp_path / "prompts.jsonl").write_text('{"prompt": "Hi"}\n')
+    proc = subprocess.run([sys.executable, str(SCRIPTS / "openrouter_call.py"), "--agent-id", agent,
+                           "--batch", "prompts.jsonl", "--stream", "--session", "s"],
+                          capture_output=True, text=True)
+    assert proc.returncode == 1
+    assert "--stream, --session can't be used with --batch" in proc.stdout
@@ -0,0 +1,80 @@
+import sys
+
+import pytest
+
+import buy_credits
+import charges
+import ledger
+
+WALLET = "0x" + "11" * 20
+
+def _buy(agent_id: str, amount: float = 5.0, key: str = None) -> tuple:
+    return buy_credits.buy_credits(agent_id, amount, WALLET, key)
+
+def _expire(agent_id: str, charge_id: str):
+    records = charges.load_charges(agent_id)
+    charges._find(records, charge_id)["expires_at"] = "2000-01-01T00:00:00Z"
+    charges._save(agent_id, records)
+
+def test_lifecycle_credits_once(agent):
+    record, created = _buy(agent)
+    assert created and record["state"] == "created" and not record["credited"]
+    assert charges.submit(agent, record["id"], "0xabc")["state"] == "submitted"
+    assert charges.confirm(agent, record["id"])["state"] == "confirmed"
+    assert charges.sweep(agent) == {"expired": 0, "credited": 1, "pruned": 0}
+    assert charges.sweep(agent) == {"expired": 0, "credited": 0, "pruned": 0}
+    assert ledger.load_balance(agent)["credits"] == 1_000_000 + 5_000_000
+    with pytest.raises(ValueError):
+        charges.submit(agent, record["id"])
+
+def test_sweep_after_a_crash_doesnt_credit_twice(agent):
+    record, _ = _buy(agent)
+    charges.confirm(agent, record["id"])
+    charges.sweep(agent)
+    # The queue write was lost after the ledger was credited
+    records = charges.load_charges(agent)
+    records[0]["credited"] = False
+    charges._save(agent, records)
+    assert charges.sweep(agent)["credited"] == 1
+    assert ledger.load_balance(agent)["credits"] == 6_000_000
+
+def test_unpaid_charges_expire_and_are_pruned(agent, monkeypatch):
+    record, _ = _buy(agent)
+    _expire(agent, record["id"])
+    assert charges.in_flight(agent) is None
+    assert charges.sweep(agent)["expired"] == 1
+    assert charges.load_charges(agent)[0]["state"] == "expired"
+    monkeypatch.setattr(charges, "RETENTION", -1)
+    assert charges.sweep(agent)["pruned"] == 1
+    assert charges.load_charges(agent) == []
+    # Nothing pending any more, so a new charge is created
+    assert _buy(agent)[1]
+
+def test_idempotency_key_returns_the_same_charge(agent):
+    record, created = _buy(agent, key="k1")
+    assert created and _buy(agent, key="k1") == (record, False)
+    with pytest.raises(charges.ChargeConflict):
+        _buy(agent, 50.0, key="k1")
+    assert _buy(agent, key="k2")[1]
+
+def test_pending_charge_is_only_reused_for_the_same_amount(agent):
+    record, _ = _buy(agent)
+    assert _buy(agent) == (record, False)
+    with pytest.raises(charges.ChargeConflict) as e:
+        _buy(agent, 50.0)
+    assert e.value.record["id"] == record["id"]
+    assert len(charges.load_charges(agent)) == 1
+
+def test_cli_refuses_a_conflicting_amount(agent, monkeypatch, capsys):
+    record, _ = _buy(agent)
+    monkeypatch.setattr(sys, "argv", ["buy_credits.py", "--agent-id", agent, "--amount", "50"])
+    with pytest.raises(SystemExit) as e:
+        buy_credits.main()
+    out = capsys.readouterr().out
+    assert e.value.code == 1
+    assert f"charge {record['id']} for 5.0 USDC is already pending" in out
+
+    monkeypatch.setattr(sys, "argv", ["buy_credits.py", "--agent-id", agent, "--amount", "5"])
+    buy_credits.main()
+    out = capsys.readouterr().out
+    assert "Existing charge reused" in out and "Amount: $5.00 USDC" in out
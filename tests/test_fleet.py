@@ -0,0 +1,46 @@
+import pytest
+
+import fleet
+import ledger
+
+@pytest.fixture
+def store():
+    for i in range(3):
+        ledger.create_balance(f"agent-{i}", {"agent_id": f"agent-{i}", "credits": 1_000, "usdc_balance": 0.0})
+    store = fleet.FleetStore()
+    assert fleet.migrate(store) == 3
+    return store
+
+def test_migrate_is_idempotent(store):
+    ledger.debit("agent-0", 100)
+    assert fleet.migrate(store) == 0
+    assert store.get("agent-0")["credits"] == 900
+
+def test_funding_through_the_fleet_can_be_reserved_through_the_ledger(store):
+    assert store.fund(["agent-0", "agent-1", "nobody"], 0.5) == 2
+    assert ledger.load_balance("agent-0")["credits"] == 501_000
+    assert store.get("agent-0")["usdc_balance"] == 0.5
+
+    reservation = ledger.reserve("agent-0", 400_000)
+    ledger.settle("agent-0", reservation, ledger.usage_record("m", {}, 300_000))
+    assert ledger.load_balance("agent-0")["credits"] == store.get("agent-0")["credits"] == 201_000
+
+def test_fleet_debits_reach_the_ledger(store):
+    assert store.debit({"agent-0": 300, "agent-1": 200}) == 2
+    assert [ledger.load_balance(f"agent-{i}")["credits"] for i in range(3)] == [700, 800, 1_000]
+    assert [store.get(f"agent-{i}")["credits"] for i in range(3)] == [700, 800, 1_000]
+    with pytest.raises(ledger.InsufficientCredits):
+        ledger.reserve("agent-0", 701)
+
+def test_fleet_debit_is_all_or_nothing(store):
+    with pytest.raises(ledger.InsufficientCredits) as e:
+        store.debit({"agent-0": 500, "agent-1": 500, "agent-2": 1_500})
+    assert (e.value.required, e.value.available) == (1_500, 1_000)
+    with pytest.raises(ledger.AgentNotFound):
+        store.debit({"agent-0": 500, "nobody": 1})
+    for i in range(3):
+        assert ledger.load_balance(f"agent-{i}")["credits"] == store.get(f"agent-{i}")["credits"] == 1_000
+
+def test_list_below(store):
+    store.debit({"agent-2": 600})
+    assert [a["agent_id"] for a in store.list_agents(below=500)] == ["agent-2"]
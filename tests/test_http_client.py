@@ -0,0 +1,39 @@
+import io
+import json
+
+import pytest
+
+import http_client
+
+requests = pytest.importorskip("requests")
+
+def _event_stream(body: bytes):
+    """A streamed requests response as the HTTP adapter builds it."""
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "text/event-stream"
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.raw = io.BytesIO(body)
+    return response
+
+def _chunk(content: str) -> bytes:
+    event = {"choices": [{"index": 0, "delta": {"content": content}}]}
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode()
+
+def test_iter_sse_skips_comments_and_stops_at_done():
+    body = b": OPENROUTER PROCESSING\n\n" + _chunk("Hello") + _chunk(" world") + b"data: [DONE]\n\n" + _chunk("late")
+    deltas = [e["choices"][0]["delta"]["content"] for e in http_client.iter_sse(_event_stream(body))]
+    assert deltas == ["Hello", " world"]
+
+def test_iter_sse_decodes_utf8_without_a_charset():
+    body = _chunk("Grüße, ") + _chunk("世界 ✓") + b"data: [DONE]\n\n"
+    deltas = [e["choices"][0]["delta"]["content"] for e in http_client.iter_sse(_event_stream(body))]
+    assert "".join(deltas) == "Grüße, 世界 ✓"
+
+def test_streamed_call_against_the_mock(agent, mock_server):
+    import openrouter_call
+    chunks = []
+    result = openrouter_call.run_call(agent, "Tell me a story", ["openai/gpt-4o-mini"], max_tokens=32,
+                                      on_text=chunks.append)
+    assert "".join(chunks) == result["result"]["content"]
+    assert result["result"]["usage"]["completion_tokens"] > 0 and result["cost_credits"] > 0
@@ -0,0 +1,147 @@
+import json
+import multiprocessing
+
+import pytest
+
+import ledger
+
+def test_reserve_for_unknown_agent():
+    with pytest.raises(ledger.AgentNotFound):
+        ledger.reserve("nobody", 1)
+
+def _spend(agent_id: str, calls: int, estimate: int, cost: int, results):
+    ledger._journals.clear()  # don't share the parent's journal handle
+    settled = 0
+    for _ in range(calls):
+        try:
+            reservation = ledger.reserve(agent_id, estimate)
+        except ledger.InsufficientCredits:
+            continue
+        if settled % 3 == 2:
+            ledger.release(agent_id, reservation)
+        else:
+            ledger.settle(agent_id, reservation, ledger.usage_record("m", {}, cost))
+        settled += 1
+    ledger.flush_journals()
+    results.put(settled)
+
+def test_concurrent_processes_never_overdraw(agent):
+    # 8 processes x 60 calls want 480 x 3,000 credits reserved; only 1,000,000 exist
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_spend, args=(agent, 60, 3_000, 2_500, results)) for _ in range(8)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+    records = [record for _, record in ledger.read_journal(agent)]
+    reserves = [r for r in records if r.get("type") == "reserve"]
+    settles = [r for r in records if "model" in r]
+    releases = [r for r in records if r.get("type") == "release"]
+    assert sum(results.get() for _ in procs) == len(reserves) == len(settles) + len(releases)
+    assert {r["reservation"] for r in reserves} == {r["reservation"] for r in settles + releases}
+
+    balance = ledger.load_balance(agent)
+    assert balance["credits"] == 1_000_000 - 2_500 * len(settles)
+    assert balance["credits"] >= 0
+    # Replaying the journal in order never dips below zero: reservations were refused instead
+    credits = 1_000_000
+    for record in records:
+        credits -= record.get("cost_credits", 0) - record.get("released_credits", 0)
+        assert credits >= 0
+
+def test_snapshot_syncs_the_journal_first(agent, monkeypatch):
+    monkeypatch.setattr(ledger, "COMPACT_EVERY", 3)
+    for _ in range(3):
+        ledger.debit(agent, 10)
+    # The third append wrote a snapshot, which must not outrun the batched fsync
+    assert ledger._journals[agent].unsynced == 0
+    snapshot = json.loads((ledger.get_agent_dir(agent) / "balance.json").read_text())
+    assert snapshot["journal_offset"] == ledger._journal_size(agent)
+
+def _lose_unsynced_tail(agent_id: str, keep: int):
+    """What a crash does to journal bytes that were written but never fsynced."""
+    with open(ledger.get_agent_dir(agent_id) / "usage.jsonl", "r+b") as f:
+        f.truncate(keep)
+
+def test_journal_shorter_than_the_snapshot_offset(agent):
+    ledger.debit(agent, 100)
+    ledger.debit(agent, 200)
+    ledger.compact(agent)
+    _lose_unsynced_tail(agent, ledger._journal_size(agent) // 2)
+
+    # The snapshot already includes the lost records
+    assert ledger.load_balance(agent)["credits"] == 999_700
+    ledger.debit(agent, 50)
+    ledger.debit(agent, 25)
+    assert ledger.load_balance(agent)["credits"] == 999_625
+    ledger.compact(agent)
+    assert ledger.load_balance(agent)["credits"] == 999_625
+
+def test_journal_records_everything(agent):
+    reservation = ledger.reserve(agent, 100)
+    ledger.settle(agent, reservation, ledger.usage_record("m", {}, 40))
+    ledger.adjust(agent, -15, run=1)
+    types = [record.get("type", "usage") for _, record in ledger.read_journal(agent)]
+    assert types == ["reserve", "usage", "adjustment"]
+    assert ledger.load_balance(agent)["credits"] == 1_000_000 - 40 + 15
+
+def test_compaction_folds_the_tail_into_the_snapshot(agent):
+    for cost in (10, 20, 30):
+        ledger.debit(agent, cost)
+    assert ledger.compact(agent)["credits"] == 999_940
+    snapshot = json.loads((ledger.get_agent_dir(agent) / "balance.json").read_text())
+    assert (snapshot["credits"], snapshot["journal_offset"]) == (999_940, ledger._journal_size(agent))
+    assert list(ledger.read_journal(agent, snapshot["journal_offset"])) == []
+
+def test_partial_last_line_is_left_for_the_next_reader(agent):
+    ledger.debit(agent, 10)
+    with open(ledger.get_agent_dir(agent) / "usage.jsonl", "ab") as f:
+        f.write(b'{"cost_credits": 5')
+    assert [r["cost_credits"] for _, r in ledger.read_journal(agent)] == [10]
+    assert ledger.load_balance(agent)["credits"] == 999_990
+
+def test_reserve_holds_credits_until_settled(agent):
+    reservation = ledger.reserve(agent, 5_000)
+    assert ledger.load_balance(agent)["credits"] == 995_000
+
+    ledger.settle(agent, reservation, ledger.usage_record("openai/gpt-4o-mini", {"prompt_tokens": 10}, 1_200))
+    assert ledger.load_balance(agent)["credits"] == 998_800
+
+def test_release_returns_the_reservation(agent):
+    reservation = ledger.reserve(agent, 5_000)
+    ledger.release(agent, reservation)
+    assert ledger.load_balance(agent)["credits"] == 1_000_000
+
+def test_reserve_refuses_more_than_the_balance(agent):
+    ledger.reserve(agent, 600_000)
+    with pytest.raises(ledger.InsufficientCredits) as e:
+        ledger.reserve(agent, 600_000)
+    assert (e.value.required, e.value.available) == (600_000, 400_000)
+    assert ledger.load_balance(agent)["credits"] == 400_000
+
+def test_settle_may_exceed_the_reservation(agent):
+    # The call already happened, so its cost is booked even when it overshoots the estimate
+    reservation = ledger.reserve(agent, 999_000)
+    ledger.settle(agent, reservation, ledger.usage_record("openai/gpt-4o", {}, 1_000_500))
+    assert ledger.load_balance(agent)["credits"] == -500
+
+def test_sub_credit_costs_carry_over(agent):
+    records = []
+    for _ in range(5):
+        reservation = ledger.reserve(agent, 10)
+        records.append(ledger.usage_record("meta-llama/llama-3.1-8b-instruct", {}, cost_picos=400_000))
+        ledger.settle(agent, reservation, records[-1])
+    assert [r["cost_credits"] for r in records] == [0, 0, 1, 0, 1]
+    balance = ledger.load_balance(agent)
+    assert (balance["credits"], balance["remainder_picos"]) == (999_998, 0)
+
+def test_remainder_survives_compaction(agent):
+    ledger.append_records(agent, [ledger.usage_record("m", {}, cost_picos=1_700_000)])
+    before = ledger.load_balance(agent)
+    ledger.compact(agent)
+    after = ledger.load_balance(agent)
+    assert (after["credits"], after["remainder_picos"]) == (before["credits"], before["remainder_picos"]) \
+        == (999_999, 700_000)
@@ -0,0 +1,45 @@
+import pytest
+
+import mock_server
+import onchain
+
+ADDRESSES = ["0x" + f"{i:040x}" for i in range(1, 6)] + ["0xAbCdEf0123456789aBcDeF0123456789AbCdEf01"]
+
+def test_encode_aggregate3_layout():
+    data = onchain.encode_aggregate3([(onchain.USDC_ADDRESS, False, onchain.balance_of_data(ADDRESSES[0]))])
+    raw = bytes.fromhex(data[2:])
+    assert raw[:4].hex() == onchain.AGGREGATE3
+    words = [int.from_bytes(raw[4 + i:4 + i + 32], "big") for i in range(0, len(raw) - 4, 32)]
+    # array offset, length, tuple offset, then (target, allowFailure, bytes offset, bytes length, bytes)
+    assert words[:3] == [32, 1, 32]
+    assert words[3] == int(onchain.USDC_ADDRESS, 16)
+    assert words[4:7] == [0, 96, 36]
+    assert len(raw) == 4 + 32 * 9  # 36 bytes of calldata pad to two words
+
+def test_aggregate3_round_trip_through_the_mock_contract():
+    calls = [(onchain.USDC_ADDRESS, False, onchain.balance_of_data(a)) for a in ADDRESSES]
+    # A call that reverts is reported as failed when failure is allowed
+    calls.append(("0x" + "22" * 20, True, onchain.balance_of_data(ADDRESSES[0])))
+    results = onchain.decode_aggregate3(mock_server._eth_call(onchain.MULTICALL3_ADDRESS,
+                                                              onchain.encode_aggregate3(calls)))
+    assert results[-1] == (False, b"")
+    assert [(ok, int.from_bytes(ret, "big")) for ok, ret in results[:-1]] \
+        == [(True, mock_server._usdc_balance(a)) for a in ADDRESSES]
+
+def test_aggregate3_odd_length_calldata_round_trips():
+    # Calldata that isn't a whole number of words must be padded and its length kept
+    calls = [(onchain.USDC_ADDRESS, True, "deadbeef" * n) for n in (0, 1, 9)]
+    results = onchain.decode_aggregate3(mock_server._eth_call(onchain.MULTICALL3_ADDRESS,
+                                                              onchain.encode_aggregate3(calls)))
+    assert results == [(False, b"")] * 3
+
+def test_decode_aggregate3_accepts_unprefixed_hex():
+    encoded = mock_server._eth_call(onchain.MULTICALL3_ADDRESS, onchain.encode_aggregate3(
+        [(onchain.USDC_ADDRESS, False, onchain.balance_of_data(ADDRESSES[0]))]))
+    assert onchain.decode_aggregate3(encoded) == onchain.decode_aggregate3(encoded[2:])
+
+@pytest.mark.usefixtures("mock_server")
+@pytest.mark.parametrize("multicall", [False, True])
+def test_get_balances_against_the_mock_node(multicall):
+    balances = onchain.get_balances(ADDRESSES, multicall=multicall)
+    assert balances == {a: mock_server._usdc_balance(a) / 10 ** onchain.USDC_DECIMALS for a in ADDRESSES}
@@ -0,0 +1,35 @@
+import sys
+
+import pytest
+
+import daemon_client
+import openrouter_call
+import ratelimit
+
+def _main(monkeypatch, capsys, *argv) -> str:
+    monkeypatch.setattr(sys, "argv", ["openrouter_call.py", *argv])
+    with pytest.raises(SystemExit) as e:
+        openrouter_call.main()
+    assert e.value.code == 1
+    return capsys.readouterr().out
+
+def _failing_call(error):
+    def run_call(*args, **kwargs):
+        raise error
+    return run_call
+
+def test_rate_limited_call_exits_cleanly(agent, monkeypatch, capsys):
+    monkeypatch.setattr(openrouter_call, "run_call", _failing_call(ratelimit.RateLimited("no capacity")))
+    out = _main(monkeypatch, capsys, "--agent-id", agent, "--prompt", "Hi")
+    assert "❌ Rate limited: no capacity" in out and "Nothing was billed" in out
+
+def test_failed_request_exits_cleanly(agent, monkeypatch, capsys):
+    requests = pytest.importorskip("requests")
+    monkeypatch.setattr(openrouter_call, "run_call", _failing_call(requests.ConnectionError("refused")))
+    out = _main(monkeypatch, capsys, "--agent-id", agent, "--prompt", "Hi")
+    assert "❌ OpenRouter request failed: ConnectionError: refused" in out
+
+def test_unreachable_daemon_exits_cleanly(agent, monkeypatch, capsys, tmp_path):
+    monkeypatch.setattr(daemon_client, "DAEMON", f"unix:{tmp_path / 'missing.sock'}")
+    out = _main(monkeypatch, capsys, "--agent-id", agent, "--prompt", "Hi")
+    assert "❌ agentd error: can't reach agentd" in out
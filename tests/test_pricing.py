@@ -0,0 +1,42 @@
+import openrouter_call
+import pricing
+
+MODEL = "openai/gpt-4o-mini"
+CHEAP_MODEL = "meta-llama/llama-3.1-8b-instruct"
+
+def test_exact_prices_are_integer_picos_per_token():
+    price = pricing.get_price_exact(MODEL)
+    assert all(isinstance(v, int) for v in price.values())
+    assert price["input"] == pricing.to_pico(pricing.get_price(MODEL)["input"]) // 1_000_000
+
+def test_cost_in_credits_rounds_down():
+    price = pricing.get_price_exact(MODEL)
+    usage = {"prompt_tokens": 1_001, "completion_tokens": 501}
+    picos = 1_001 * price["input"] + 501 * price["output"] + price["request"]
+    assert openrouter_call.usage_cost_picos(MODEL, usage) == picos
+    assert openrouter_call.cost_in_credits(MODEL, usage) == picos // 1_000_000
+    assert picos % 1_000_000  # a fractional credit that was dropped
+
+def test_cheap_calls_cost_zero_whole_credits_but_nonzero_picos():
+    usage = {"prompt_tokens": 3, "completion_tokens": 1}
+    assert openrouter_call.cost_in_credits(CHEAP_MODEL, usage) == 0
+    assert openrouter_call.usage_cost_picos(CHEAP_MODEL, usage) > 0
+
+def test_cached_input_billed_at_cache_rate():
+    price = pricing.get_price_exact(MODEL)
+    usage = {"prompt_tokens": 1_000, "completion_tokens": 0, "prompt_tokens_details": {"cached_tokens": 400}}
+    expected = 600 * price["input"] + 400 * price["cache_read"] + price["request"]
+    assert openrouter_call.usage_cost_picos(MODEL, usage) == expected
+
+def test_costs_are_exact_at_scale():
+    # Float dollars drift over many tokens; integer picos don't
+    price = pricing.get_price_exact(MODEL)
+    usage = {"prompt_tokens": 10 ** 9, "completion_tokens": 10 ** 9}
+    assert openrouter_call.usage_cost_picos(MODEL, usage) == 10 ** 9 * (price["input"] + price["output"]) \
+        + price["request"]
+
+def test_estimate_covers_the_actual_cost():
+    prompt = "Summarize the plot of Hamlet in two sentences."
+    estimate = openrouter_call.estimate_max_cost(MODEL, prompt, 256)
+    result = openrouter_call.make_openrouter_call(prompt, MODEL, 256)  # demo mode
+    assert openrouter_call.cost_in_credits(MODEL, result["usage"]) < estimate
@@ -0,0 +1,45 @@
+import pytest
+
+import ratelimit
+
+@pytest.fixture
+def limiter():
+    limiter = ratelimit.get_limiter()
+    limiter.set_limit("key", tpm=1_000)
+    return limiter
+
+def test_off_without_limits():
+    assert not ratelimit.enabled()
+    assert ratelimit.acquire("a", "m", 10 ** 9) is ratelimit.NO_LIMIT
+
+def test_bucket_runs_dry_and_settle_refunds(limiter):
+    assert ratelimit.enabled()
+    ticket = ratelimit.acquire("a", "m", 900)
+    with pytest.raises(ratelimit.RateLimited):
+        ratelimit.acquire("a", "m", 900, max_wait=0.1)
+    # The first request used only 100 of its 900 tokens
+    ratelimit.settle(ticket, 100)
+    ratelimit.acquire("a", "m", 800, max_wait=0)
+    assert not limiter.db.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+def test_a_flooding_agent_only_pushes_back_its_own_tags(limiter):
+    flood = [limiter._enqueue("busy", "m", 1_000) for _ in range(3)]
+    quiet = limiter._enqueue("quiet", "m", 1_000)
+    finish = dict(limiter.db.execute("SELECT id, finish FROM queue"))
+    assert finish[flood[0]] == finish[quiet] < finish[flood[1]] < finish[flood[2]]
+
+def test_weights_scale_the_tags(limiter):
+    limiter.set_weight("gold", 2.0)
+    gold = [limiter._enqueue("gold", "m", 0) for _ in range(2)]
+    plain = [limiter._enqueue("plain", "m", 0) for _ in range(2)]
+    finish = dict(limiter.db.execute("SELECT id, finish FROM queue"))
+    assert [finish[t] for t in gold] == [0.5, 1.0]
+    assert [finish[t] for t in plain] == [1.0, 2.0]
+
+def test_later_tags_cant_overtake_an_earlier_waiter(limiter):
+    first = limiter._enqueue("a", "m", 300)
+    second = limiter._enqueue("b", "m", 800)
+    # 1,000 tokens cover either request alone, but the second would eat into the first's share
+    assert limiter._try_admit(second)[0] is None
+    assert limiter._try_admit(first)[0].tokens == 300
+    assert limiter._try_admit(second)[0] is None  # 700 left until the bucket refills
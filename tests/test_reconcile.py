@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+import get_credits
+import ledger
+import openrouter_call
+import reconcile
+
+def test_apportion_is_exact_and_proportional():
+    shares = reconcile.apportion(1_000, {"a": 1, "b": 1, "c": 1})
+    assert sum(shares.values()) == 1_000
+    assert sorted(shares.values()) == [333, 333, 334]
+    assert reconcile.apportion(900, {"a": 2, "b": 1}) == {"a": 600, "b": 300}
+
+def test_apportion_largest_remainder_then_key():
+    # 10 * 1/6, 10 * 2/6, 10 * 3/6 = 1.67, 3.33, 5
+    assert reconcile.apportion(10, {"a": 1, "b": 2, "c": 3}) == {"a": 2, "b": 3, "c": 5}
+    assert reconcile.apportion(1, {"b": 1, "a": 1}) == {"a": 1}
+
+def test_apportion_negative_totals_mirror_positive():
+    weights = {"a": 7, "b": 5, "c": 1}
+    positive = reconcile.apportion(1_234, weights)
+    assert reconcile.apportion(-1_234, weights) == {k: -v for k, v in positive.items()}
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Stand-in for OpenRouter's /credits: set state["usage"] to what upstream has billed."""
+    state = {"usage": 5_000_000}
+    monkeypatch.setattr(get_credits, "get_openrouter_credits", lambda: {"data": {
+        "total_credits": 100_000_000, "total_usage": state["usage"],
+        "remaining_credits": 100_000_000 - state["usage"], "demo_mode": False}})
+    return state
+
+def _spend(agent_id: str, credits: int):
+    reservation = ledger.reserve(agent_id, credits)
+    ledger.settle(agent_id, reservation, ledger.usage_record("openai/gpt-4o", {}, credits))
+
+def _make_agent(agent_id: str):
+    ledger.create_balance(agent_id, {"agent_id": agent_id, "credits": 10_000_000})
+
+def test_first_run_is_a_baseline(upstream):
+    _make_agent("a")
+    _spend("a", 500)
+    summary = reconcile.reconcile()
+    assert summary["baseline"] and summary["booked"] == {} and summary["carry"] == 0
+    assert reconcile.load_checkpoint()["upstream_usage"] == 5_000_000
+
+def test_drift_within_tolerance_is_carried(upstream):
+    _make_agent("a")
+    reconcile.reconcile()
+    _spend("a", 10_000)
+    upstream["usage"] += 10_400
+    summary = reconcile.reconcile(tolerance=1_000)
+    assert (summary["upstream_delta"], summary["local_usage"], summary["drift"]) == (10_400, 10_000, 400)
+    assert summary["booked"] == {} and summary["carry"] == 400
+
+    # The carried drift counts towards the next run
+    _spend("a", 10_000)
+    upstream["usage"] += 10_700
+    summary = reconcile.reconcile(tolerance=1_000)
+    assert summary["drift"] == 1_100
+    assert summary["booked"] == {"a": 1_100} and summary["carry"] == 0
+    assert ledger.load_balance("a")["credits"] == 10_000_000 - 20_000 - 1_100
+
+def test_drift_is_split_by_spend_and_booked_once(upstream):
+    for agent_id in ("a", "b"):
+        _make_agent(agent_id)
+    reconcile.reconcile()
+    _spend("a", 30_000)
+    _spend("b", 10_000)
+    upstream["usage"] += 40_000 + 4_000
+    summary = reconcile.reconcile(tolerance=1_000)
+    assert summary["booked"] == {"a": 3_000, "b": 1_000}
+    assert ledger.load_balance("a")["credits"] == 10_000_000 - 33_000
+
+    # Adjustments booked by a run aren't mistaken for new drift by the next one
+    summary = reconcile.reconcile(tolerance=1_000)
+    assert (summary["local_usage"], summary["drift"], summary["booked"]) == (0, 0, {})
+
+def test_crash_after_booking_is_not_booked_twice(upstream, monkeypatch):
+    _make_agent("a")
+    reconcile.reconcile()
+    _spend("a", 10_000)
+    upstream["usage"] += 15_000
+
+    def crash(path, text):
+        raise OSError("disk full")
+    with monkeypatch.context() as m:
+        m.setattr(ledger, "atomic_write", crash)
+        with pytest.raises(OSError):
+            reconcile.reconcile(tolerance=1_000)
+
+    # The adjustment landed but the checkpoint didn't: the retry counts it as already booked
+    summary = reconcile.reconcile(tolerance=1_000)
+    assert summary["drift"] == 0 and summary["booked"] == {}
+    assert ledger.load_balance("a")["credits"] == 10_000_000 - 15_000
+
+def test_dry_run_changes_nothing(upstream):
+    _make_agent("a")
+    reconcile.reconcile()
+    checkpoint = reconcile.load_checkpoint()
+    _spend("a", 1_000)
+    upstream["usage"] += 9_000
+    summary = reconcile.reconcile(tolerance=100, dry_run=True)
+    assert summary["booked"] == {"a": 8_000}
+    assert reconcile.load_checkpoint() == checkpoint
+    assert ledger.load_balance("a")["credits"] == 10_000_000 - 1_000
+
+def test_cheap_calls_leave_no_drift_against_the_mock(mock_server):
+    _make_agent("a")
+    reconcile.reconcile()
+    for i in range(40):
+        openrouter_call.run_call("a", f"ping {i}", ["meta-llama/llama-3.1-8b-instruct"], max_tokens=64)
+    summary = reconcile.reconcile(tolerance=1_000)
+    assert summary["local_usage"] > 0
+    # Only the agent's carried sub-credit remainder (and upstream's USD rounding) may differ
+    assert abs(summary["drift"]) <= 1
+    assert summary["booked"] == {}
+    log = [json.loads(line) for line in reconcile.LOG_FILE.read_text().splitlines()]
+    assert [s["run"] for s in log] == [1, 2]
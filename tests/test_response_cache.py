@@ -0,0 +1,62 @@
+import ledger
+import openrouter_call
+import response_cache
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+def test_cache_key_covers_the_whole_request():
+    key = response_cache.cache_key("openai/gpt-4o", MESSAGES, {"max_tokens": 10, "temperature": 0})
+    assert key == response_cache.cache_key("openai/gpt-4o", MESSAGES, {"temperature": 0, "max_tokens": 10})
+    assert key != response_cache.cache_key("openai/gpt-4o-mini", MESSAGES, {"max_tokens": 10, "temperature": 0})
+    assert key != response_cache.cache_key("openai/gpt-4o", [{"role": "user", "content": "Hi!"}],
+                                           {"max_tokens": 10, "temperature": 0})
+    assert key != response_cache.cache_key("openai/gpt-4o", MESSAGES, {"max_tokens": 11, "temperature": 0})
+    assert key != response_cache.cache_key("openai/gpt-4o", MESSAGES, {"max_tokens": 10, "temperature": 0},
+                                           endpoint="http://127.0.0.1:8080/api/v1")
+
+def test_entries_expire_after_the_ttl(agent, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = response_cache.ResponseCache(agent, ttl=60)
+    cache.put("k", {"content": "hello"})
+    now[0] += 59
+    assert cache.get("k") == {"content": "hello"}
+    # Another process sees the disk tier, with the same expiry
+    assert response_cache.ResponseCache(agent, ttl=60).get("k") == {"content": "hello"}
+    now[0] += 1
+    assert cache.get("k") is None
+    assert response_cache.ResponseCache(agent, ttl=60).get("k") is None
+
+def test_disk_tier_keeps_the_most_recently_used(agent):
+    cache = response_cache.ResponseCache(agent, max_entries=2)
+    cache.put("a", {"content": "a"})
+    cache.put("b", {"content": "b"})
+    response_cache.ResponseCache(agent).get("a")
+    cache.put("c", {"content": "c"})
+    other = response_cache.ResponseCache(agent)
+    assert [other.get(k) is not None for k in "abc"] == [True, False, True]
+    assert other.stats()["entries"] == 2
+
+def test_identical_call_is_served_free_from_the_cache(agent, monkeypatch):
+    upstream = []
+
+    def make_openrouter_call(prompt, model, max_tokens=None, messages=None):
+        # Demo and mock-server responses are never cached, so stand in for a real one
+        upstream.append(max_tokens)
+        return {"content": "Hello!", "model": model, "demo_mode": False, "mock": False,
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}}
+
+    monkeypatch.setattr(openrouter_call, "make_openrouter_call", make_openrouter_call)
+    cache = response_cache.ResponseCache(agent)
+    first = openrouter_call.run_call(agent, "Say hello", ["openai/gpt-4o"], 64, cache)
+    assert not first["cache_hit"] and first["cost_credits"] > 0
+    credits = ledger.load_balance(agent)["credits"]
+    second = openrouter_call.run_call(agent, "Say hello", ["openai/gpt-4o"], 64, cache)
+    assert second["cache_hit"] and second["cost_credits"] == 0
+    assert second["result"]["content"] == "Hello!"
+    assert ledger.load_balance(agent)["credits"] == credits
+    # A different max_tokens is a different request
+    assert not openrouter_call.run_call(agent, "Say hello", ["openai/gpt-4o"], 32, cache)["cache_hit"]
+    assert upstream == [64, 32]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2) and stats["saved_credits"] == first["cost_credits"]
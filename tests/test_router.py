@@ -0,0 +1,53 @@
+import pytest
+
+import ledger
+import openrouter_call
+import router
+
+def _estimate(model: str) -> int:
+    return openrouter_call.estimate_max_cost(model, "Say hello", 256)
+
+def test_route_is_cheapest_first_within_budget():
+    route = router.route(_estimate)
+    costs = [c["estimated_credits"] for c in route]
+    assert costs == sorted(costs) and len(route) == sum(len(models) for models in router.TIERS.values())
+    budget = costs[len(costs) // 2]
+    assert all(c["estimated_credits"] <= budget for c in router.route(_estimate, budget=budget))
+    assert {c["model"] for c in router.route(_estimate, tier="mid")} == set(router.TIERS["mid"])
+
+def test_failing_and_slow_models_are_demoted_or_excluded():
+    cheapest = router.route(_estimate)[0]["model"]
+    for _ in range(5):
+        router.record(cheapest, ok=False)
+    route = router.route(_estimate)
+    assert route[-1]["model"] == cheapest
+    router.record(route[0]["model"], latency=30.0, completion_tokens=100)
+    assert route[0]["model"] not in [c["model"] for c in router.route(_estimate, max_latency=10.0)]
+
+def test_failed_candidate_falls_back_and_is_not_billed(agent, monkeypatch):
+    call = openrouter_call.make_openrouter_call
+
+    def make_openrouter_call(prompt, model, *args, **kwargs):
+        if model == "openai/gpt-4o":
+            raise ConnectionError("provider down")
+        return call(prompt, model, *args, **kwargs)
+
+    monkeypatch.setattr(openrouter_call, "make_openrouter_call", make_openrouter_call)
+    fallbacks = []
+    result = openrouter_call.run_call(agent, "Say hello", ["openai/gpt-4o", "openai/gpt-4o-mini"], 64,
+                                      on_fallback=lambda model, error: fallbacks.append((model, str(error))))
+    assert result["model"] == "openai/gpt-4o-mini"
+    assert fallbacks == [("openai/gpt-4o", "provider down")]
+    # The failed candidate's reservation was released: only the fallback is charged
+    assert ledger.load_balance(agent)["credits"] == 1_000_000 - result["cost_credits"]
+    router.flush()
+    assert router.load_stats()["openai/gpt-4o"]["errors"] == 1
+
+def test_last_candidate_failure_is_raised(agent, monkeypatch):
+    def make_openrouter_call(*args, **kwargs):
+        raise ConnectionError("provider down")
+
+    monkeypatch.setattr(openrouter_call, "make_openrouter_call", make_openrouter_call)
+    with pytest.raises(ConnectionError):
+        openrouter_call.run_call(agent, "Say hello", ["openai/gpt-4o", "openai/gpt-4o-mini"], 64)
+    assert ledger.load_balance(agent)["credits"] == 1_000_000
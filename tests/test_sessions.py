@@ -0,0 +1,78 @@
+import pytest
+
+import http_client
+import openrouter_call
+import sessions
+
+BREAKPOINT = {"cache_control": {"type": "ephemeral"}}
+
+@pytest.fixture
+def session(agent):
+    s = sessions.Session(agent, "chat", system="Be brief.")
+    s.record_turn("Hi", "Hello!", "anthropic/claude-3-haiku", {"prompt_tokens": 10})
+    return s
+
+def test_breakpoints_only_for_cache_control_providers(session):
+    marked = session.build_messages("Next?", "anthropic/claude-3-haiku")
+    assert marked[0]["content"] == [{"type": "text", "text": "Be brief.", **BREAKPOINT}]
+    assert marked[2]["content"] == [{"type": "text", "text": "Hello!", **BREAKPOINT}]
+    assert marked[-1] == {"role": "user", "content": "Next?"}
+    assert session.build_messages("Next?", "openai/gpt-4o") == session.history() + [{"role": "user", "content": "Next?"}]
+
+def test_messages_for_model_adapts_breakpoints(session):
+    marked = session.build_messages("Next?", "anthropic/claude-3-haiku")
+    assert sessions.messages_for_model(marked, "openai/gpt-4o") == session.build_messages("Next?", "openai/gpt-4o")
+    assert sessions.messages_for_model(marked, "google/gemini-flash-1.5") == marked
+    assert sessions.messages_for_model(marked, "anthropic/claude-3-opus") == marked
+    plain = session.build_messages("Next?", "openai/gpt-4o")
+    assert sessions.messages_for_model(plain, "anthropic/claude-3-haiku") is plain
+    assert sessions.messages_for_model(None, "openai/gpt-4o") is None
+
+def test_fallback_model_gets_no_breakpoints(session, monkeypatch):
+    sent = []
+
+    class Response:
+        headers = {}
+
+        def __init__(self, body):
+            self.body = body
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"choices": [{"message": {"content": "ok"}}],
+                    "usage": {"prompt_tokens": 20, "completion_tokens": 1, "total_tokens": 21}}
+
+    def request(method, path, json=None, **kwargs):
+        if path != "chat/completions":
+            raise ConnectionError("offline")
+        sent.append(json)
+        if json["model"].startswith("anthropic/"):
+            raise ConnectionError("provider down")
+        return Response(json)
+
+    monkeypatch.setenv("OPENROUTER_API_KEY", "sk-or-test")
+    monkeypatch.setattr(http_client, "request", request)
+    messages = session.build_messages("Next?", "anthropic/claude-3-haiku")
+    call = openrouter_call.run_call(session.agent_id, "Next?", ["anthropic/claude-3-haiku", "openai/gpt-4o"],
+                                    messages=messages)
+    assert call["model"] == "openai/gpt-4o"
+    assert sent[0]["messages"] == messages
+    assert sent[1]["messages"] == session.build_messages("Next?", "openai/gpt-4o")
+
+def test_system_prompt_change_needs_reset(session):
+    with pytest.raises(ValueError, match="--reset"):
+        sessions.Session(session.agent_id, "chat", system="Be verbose.")
+    reopened = sessions.Session(session.agent_id, "chat", system="Be verbose.", reset=True)
+    assert reopened.system == "Be verbose." and reopened.turns == []
+    assert sessions.Session(session.agent_id, "chat").system == "Be verbose."
+
+def test_trim_drops_oldest_turns_into_summary(session):
+    for i in range(20):
+        session.record_turn(f"Question {i} " * 20, f"Answer {i} " * 20, "openai/gpt-4o", {})
+    dropped = session.trim("openai/gpt-4o", 1_000, summarizer=lambda previous, messages: f"{len(messages)} messages")
+    assert dropped and session.summary == f"{dropped * 2} messages"
+    assert session.history_tokens("openai/gpt-4o") <= 500
+    reopened = sessions.Session(session.agent_id, "chat")
+    assert reopened.summary == session.summary and len(reopened.turns) == 21 - dropped
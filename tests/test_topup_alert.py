@@ -0,0 +1,54 @@
+import charges
+import fleet
+import ledger
+import topup_alert
+
+WALLET = "0x" + "11" * 20
+
+def test_no_second_top_up_while_a_charge_is_pending(agent):
+    charge = topup_alert.request_topup(agent, 5.0, WALLET, "episode-1")
+    assert charge["idempotency_key"] == "episode-1"
+    assert topup_alert.request_topup(agent, 5.0, WALLET, "episode-2") is None
+
+    # Paid but not yet swept into the ledger: still pending
+    charges.confirm(agent, charge["id"])
+    assert charges.in_flight(agent)["id"] == charge["id"]
+    assert topup_alert.request_topup(agent, 5.0, WALLET, "episode-2") is None
+
+    assert charges.sweep(agent)["credited"] == 1
+    assert charges.in_flight(agent) is None
+    # A retry within the same episode doesn't buy again
+    assert topup_alert.request_topup(agent, 5.0, WALLET, "episode-1") is None
+    assert topup_alert.request_topup(agent, 5.0, WALLET, "episode-2")["id"] != charge["id"]
+    assert len(charges.load_charges(agent)) == 2
+
+def _fleet(credits: list):
+    for i, c in enumerate(credits):
+        ledger.create_balance(f"agent-{i}", {"agent_id": f"agent-{i}", "credits": c})
+    store = fleet.FleetStore()
+    fleet.migrate(store)
+    return store
+
+def test_fleet_report_orders_low_agents_then_shortest_runway():
+    store = _fleet([50_000, 500_000, 400_000, 90_000])
+    ledger.debit("agent-1", 240_000)
+    store.debit({"agent-2": 24_000})
+    report = topup_alert.fleet_report(store, 100_000, 24)
+    assert [(r["agent_id"], r["low"], r["burn_per_hour"], r["hours_to_empty"]) for r in report] == [
+        ("agent-0", True, 0.0, None),
+        ("agent-3", True, 0.0, None),
+        ("agent-1", False, 10_000.0, 26.0),
+        ("agent-2", False, 1_000.0, 376.0),
+    ]
+
+def test_burn_is_read_incrementally():
+    store = _fleet([1_000_000, 1_000_000])
+    reservation = ledger.reserve("agent-0", 10_000)
+    ledger.settle("agent-0", reservation, ledger.usage_record("m", {}, 7_000))
+    assert topup_alert.update_burn(store) == 2
+    assert topup_alert.update_burn(store) == 0
+    ledger.adjust("agent-0", -2_000, run=1)
+    assert topup_alert.update_burn(store) == 1
+    report = {r["agent_id"]: r for r in topup_alert.fleet_report(store, 100_000, 1)}
+    assert report["agent-0"]["burn_per_hour"] == 5_000
+    assert report["agent-1"]["hours_to_empty"] is None